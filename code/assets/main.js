@@ -6,4 +6,8 @@ function getMergedFormsData(formIds) {
         for (const [key, value] of formData.entries()) result[key] = value;
     }
     return result;
-}
\ No newline at end of file
+}
+
+function getFormsData(selector) {
+    return Array.from(document.querySelectorAll(selector), (form) => Object.fromEntries(new FormData(form)));
+}
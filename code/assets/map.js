@@ -44,24 +44,42 @@ function addMapMarkerPopup(rawCoordinates, markerEmoji) {
     });
 }
 
-function addMapLines(rawCoordinates) {
-    const defaultColor = '#3388ff';
-    rawCoordinates.forEach(function (coord) {
-        const randomColor = getRandomColor();
+function addMapLines(features) {
+    features.forEach(function (feature) {
+        // GeoJSON positions are [longitude, latitude], Leaflet wants [latitude, longitude]
+        const coord = feature.geometry.coordinates.map(([longitude, latitude]) => [latitude, longitude]);
+        routeColors[feature.id] = routeColors[feature.id] || getRandomColor();
         const path = L.polyline.antPath(coord, {
             "delay": 600,
             "dashArray": [10, 20],
             "weight": 5,
-            "color": randomColor,
+            "color": routeColors[feature.id],
             "pulseColor": "#FFFFFF",
             "paused": false,
             "reverse": false,
             "hardwareAccelerated": true
         });
-        mymap.addLayer(path);
+        routeLayer.addLayer(path);
     });
 }
 
+let routeLayer = undefined;
+let routeRequest = 0;
+const routeColors = {};
+
+function loadMapLines() {
+    // Route geometry is fetched for the visible area and zoom, the browser revalidates it with its ETag
+    const request = ++routeRequest;
+    const params = new URLSearchParams({zoom: mymap.getZoom(), bbox: mymap.getBounds().toBBoxString()});
+    fetch(`${routesUrl}?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (request !== routeRequest) return;
+            routeLayer.clearLayers();
+            addMapLines(data.features);
+        });
+}
+
 function getRandomColor() {
     const letters = '0123456789ABCDEF';
     let color = '#';
@@ -75,8 +93,24 @@ function getRandomColor() {
 const mapContainerId = 'mapid';
 let mymap = undefined;
 
+const defaultCenterCoordinate = [48.95131393590893, 21.134053373262336];
+const defaultMapZoom = 3;
+const maxFitZoom = 10;
+
+function fitMapExtent() {
+    if (!mapExtent) {
+        mymap.setView(defaultCenterCoordinate, defaultMapZoom);
+        return;
+    }
+    // The bbox is [west, south, east, north], west > east when it crosses the antimeridian
+    const [west, south, east, north] = mapExtent.bbox;
+    const bounds = L.latLngBounds([south, west], [north, east < west ? east + 360 : east]);
+    mymap.fitBounds(bounds, {padding: [20, 20], maxZoom: maxFitZoom});
+}
+
 function initMap() {
-    mymap = L.map(mapContainerId).setView(centerCoordinate, mapZoom);
+    mymap = L.map(mapContainerId);
+    fitMapExtent();
 
     L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
         maxZoom: 19,
@@ -93,5 +127,7 @@ function setMap() {
     addMapMarkerPopup(coordinatesRawPlannedShipments, mapMaprkerIcons.plannedShipment)
     addMapMarkerPopup(coordinatesRawTransport, mapMaprkerIcons.transport)
     addMapMarkerPopup(coordinatesRawShipments, mapMaprkerIcons.shipment)
-    addMapLines(plannedLines)
+    routeLayer = L.layerGroup().addTo(mymap);
+    loadMapLines();
+    mymap.on('moveend', loadMapLines);
 }
@@ -126,3 +126,46 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, "assets")]
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Great-circle distance cache used by the optimiser, memory grows with the square of the capacity
+# (2048 locations = 16 MB). Set a path to keep it in a memory-mapped file across restarts. Only one process uses
+# the file at a time, other server processes keep their own cache in memory.
+
+DISTANCE_CACHE_CAPACITY = int(os.getenv("DISTANCE_CACHE_CAPACITY", 2_048))
+DISTANCE_CACHE_PATH = os.getenv("DISTANCE_CACHE_PATH")
+
+# Threads computing large great-circle distance matrices when the rust_extensions kernels are not built
+
+COST_MATRIX_WORKERS = int(os.getenv("COST_MATRIX_WORKERS", os.cpu_count() or 1))
+
+# Worker processes solving independent regions of the planning problem in parallel
+
+ASSIGNMENT_WORKERS = int(os.getenv("ASSIGNMENT_WORKERS", os.cpu_count() or 1))
+
+# Wall-clock seconds the anytime optimisation may take when no budget is given, the best allocation found by then
+# is applied
+
+OPTIMISATION_TIME_BUDGET_SECONDS = float(os.getenv("OPTIMISATION_TIME_BUDGET_SECONDS", 10))
+
+# Geocoding search results are cached by normalised query, in memory (entries) and in the database (rows)
+
+GEOCODING_CACHE_CAPACITY = int(os.getenv("GEOCODING_CACHE_CAPACITY", 1_024))
+GEOCODING_CACHE_MAX_ROWS = int(os.getenv("GEOCODING_CACHE_MAX_ROWS", 100_000))
+GEOCODING_CACHE_TTL_SECONDS = int(os.getenv("GEOCODING_CACHE_TTL_SECONDS", 30 * 24 * 60 * 60))
+
+# The resources page caches its planning snapshot and table fragments. CACHE_BACKEND is locmem, file or redis
+# (any Redis-compatible server), CACHE_LOCATION overrides the backend's default location.
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem")
+CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "astral-planning"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", str(BASE_DIR / ".cache")),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://127.0.0.1:6379"),
+}
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": os.getenv("CACHE_LOCATION", CACHE_BACKENDS[CACHE_BACKEND][1]),
+    }
+}
+PLANNING_CACHE_TIMEOUT = int(os.getenv("PLANNING_CACHE_TIMEOUT", 60 * 60))
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.utils import timezone
 
 
 class PlanningConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "planning"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Recovered on the first request rather than here, the database may not be migrated yet during ready()
+        self.started_at = timezone.now()
+        request_started.connect(self.fail_interrupted_jobs, dispatch_uid="planning_fail_interrupted_jobs")
+
+    def fail_interrupted_jobs(self, **kwargs):
+        from .job_service import JobService
+
+        request_started.disconnect(dispatch_uid="planning_fail_interrupted_jobs")
+        JobService().fail_interrupted(self.started_at)
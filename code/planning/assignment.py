@@ -0,0 +1,274 @@
+import time
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import (
+    connected_components,
+    maximum_bipartite_matching,
+    min_weight_full_bipartite_matching,
+)
+
+# Assignment solvers over plain arrays of feasible (row, column, cost) pairs. Nothing here touches Django, so the
+# solvers can run in worker processes.
+
+Pairs = tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def get_components(pairs: Pairs, n: int, m: int) -> list[tuple[np.ndarray, np.ndarray, Pairs]]:
+    # Connected components of the bipartite feasibility graph with at least one pair, as (rows, columns, pairs) where
+    # the pairs index into the component's rows and columns. No pair crosses components, so each can be solved alone.
+    rows, cols, costs = pairs
+    if not len(rows):
+        return []
+    graph = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, n + cols)), shape=(n + m, n + m))
+    _, labels = connected_components(graph, directed=False)
+
+    pair_labels = labels[rows]
+    order = np.argsort(pair_labels, kind="stable")
+    _, starts = np.unique(pair_labels[order], return_index=True)
+    components = []
+    for component in np.split(order, starts[1:]):
+        component_rows, local_rows = np.unique(rows[component], return_inverse=True)
+        component_cols, local_cols = np.unique(cols[component], return_inverse=True)
+        components.append((component_rows, component_cols, (local_rows, local_cols, costs[component])))
+    return components
+
+
+@dataclass
+class AssignmentResult:
+    # Matched (row, column) indices. The objective is what every solver minimises: the cost of the matched pairs
+    # plus infeasible_cost for every row left unmatched. No assignment costs less than the lower bound.
+    row_indices: np.ndarray
+    col_indices: np.ndarray
+    objective: float
+    lower_bound: float
+
+    @property
+    def gap(self) -> float:
+        # Relative distance to the optimum at most, 0 for exact results
+        return (self.objective - self.lower_bound) / self.objective if self.objective > 0 else 0.0
+
+    @classmethod
+    def merge(
+        cls,
+        results: Sequence["AssignmentResult"],
+        row_maps: Sequence[np.ndarray],
+        col_maps: Sequence[np.ndarray],
+        fixed_cost: float = 0,
+    ):
+        # Results of independent components, with their local indices mapped back through the components' rows and
+        # columns. Objectives and lower bounds add up, fixed_cost is added to both (rows outside every component).
+        return cls(
+            row_indices=np.concatenate(
+                [np.empty(0, dtype=np.intp)] + [m[r.row_indices] for r, m in zip(results, row_maps)]
+            ),
+            col_indices=np.concatenate(
+                [np.empty(0, dtype=np.intp)] + [m[r.col_indices] for r, m in zip(results, col_maps)]
+            ),
+            objective=float(fixed_cost + sum(result.objective for result in results)),
+            lower_bound=float(fixed_cost + sum(result.lower_bound for result in results)),
+        )
+
+
+def get_result(
+    row_indices: np.ndarray,
+    col_indices: np.ndarray,
+    matched_costs: np.ndarray,
+    n: int,
+    infeasible_cost: float,
+    lower_bound: float = None,
+) -> AssignmentResult:
+    objective = float(np.sum(matched_costs) + infeasible_cost * (n - len(row_indices)))
+    return AssignmentResult(
+        row_indices=row_indices,
+        col_indices=col_indices,
+        objective=objective,
+        lower_bound=objective if lower_bound is None else min(lower_bound, objective),
+    )
+
+
+def get_lower_bound(pairs: Pairs, n: int, infeasible_cost: float) -> float:
+    # No assignment costs less than every row's cheapest option, nor than what the columns can absorb: at most one
+    # row per column avoids the infeasible cost, at the cheapest pair of that column. Nor than the rows a maximum
+    # matching leaves unmatched, with the cheapest row options for the matched ones.
+    rows, cols, costs = pairs
+    row_minimum = np.full(n, infeasible_cost)
+    np.minimum.at(row_minimum, rows, costs)
+    used_cols, col_inverse = np.unique(cols, return_inverse=True)
+    col_minimum = np.full(len(used_cols), infeasible_cost)
+    np.minimum.at(col_minimum, col_inverse, costs)
+    matchable = get_maximum_matching_size(pairs, n)
+    return float(
+        max(
+            row_minimum.sum(),
+            infeasible_cost * (n - len(used_cols)) + col_minimum.sum(),
+            infeasible_cost * (n - matchable) + np.sort(row_minimum)[:matchable].sum(),
+        )
+    )
+
+
+def get_maximum_matching_size(pairs: Pairs, n: int) -> int:
+    # How many rows can be matched at all, whatever the costs
+    rows, cols, _ = pairs
+    if not len(rows):
+        return 0
+    graph = csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, int(cols.max()) + 1))
+    return int(np.count_nonzero(maximum_bipartite_matching(graph, perm_type="column") >= 0))
+
+
+def solve(pairs: Pairs, n: int, m: int, infeasible_cost: float, sparse_min_pairs: int) -> AssignmentResult:
+    # Exact minimum-cost assignment using only the given pairs.
+    # Small problems go to the dense Hungarian solver, large ones to sparse matching.
+    if n * m < sparse_min_pairs:
+        return solve_dense(pairs, n, m, infeasible_cost)
+    return solve_sparse(pairs, n, m, infeasible_cost)
+
+
+def solve_dense(pairs: Pairs, n: int, m: int, infeasible_cost: float) -> AssignmentResult:
+    rows, cols, costs = pairs
+    cost_matrix = np.full((n, m), infeasible_cost, dtype=np.float64)
+    cost_matrix[rows, cols] = costs
+    row_indices, col_indices = linear_sum_assignment(cost_matrix)
+    feasible = cost_matrix[row_indices, col_indices] < infeasible_cost
+    row_indices, col_indices = row_indices[feasible], col_indices[feasible]
+    return get_result(row_indices, col_indices, cost_matrix[row_indices, col_indices], n, infeasible_cost)
+
+
+def solve_sparse(pairs: Pairs, n: int, m: int, infeasible_cost: float) -> AssignmentResult:
+    # Every row also gets a private dummy column priced like an infeasible pair, so a full matching always exists.
+    # Weights are shifted by one because the solver does not accept zero-weight edges.
+    rows, cols, costs = pairs
+    if not len(rows):
+        empty = np.empty(0, dtype=np.intp)
+        return get_result(empty, empty, np.empty(0), n, infeasible_cost)
+    dummy = np.arange(n)
+    biadjacency = csr_matrix(
+        (
+            np.concatenate([costs, np.full(n, infeasible_cost)]) + 1,
+            (np.concatenate([rows, dummy]), np.concatenate([cols, m + dummy])),
+        ),
+        shape=(n, m + n),
+    )
+    row_indices, col_indices = min_weight_full_bipartite_matching(biadjacency)
+
+    feasible = col_indices < m
+    row_indices, col_indices = row_indices[feasible], col_indices[feasible]
+    matched_costs = np.asarray(biadjacency[row_indices, col_indices]).ravel() - 1
+    return get_result(row_indices, col_indices, matched_costs, n, infeasible_cost)
+
+
+def solve_greedy(pairs: Pairs, n: int, m: int, infeasible_cost: float) -> AssignmentResult:
+    # Cheapest pairs first. Done in rounds: every pair that is the cheapest left for both its row and its column is
+    # taken at once, which gives the same matching as taking pairs one by one in cost order.
+    rows, cols, costs = pairs
+    rank = np.empty(len(costs), dtype=np.intp)
+    rank[np.argsort(costs, kind="stable")] = np.arange(len(costs))
+
+    row_to_col = np.full(n, -1, dtype=np.intp)
+    row_cost = np.zeros(n)
+    col_taken = np.zeros(m, dtype=bool)
+    alive = np.arange(len(costs))
+    while len(alive):
+        row_best = np.full(n, len(costs), dtype=np.intp)
+        col_best = np.full(m, len(costs), dtype=np.intp)
+        np.minimum.at(row_best, rows[alive], rank[alive])
+        np.minimum.at(col_best, cols[alive], rank[alive])
+        taken = alive[(row_best[rows[alive]] == rank[alive]) & (col_best[cols[alive]] == rank[alive])]
+        row_to_col[rows[taken]] = cols[taken]
+        row_cost[rows[taken]] = costs[taken]
+        col_taken[cols[taken]] = True
+        alive = alive[(row_to_col[rows[alive]] < 0) & ~col_taken[cols[alive]]]
+
+    row_indices = np.flatnonzero(row_to_col >= 0)
+    lower_bound = get_lower_bound(pairs, n, infeasible_cost)
+    return get_result(row_indices, row_to_col[row_indices], row_cost[row_indices], n, infeasible_cost, lower_bound)
+
+
+def improve_by_swaps(
+    pairs: Pairs, n: int, m: int, infeasible_cost: float, result: AssignmentResult, deadline: float
+) -> AssignmentResult:
+    # Local search in rounds until no move helps or the deadline passes. A row moves to its cheapest free column, or
+    # takes the column of another row, which in return takes the first row's old column (a 2-swap), its own cheapest
+    # free column or goes unmatched. Each round applies the best moves that share no row and no column.
+    rows, cols, costs = pairs
+    codes = rows * m + cols
+    order = np.argsort(codes)
+    codes, code_costs = codes[order], costs[order]
+
+    row_to_col = np.full(n, -1, dtype=np.intp)
+    row_to_col[result.row_indices] = result.col_indices
+    col_to_row = np.full(m, -1, dtype=np.intp)
+    col_to_row[result.col_indices] = result.row_indices
+    row_cost = np.full(n, float(infeasible_cost))
+    row_cost[result.row_indices] = get_pair_costs(codes, code_costs, m, result.row_indices, result.col_indices)
+
+    while time.time() < deadline:
+        # Cheapest free column of every row, if any
+        free = np.flatnonzero(col_to_row[cols] < 0)
+        free = free[np.lexsort((costs[free], rows[free]))]
+        free = free[np.concatenate([[True], rows[free][1:] != rows[free][:-1]])] if len(free) else free
+        free_col = np.full(n, -1, dtype=np.intp)
+        free_cost = np.full(n, np.inf)
+        free_col[rows[free]], free_cost[rows[free]] = cols[free], costs[free]
+
+        # Every move gives row a a new column and, for swaps, row b a new column, as a, a_col, a_cost, b, b_col, b_cost.
+        # Moves of a row to its cheapest free column:
+        movers = np.flatnonzero(free_cost < row_cost)
+        # Swaps: row a takes the column of row b, b takes the cheapest of a's old column, its own cheapest free column
+        # or none at all (-1)
+        swaps = np.flatnonzero((col_to_row[cols] >= 0) & (col_to_row[cols] != rows))
+        a_old_col = row_to_col[rows[swaps]]
+        b = col_to_row[cols[swaps]]
+        back_cost = get_pair_costs(codes, code_costs, m, b, a_old_col)
+        b_col = np.where(back_cost <= free_cost[b], a_old_col, free_col[b])
+        b_cost = np.minimum(back_cost, free_cost[b])
+        b_col[b_cost >= infeasible_cost] = -1
+        b_cost = np.minimum(b_cost, infeasible_cost)
+
+        a = np.concatenate([movers, rows[swaps]])
+        a_col = np.concatenate([free_col[movers], cols[swaps]])
+        a_cost = np.concatenate([free_cost[movers], costs[swaps]])
+        b = np.concatenate([np.full(len(movers), -1), b])
+        b_col = np.concatenate([np.full(len(movers), -1), b_col])
+        b_cost = np.concatenate([np.zeros(len(movers)), b_cost])
+        delta = a_cost + b_cost - row_cost[a] - np.where(b >= 0, row_cost[b], 0)
+        improving = np.flatnonzero(delta < 0)
+        if not len(improving):
+            break
+        a, a_col, a_cost, b, b_col, b_cost = (x[improving] for x in (a, a_col, a_cost, b, b_col, b_cost))
+
+        # The best moves that share no row and no column with a better one, -1 (no row b) lands in a spare slot
+        rank = np.empty(len(improving), dtype=np.intp)
+        rank[np.argsort(delta[improving], kind="stable")] = np.arange(len(improving))
+        row_best = np.full(n + 1, len(improving), dtype=np.intp)
+        col_best = np.full(m + 1, len(improving), dtype=np.intp)
+        for index, best in ((a, row_best), (b, row_best), (a_col, col_best), (b_col, col_best)):
+            np.minimum.at(best, index, rank)
+        chosen = (row_best[a] == rank) & (col_best[a_col] == rank)
+        chosen &= (b < 0) | ((row_best[b] == rank) & ((b_col < 0) | (col_best[b_col] == rank)))
+        a, a_col, a_cost, b, b_col, b_cost = (x[chosen] for x in (a, a_col, a_cost, b, b_col, b_cost))
+
+        a_old_col = row_to_col[a]
+        col_to_row[a_old_col[a_old_col >= 0]] = -1
+        row_to_col[a], row_cost[a], col_to_row[a_col] = a_col, a_cost, a
+        swapped = b >= 0
+        b, b_col, b_cost = b[swapped], b_col[swapped], b_cost[swapped]
+        row_to_col[b], row_cost[b] = b_col, b_cost
+        col_to_row[b_col[b_col >= 0]] = b[b_col >= 0]
+
+    row_indices = np.flatnonzero(row_to_col >= 0)
+    return get_result(
+        row_indices, row_to_col[row_indices], row_cost[row_indices], n, infeasible_cost, result.lower_bound
+    )
+
+
+def get_pair_costs(
+    codes: np.ndarray, code_costs: np.ndarray, m: int, rows: np.ndarray, cols: np.ndarray
+) -> np.ndarray:
+    # Costs of the given (row, column) pairs looked up in the sorted pair codes, infinite where there is no such pair
+    query = rows * m + cols
+    positions = np.minimum(np.searchsorted(codes, query), len(codes) - 1)
+    return np.where((codes[positions] == query) & (cols >= 0), code_costs[positions], np.inf)
@@ -1,5 +1,11 @@
 import pytest
+from django.core.cache import cache
+from django.core.signals import request_started
 from .models import Location, Shipment, Transport, Route, Planning
+from .detour import detour_model
+from .geocoding_cache import geocoding_cache
+from .incremental import incremental_planner
+from .spatial_index import location_index
 import json
 
 
@@ -38,3 +44,46 @@ def location_search_result_data() -> Location:
         latitude="52.3727598",
         longitude="4.8936041",
     )
+
+
+@pytest.fixture(autouse=True)
+def reset_location_index():
+    # The index lives for the whole process, while each test rolls its Location rows back
+    location_index.invalidate()
+    yield
+    location_index.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def reset_incremental_planner():
+    incremental_planner.invalidate()
+    yield
+    incremental_planner.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def reset_detour_model():
+    detour_model.invalidate()
+    yield
+    detour_model.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def reset_geocoding_cache():
+    geocoding_cache.clear()
+    yield
+    geocoding_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Cached snapshots and fragments would outlive the rows each test rolls back
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True, scope="session")
+def skip_interrupted_job_recovery():
+    # Recovery runs once on the process's first request, whichever test sends it, and would skew query counts
+    request_started.disconnect(dispatch_uid="planning_fail_interrupted_jobs")
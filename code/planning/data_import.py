@@ -1,10 +1,88 @@
-import pandas as pd
+import uuid
 from io import StringIO
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+import pandas as pd
+from django.core.cache import cache
+
+from .types import SpreadsheetUpload
 
 
 class DataImportService:
+    # Pasted spreadsheets are read in chunks of CHUNK_SIZE rows and the cleaned chunks are cached under an upload
+    # token, so the apply step streams them back instead of parsing the paste again. Only PREVIEW_ROWS are rendered,
+    # and the mapped rows are geocoded and rendered PAGE_SIZE at a time.
+    CHUNK_SIZE = 5_000
+    PREVIEW_ROWS = 20
+    PAGE_SIZE = 100
+    UPLOAD_TIMEOUT = 60 * 60
+
     def parse_spreadsheet(self, spreadsheet_content: str) -> pd.DataFrame:
         file_data = StringIO(spreadsheet_content)
         df = pd.read_csv(file_data, sep="\t")
         df = df.fillna("")
         return df
+
+    def read_chunks(self, spreadsheet_content: str) -> Iterator[pd.DataFrame]:
+        # Cells are kept as text, malformed lines are skipped and rows without any value are dropped
+        chunks = pd.read_csv(
+            StringIO(spreadsheet_content),
+            sep="\t",
+            dtype=str,
+            keep_default_na=False,
+            on_bad_lines="skip",
+            chunksize=self.CHUNK_SIZE,
+        )
+        for chunk in chunks:
+            chunk = chunk.apply(lambda column: column.str.strip())
+            yield chunk[(chunk != "").any(axis=1)]
+
+    def store_upload(self, spreadsheet_content: str) -> SpreadsheetUpload:
+        upload = SpreadsheetUpload(token=uuid.uuid4().hex, columns=[], preview=[], row_count=0)
+        chunk_count = 0
+        for chunk_count, chunk in enumerate(self.read_chunks(spreadsheet_content), start=1):
+            cache.set(self.get_chunk_key(upload.token, chunk_count - 1), chunk, self.UPLOAD_TIMEOUT)
+            upload.columns = list(chunk.columns)
+            upload.preview += chunk.head(self.PREVIEW_ROWS - len(upload.preview)).values.tolist()
+            upload.row_count += len(chunk)
+        cache.set(self.get_upload_key(upload.token), chunk_count, self.UPLOAD_TIMEOUT)
+        return upload
+
+    def load_upload(self, token: Optional[str]) -> Optional[Iterator[pd.DataFrame]]:
+        # None when the token is unknown or any of its chunks has expired
+        chunk_count = cache.get(self.get_upload_key(token)) if token else None
+        if chunk_count is None:
+            return None
+        chunk_keys = [self.get_chunk_key(token, i) for i in range(chunk_count)]
+        if not all(cache.has_key(key) for key in chunk_keys):
+            return None
+        return (cache.get(key) for key in chunk_keys)
+
+    def map_columns(
+        self, chunks: Iterable[pd.DataFrame], name_columns: list[str], location_columns: list[str]
+    ) -> Iterator[tuple[str, str]]:
+        # Name and location text per row, columns that aren't in the spreadsheet are ignored
+        for chunk in chunks:
+            name_texts = self.join_columns(chunk, [c for c in name_columns if c in chunk], separator=" ")
+            location_texts = self.join_columns(chunk, [c for c in location_columns if c in chunk], separator=", ")
+            yield from zip(name_texts, location_texts)
+
+    def map_page(
+        self, chunks: Iterable[pd.DataFrame], name_columns: list[str], location_columns: list[str], page: int
+    ) -> tuple[list[tuple[str, str]], bool]:
+        # One page of mapped rows and whether any rows follow it
+        rows = self.map_columns(chunks, name_columns, location_columns)
+        page_rows = list(islice(rows, page * self.PAGE_SIZE, (page + 1) * self.PAGE_SIZE + 1))
+        return page_rows[: self.PAGE_SIZE], len(page_rows) > self.PAGE_SIZE
+
+    def join_columns(self, dataframe: pd.DataFrame, columns: list[str], separator: str) -> list[str]:
+        if not columns or dataframe.empty:
+            return [""] * len(dataframe)
+        return dataframe[columns].astype(str).agg(separator.join, axis=1).tolist()
+
+    def get_upload_key(self, token: str) -> str:
+        return f"data_import:{token}"
+
+    def get_chunk_key(self, token: str, index: int) -> str:
+        return f"data_import:{token}:{index}"
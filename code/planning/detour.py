@@ -0,0 +1,80 @@
+import threading
+import time
+
+import numpy as np
+
+from .distance import haversine_pairs
+from .models import Route
+
+
+class DetourModel:
+    # Estimates road km from great-circle km with detour factors (road km / great-circle km) fitted on stored routes.
+    # Routes are grouped into great-circle distance bands, each band with at least MIN_SAMPLES routes contributes its
+    # median factor at its median distance, and factors in between are interpolated. Factors are never below 1,
+    # so great-circle pruning stays safe. With fewer than MIN_SAMPLES routes overall nothing is scaled.
+    BAND_EDGES_KM = (25, 75, 200, 500, 1_000)
+    MIN_SAMPLES = 20
+    MAX_SAMPLES = 50_000
+    # Routes shorter than this are dominated by the last mile, their factor says little about longer trips
+    MIN_FIT_KM = 2
+    REFIT_SECONDS = 15 * 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.knots: tuple[np.ndarray, np.ndarray] | None = None
+        self.fitted_at = 0.0
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.knots = None
+
+    def get_knots(self) -> tuple[np.ndarray, np.ndarray]:
+        with self.lock:
+            if self.knots is None or time.monotonic() - self.fitted_at > self.REFIT_SECONDS:
+                self.knots = self.fit()
+                self.fitted_at = time.monotonic()
+            return self.knots
+
+    def fit(self) -> tuple[np.ndarray, np.ndarray]:
+        # The most recent routes, so the model follows changes in the road network and the routing provider
+        routes = (
+            Route.objects.filter(distance_km__gt=0, location_start__isnull=False, location_end__isnull=False)
+            .order_by("-created_at")
+            .values_list(
+                "location_start__latitude",
+                "location_start__longitude",
+                "location_end__latitude",
+                "location_end__longitude",
+                "distance_km",
+            )[: self.MAX_SAMPLES]
+        )
+        samples = np.array(list(routes), dtype=np.float64).reshape(-1, 5)
+        great_circle_km = haversine_pairs(samples[:, 0:2], samples[:, 2:4])
+        valid = great_circle_km >= self.MIN_FIT_KM
+        return self.fit_knots(great_circle_km[valid], samples[valid, 4] / great_circle_km[valid])
+
+    def fit_knots(self, great_circle_km: np.ndarray, factors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # (distance, factor) knots to interpolate between, empty when there is too little data
+        if len(factors) < self.MIN_SAMPLES:
+            return np.empty(0), np.empty(0)
+
+        bands = np.digitize(great_circle_km, self.BAND_EDGES_KM)
+        distances, band_factors = [], []
+        for band in np.unique(bands):
+            in_band = bands == band
+            if np.count_nonzero(in_band) >= self.MIN_SAMPLES:
+                distances.append(np.median(great_circle_km[in_band]))
+                band_factors.append(np.median(factors[in_band]))
+        if not distances:
+            distances, band_factors = [np.median(great_circle_km)], [np.median(factors)]
+        return np.array(distances), np.maximum(np.array(band_factors), 1)
+
+    def apply(self, great_circle_km: np.ndarray) -> np.ndarray:
+        # Estimated road km for a whole matrix in one pass, NaN stays NaN
+        distances, factors = self.get_knots()
+        if not len(factors):
+            return great_circle_km
+        return great_circle_km * np.interp(great_circle_km, distances, factors)
+
+
+detour_model = DetourModel()
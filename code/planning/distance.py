@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import rust_extensions
+
+EARTH_RADIUS_KM = 6371.0
+
+# Batch kernels of the rust_extensions crate take whole coordinate arrays in one call and run multi-threaded without
+# the GIL. They exist once the crate is built (maturin develop), until then the NumPy versions below are used.
+native_distance_matrix = getattr(rust_extensions, "distance_matrix", None)
+native_distance_pairs = getattr(rust_extensions, "distance_pairs", None)
+
+# The NumPy matrix is computed in tiles across threads from this many cells on. A 256 x 256 tile keeps each float64
+# temporary at 512 KB, within L2 cache.
+PARALLEL_MIN_CELLS = 1_000_000
+TILE_SIZE = 256
+
+
+def haversine_matrix(origins: np.ndarray, destinations: np.ndarray, workers: int = 1) -> np.ndarray:
+    # origins (N, 2) and destinations (M, 2) as [latitude, longitude] degrees -> (N, M) great-circle km
+    origins, destinations = as_coordinates(origins), as_coordinates(destinations)
+    if native_distance_matrix is not None:
+        return native_distance_matrix(origins, destinations)
+    if workers > 1 and len(origins) * len(destinations) >= PARALLEL_MIN_CELLS:
+        return haversine_matrix_tiled(origins, destinations, workers=workers)
+    return haversine_matrix_numpy(origins, destinations)
+
+
+def haversine_matrix_tiled(
+    origins: np.ndarray, destinations: np.ndarray, workers: int, tile_size: int = TILE_SIZE, out: np.ndarray = None
+) -> np.ndarray:
+    # Tiles are written by a thread pool straight into `out`, which may be a memory-mapped array. NumPy releases
+    # the GIL inside its ufuncs, so the threads run in parallel and no result is copied back from a worker.
+    origins, destinations = as_coordinates(origins), as_coordinates(destinations)
+    if out is None:
+        out = np.empty((len(origins), len(destinations)), dtype=np.float64)
+
+    def compute_tile(tile: tuple[slice, slice]) -> None:
+        rows, cols = tile
+        out[rows, cols] = haversine_matrix_numpy(origins[rows], destinations[cols])
+
+    tiles = [
+        (slice(i, i + tile_size), slice(j, j + tile_size))
+        for i in range(0, len(origins), tile_size)
+        for j in range(0, len(destinations), tile_size)
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(compute_tile, tiles))
+    return out
+
+
+def haversine_pairs(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    # origins (N, 2) and destinations (N, 2) as [latitude, longitude] degrees -> (N,) great-circle km, row by row
+    if native_distance_pairs is not None:
+        return native_distance_pairs(as_coordinates(origins), as_coordinates(destinations))
+    return haversine_pairs_numpy(origins, destinations)
+
+
+def as_coordinates(coordinates: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+
+
+def haversine_matrix_numpy(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+
+    lat1 = origins[:, 0, np.newaxis]
+    lon1 = origins[:, 1, np.newaxis]
+    lat2 = destinations[np.newaxis, :, 0]
+    lon2 = destinations[np.newaxis, :, 1]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_pairs_numpy(origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = origins.T
+    lat2, lon2 = destinations.T
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def unit_vectors(coordinates: np.ndarray) -> np.ndarray:
+    # [latitude, longitude] degrees -> points on the unit sphere, where chord length grows with great-circle distance
+    coordinates = np.radians(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+    lat = coordinates[:, 0]
+    lon = coordinates[:, 1]
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(distance_km: float | np.ndarray) -> float | np.ndarray:
+    angle = np.minimum(np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def chord_to_km(chord: float | np.ndarray) -> float | np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1))
+
+
+def spherical_centroid(coordinates: np.ndarray) -> tuple[float, float]:
+    # Mean of the unit vectors projected back onto the sphere, correct across the antimeridian and near the poles.
+    # Points spread evenly around the globe have no centroid, their plain mean is used instead.
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    x, y, z = unit_vectors(coordinates).mean(axis=0)
+    norm = np.sqrt(x**2 + y**2 + z**2)
+    if norm < 1e-9:
+        latitude, longitude = coordinates.mean(axis=0)
+        return float(latitude), float(longitude)
+    return float(np.degrees(np.arcsin(z / norm))), float(np.degrees(np.arctan2(y, x)))
+
+
+def longitude_span(longitudes: np.ndarray) -> tuple[float, float]:
+    # Narrowest (west, east) range holding every longitude: everything but the widest gap between neighbours.
+    # west > east when the range crosses the antimeridian.
+    longitudes = np.unique(np.asarray(longitudes, dtype=np.float64))
+    gaps = np.diff(longitudes, append=longitudes[0] + 360)
+    widest = int(np.argmax(gaps))
+    return float(longitudes[(widest + 1) % len(longitudes)]), float(longitudes[widest])
@@ -0,0 +1,169 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Sequence
+
+import numpy as np
+from django.conf import settings
+
+
+class DistanceCache:
+    # Great-circle km between locations in a float32 matrix indexed by location ordinal, NaN marks an unknown pair.
+    # Once all `capacity` ordinals are taken the least recently used location is evicted, so memory stays at
+    # capacity² floats. With a path the matrix is memory-mapped and survives restarts. Keys are stored as strings.
+    # The ordinal index is written whenever an ordinal is released, and otherwise every FLUSH_EVERY new locations
+    # and at exit. Ordinals taken after the last write are cleared when the cache is opened again.
+    # The ordinal index lives in the memory of the process using the files, so only one process may: it holds an
+    # exclusive lock on `{path}.lock` until it closes the cache or exits, and other processes get an in-memory cache.
+    FLUSH_EVERY = 256
+
+    def __init__(self, capacity: int, path: str | None = None):
+        self.capacity = capacity
+        self.path = path
+        self.lock = threading.Lock()
+        self.lock_file = None
+        if self.path is not None and not self.lock_path():
+            self.path = None
+        self.ordinals: OrderedDict[str, int] = OrderedDict()
+        self.unflushed = 0
+        self.matrix = self.open_matrix()
+        self.free = sorted(set(range(capacity)) - set(self.ordinals.values()), reverse=True)
+
+    def open_matrix(self) -> np.ndarray:
+        if self.path is None:
+            return np.full((self.capacity, self.capacity), np.nan, dtype=np.float32)
+
+        index_path = f"{self.path}.json"
+        if os.path.exists(self.path) and os.path.exists(index_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["capacity"] == self.capacity:
+                self.ordinals = OrderedDict((key, ordinal) for key, ordinal in index["ordinals"])
+                matrix = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(self.capacity, self.capacity))
+                untracked = sorted(set(range(self.capacity)) - set(self.ordinals.values()))
+                matrix[untracked, :] = np.nan
+                matrix[:, untracked] = np.nan
+                return matrix
+
+        matrix = np.memmap(self.path, dtype=np.float32, mode="w+", shape=(self.capacity, self.capacity))
+        matrix[:] = np.nan
+        return matrix
+
+    def lookup(self, start_ids: Sequence[Hashable], end_ids: Sequence[Hashable]) -> np.ndarray:
+        result = np.full((len(start_ids), len(end_ids)), np.nan, dtype=np.float32)
+        with self.lock:
+            start_rows, start_ordinals = self.get_known_ordinals(start_ids)
+            end_cols, end_ordinals = self.get_known_ordinals(end_ids)
+            if len(start_rows) and len(end_cols):
+                result[np.ix_(start_rows, end_cols)] = self.matrix[np.ix_(start_ordinals, end_ordinals)]
+        return result
+
+    def store(self, start_ids: Sequence[Hashable], end_ids: Sequence[Hashable], distances: np.ndarray) -> None:
+        start_rows, end_cols = self.fit_block(start_ids, end_ids)
+        if not start_rows or not end_cols:
+            return
+        start_keys = [str(start_ids[i]) for i in start_rows]
+        end_keys = [str(end_ids[j]) for j in end_cols]
+
+        with self.lock:
+            released = self.assign_ordinals(set(start_keys) | set(end_keys))
+            start_ordinals = [self.ordinals[key] for key in start_keys]
+            end_ordinals = [self.ordinals[key] for key in end_keys]
+            self.matrix[np.ix_(start_ordinals, end_ordinals)] = np.asarray(distances)[np.ix_(start_rows, end_cols)]
+            if released or self.unflushed >= self.FLUSH_EVERY:
+                self.flush()
+
+    def discard(self, key: Hashable) -> None:
+        with self.lock:
+            if (ordinal := self.ordinals.pop(str(key), None)) is not None:
+                self.release(ordinal)
+                self.flush()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.ordinals.clear()
+            self.matrix[:] = np.nan
+            self.free = list(range(self.capacity - 1, -1, -1))
+            self.flush()
+
+    def close(self) -> None:
+        # Writes the index and hands the files over to other processes, this one keeps a copy in memory
+        with self.lock:
+            self.flush()
+            if self.lock_file is not None:
+                self.matrix = np.array(self.matrix)
+                self.path = None
+                self.lock_file.close()
+                self.lock_file = None
+
+    def lock_path(self) -> bool:
+        self.lock_file = open(f"{self.path}.lock", "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def fit_block(self, start_ids: Sequence[Hashable], end_ids: Sequence[Hashable]) -> tuple[list[int], list[int]]:
+        # Positions of the known ids, trimmed to the largest leading block whose locations fit the capacity. The ends
+        # keep at least half of it, or all they can when the starts need less, and the starts fill the rest.
+        start_rows = [i for i, key in enumerate(start_ids) if key is not None]
+        end_cols = [j for j, key in enumerate(end_ids) if key is not None]
+        start_keys = {str(start_ids[i]) for i in start_rows}
+        end_keys = list(dict.fromkeys(str(end_ids[j]) for j in end_cols))
+        if len(start_keys.union(end_keys)) <= self.capacity:
+            return start_rows, end_cols
+
+        kept = set(end_keys[: max(self.capacity // 2, self.capacity - len(start_keys))])
+        end_cols = [j for j in end_cols if str(end_ids[j]) in kept]
+        for i in start_rows:
+            if len(kept) < self.capacity:
+                kept.add(str(start_ids[i]))
+        return [i for i in start_rows if str(start_ids[i]) in kept], end_cols
+
+    def get_known_ordinals(self, keys: Sequence[Hashable]) -> tuple[list[int], list[int]]:
+        positions, ordinals = [], []
+        for position, key in enumerate(map(str, keys)):
+            if (ordinal := self.ordinals.get(key)) is not None:
+                self.ordinals.move_to_end(key)
+                positions.append(position)
+                ordinals.append(ordinal)
+        return positions, ordinals
+
+    def assign_ordinals(self, keys: set[str]) -> bool:
+        # Whether an ordinal had to be released for the new keys
+        released = False
+        for key in keys:
+            if key in self.ordinals:
+                self.ordinals.move_to_end(key)
+        for key in keys - self.ordinals.keys():
+            if not self.free:
+                # The keys being stored were just moved to the end, so the oldest entry is never one of them
+                _, ordinal = self.ordinals.popitem(last=False)
+                self.release(ordinal)
+                released = True
+            self.ordinals[key] = self.free.pop()
+            self.unflushed += 1
+        return released
+
+    def release(self, ordinal: int) -> None:
+        self.matrix[ordinal, :] = np.nan
+        self.matrix[:, ordinal] = np.nan
+        self.free.append(ordinal)
+
+    def flush(self) -> None:
+        self.unflushed = 0
+        if self.path is None:
+            return
+        self.matrix.flush()
+        with open(f"{self.path}.json", "w") as f:
+            json.dump({"capacity": self.capacity, "ordinals": list(self.ordinals.items())}, f)
+
+
+distance_cache = DistanceCache(capacity=settings.DISTANCE_CACHE_CAPACITY, path=settings.DISTANCE_CACHE_PATH)
+atexit.register(distance_cache.close)
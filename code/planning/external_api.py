@@ -1,10 +1,9 @@
 import os
 
 import googlemaps
-import numpy as np
-import polyline
 import requests
 from dotenv import load_dotenv
+from . import polyline_codec
 from .models import Location
 from planning.types import RoutePolylineInput, RouteResponse
 from utils import is_pytest
@@ -63,8 +62,7 @@ class GoogleMapsClient:
         )
 
         polyline_points = directions[0]["overview_polyline"]["points"]
-        route_coordinates = polyline.decode(polyline_points)
-        route_polyline = np.array(route_coordinates).tolist()
+        route_polyline = polyline_codec.decode_google(polyline_points)
 
         total_distance_meters = directions[0]["legs"][0]["distance"]["value"]
         total_distance_km = round(total_distance_meters / 1000)
@@ -1,7 +1,7 @@
 from django import forms
 from forms import CharField, ChoiceField, NumberField, TextAreaField, SelectWidget
 from .models import Location
-from .types import EntityType
+from .types import EntityType, SolverStrategy
 
 
 class LocationSearchForm(forms.Form):
@@ -25,6 +25,8 @@ class DeleteEntityForm(forms.Form):
 
 class OptimisePlanningForm(forms.Form):
     max_empty_km = NumberField(placeholder="Max empty km", required=False)
+    strategy = ChoiceField(placeholder="Solver", choices=SolverStrategy.choices(), required=False)
+    time_budget = NumberField(placeholder="Time budget s", required=False)
 
 
 class DataImportForm(forms.Form):
@@ -0,0 +1,89 @@
+import csv
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import Location
+from .spatial_index import location_index
+from utils import timer
+
+GEONAMES_COLUMNS = {1: "name", 4: "latitude", 5: "longitude", 8: "country_code"}
+
+
+class GazetteerService:
+    # Seeds Location rows from gazetteer files. Files are read in chunks so memory stays bounded for dumps with
+    # millions of rows, every chunk costs one existence query and batched inserts, all in one transaction.
+    # Like before, a place whose name is already saved is skipped.
+    CHUNK_SIZE = 10_000
+    BATCH_SIZE = 1_000
+
+    @timer()
+    def load_cities(self, path: str) -> int:
+        # OpenDataSoft export of GeoNames cities, with "latitude, longitude" in one Coordinates column
+        chunks = pd.read_csv(
+            path, usecols=["Name", "Country Code", "Coordinates"], dtype=str, chunksize=self.CHUNK_SIZE
+        )
+        return self.load(self.parse_cities(chunk) for chunk in chunks)
+
+    @timer()
+    def load_geonames(self, path: str) -> int:
+        # Tab-separated dump from download.geonames.org, such as allCountries.txt or LV.txt
+        chunks = pd.read_csv(
+            path,
+            sep="\t",
+            header=None,
+            usecols=list(GEONAMES_COLUMNS),
+            dtype=str,
+            quoting=csv.QUOTE_NONE,
+            keep_default_na=False,
+            chunksize=self.CHUNK_SIZE,
+        )
+        return self.load(chunk.rename(columns=GEONAMES_COLUMNS) for chunk in chunks)
+
+    def parse_cities(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        coordinates = chunk["Coordinates"].str.split(",", n=1, expand=True).reindex(columns=[0, 1])
+        return pd.DataFrame(
+            {
+                "name": chunk["Name"],
+                "country_code": chunk["Country Code"],
+                "latitude": coordinates[0],
+                "longitude": coordinates[1],
+            }
+        )
+
+    def load(self, chunks: Iterable[pd.DataFrame]) -> int:
+        created = 0
+        with transaction.atomic():
+            for chunk in chunks:
+                created += self.load_chunk(chunk)
+        if created:
+            location_index.invalidate()
+        return created
+
+    def load_chunk(self, chunk: pd.DataFrame) -> int:
+        latitude = pd.to_numeric(chunk["latitude"], errors="coerce").to_numpy(dtype=np.float64)
+        longitude = pd.to_numeric(chunk["longitude"], errors="coerce").to_numpy(dtype=np.float64)
+        valid = (
+            chunk["name"].notna().to_numpy()
+            & (np.abs(latitude) <= 90)
+            & (np.abs(longitude) <= 180)
+            & (chunk["name"].str.len() <= Location._meta.get_field("name").max_length).to_numpy()
+        )
+        chunk = chunk.assign(latitude=latitude, longitude=longitude)[valid].drop_duplicates(subset="name")
+
+        existing = set(Location.objects.filter(name__in=chunk["name"].tolist()).values_list("name", flat=True))
+        chunk = chunk[~chunk["name"].isin(existing)]
+        country_codes = chunk["country_code"].fillna("").str.upper().str[:2]
+
+        locations = [
+            Location(
+                name=name, address=name, country_code=country_code or None, latitude=latitude, longitude=longitude
+            )
+            for name, country_code, latitude, longitude in zip(
+                chunk["name"], country_codes, chunk["latitude"], chunk["longitude"]
+            )
+        ]
+        Location.objects.bulk_create(locations, batch_size=self.BATCH_SIZE)
+        return len(locations)
@@ -1,47 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
 from .external_api import OpenStreetMapGeocodingClient, GoogleMapsClient
+from .gazetteer import GazetteerService
+from .geocoding_cache import geocoding_cache
 from .types import RoutePolylineInput, RouteResponse
 from .models import Location
-from utils import timer
-import pandas as pd
+from .spatial_index import location_index
+from utils import RateLimiter, print_red, timer
+import googlemaps
+import requests
 import os
 
 
 class GeoService:
+    ROUTE_FETCH_MAX_WORKERS = 8
+    ROUTE_FETCH_CALLS_PER_SECOND = 20
+    # Nominatim's usage policy allows one request per second
+    GEOCODING_MAX_WORKERS = 2
+    GEOCODING_CALLS_PER_SECOND = 1
+    LOCATION_LOOKUP_CHUNK_SIZE = 500
+
     @timer()
     def search(self, search: str) -> list[Location]:
-        search_results = OpenStreetMapGeocodingClient().search(search=search)
+        search_results = geocoding_cache.get(search)
+        if search_results is None:
+            search_results = OpenStreetMapGeocodingClient().search(search=search)
+            geocoding_cache.set(search, search_results)
         search_results = self.create_new_locations(locations=search_results)
         return search_results
 
-    def create_new_locations(self, locations: list[Location]):
-        result = []
-        for location in locations:
-            existing_location = Location.objects.filter(
-                latitude=location.latitude, longitude=location.longitude, name=location.name
-            )
-            if existing_location:
-                result.append(existing_location.first())
-            else:
-                location.save()
-                result.append(location)
-        return result
+    @timer()
+    def search_many(self, searches: Iterable[str]) -> dict[str, list[Location]]:
+        # Every distinct search is geocoded once: cached ones straight away, the rest concurrently under the
+        # provider's rate limit. A search that fails comes back without options instead of failing the batch.
+        searches = list(dict.fromkeys(searches))
+        search_results = {search: geocoding_cache.get(search) for search in searches}
+        missing = [search for search, locations in search_results.items() if locations is None]
+
+        client = OpenStreetMapGeocodingClient()
+        rate_limiter = RateLimiter(calls_per_second=self.GEOCODING_CALLS_PER_SECOND)
+
+        def search_missing(search: str) -> list[Location] | None:
+            rate_limiter.wait()
+            try:
+                return client.search(search=search)
+            except (requests.RequestException, KeyError) as e:
+                print_red(f"Search {search!r} not geocoded: {e!r}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.GEOCODING_MAX_WORKERS) as executor:
+            for search, locations in zip(missing, executor.map(search_missing, missing)):
+                if locations is not None:
+                    geocoding_cache.set(search, locations)
+                search_results[search] = locations or []
+
+        locations = self.create_new_locations([location for result in search_results.values() for location in result])
+        locations = iter(locations)
+        return {search: [next(locations) for _ in result] for search, result in search_results.items()}
+
+    def create_new_locations(self, locations: list[Location]) -> list[Location]:
+        # Search results are matched to saved Locations by name and coordinates in one query per chunk,
+        # and the ones not saved yet are bulk-created.
+        def get_key(location: Location) -> tuple:
+            return location.name, float(location.latitude), float(location.longitude)
+
+        keys = [get_key(location) for location in locations]
+        latitudes = list({latitude for _, latitude, _ in keys})
+        existing = {}
+        for chunk_start in range(0, len(latitudes), self.LOCATION_LOOKUP_CHUNK_SIZE):
+            chunk = latitudes[chunk_start : chunk_start + self.LOCATION_LOOKUP_CHUNK_SIZE]
+            for location in Location.objects.filter(latitude__in=chunk).order_by("id"):
+                existing.setdefault(get_key(location), location)
+
+        new_locations = []
+        for key, location in zip(keys, locations):
+            if key not in existing:
+                location.validate_coordinates()
+                existing[key] = location
+                new_locations.append(location)
+        Location.objects.bulk_create(new_locations)
+        # bulk_create doesn't send post_save, so the spatial index is told directly
+        for location in new_locations:
+            location_index.add(location)
+        return [existing[key] for key in keys]
 
     def get_route(self, route_input: RoutePolylineInput) -> RouteResponse:
         return GoogleMapsClient().get_route(route_input=route_input)
 
     @timer()
-    def load_cities_from_file(self):
-        file_name = "cities.csv"
+    def get_routes(
+        self, route_inputs: list[RoutePolylineInput], on_progress: Optional[Callable[[float], None]] = None
+    ) -> list[RouteResponse | None]:
+        # Directions requests run in a bounded thread pool under a shared rate limit.
+        # A route that can't be fetched comes back as None instead of failing the whole batch.
+        client = GoogleMapsClient()
+        rate_limiter = RateLimiter(calls_per_second=self.ROUTE_FETCH_CALLS_PER_SECOND)
+
+        def get_route(route_input: RoutePolylineInput) -> RouteResponse | None:
+            rate_limiter.wait()
+            try:
+                return client.get_route(route_input=route_input)
+            except (
+                googlemaps.exceptions.ApiError,
+                googlemaps.exceptions.TransportError,
+                googlemaps.exceptions.Timeout,
+                IndexError,
+            ) as e:
+                print_red(f"Route {route_input.as_tuple} not fetched: {e!r}")
+                return None
+
+        routes = []
+        with ThreadPoolExecutor(max_workers=self.ROUTE_FETCH_MAX_WORKERS) as executor:
+            for route in executor.map(get_route, route_inputs):
+                routes.append(route)
+                if on_progress:
+                    on_progress(len(routes) / len(route_inputs))
+        return routes
+
+    def load_cities_from_file(self) -> int:
         current_directory = os.path.dirname(os.path.realpath(__file__))
-        df = pd.read_csv(os.path.join(current_directory, file_name))
-
-        for index, row in df.iterrows():
-            if Location.objects.filter(name=row["Name"]).exists():
-                continue
-            Location.objects.create(
-                name=row["Name"],
-                address=row["Name"],
-                country_code=row["Country Code"],
-                latitude=row["Coordinates"].split(",")[0],
-                longitude=row["Coordinates"].split(",")[1],
-            )
+        return GazetteerService().load_cities(os.path.join(current_directory, "cities.csv"))
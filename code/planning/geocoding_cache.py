@@ -0,0 +1,102 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import GeocodingResult, Location
+
+LOCATION_FIELDS = ("name", "address", "country_code", "postcode", "latitude", "longitude")
+
+
+class GeocodingCache:
+    # Search results by normalised query: an in-memory LRU of `capacity` entries in front of the GeocodingResult
+    # table, which is pruned to `max_rows` rows. Entries older than the TTL count as misses. Empty results are cached
+    # too, so a query that finds nothing isn't sent again on every keystroke.
+    PRUNE_EVERY = 100
+
+    def __init__(self, capacity: int, max_rows: int, ttl: timedelta):
+        self.capacity = capacity
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[str, tuple[datetime, list[dict]]] = OrderedDict()
+        self.writes = 0
+        self.memory_hits = 0
+        self.database_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "database_hits": self.database_hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+        }
+
+    def normalise(self, query: str) -> str:
+        # "Tallinn,  Estonia " and "tallinn estonia" are the same search
+        query = unicodedata.normalize("NFKC", query).casefold()
+        return " ".join(re.sub(r"[,;.]", " ", query).split())[: GeocodingResult._meta.get_field("query").max_length]
+
+    def get(self, query: str) -> list[Location] | None:
+        key = self.normalise(query)
+        expires_before = timezone.now() - self.ttl
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] >= expires_before:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return self.get_locations(entry[1])
+
+        stored = GeocodingResult.objects.filter(query=key, created_at__gte=expires_before).first()
+        with self.lock:
+            if stored is None:
+                self.misses += 1
+                return None
+            self.database_hits += 1
+            self.remember(key, stored.created_at, stored.results)
+        return self.get_locations(stored.results)
+
+    def set(self, query: str, locations: list[Location]) -> None:
+        key = self.normalise(query)
+        results = [{field: getattr(location, field) for field in LOCATION_FIELDS} for location in locations]
+        created_at = timezone.now()
+        GeocodingResult.objects.update_or_create(query=key, defaults={"results": results, "created_at": created_at})
+        with self.lock:
+            self.remember(key, created_at, results)
+            self.writes += 1
+            prune = self.writes % self.PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def prune(self) -> None:
+        GeocodingResult.objects.filter(created_at__lt=timezone.now() - self.ttl).delete()
+        oldest_kept = GeocodingResult.objects.order_by("-created_at").values_list("created_at", flat=True)
+        if cutoff := oldest_kept[self.max_rows : self.max_rows + 1].first():
+            GeocodingResult.objects.filter(created_at__lte=cutoff).delete()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.memory_hits = self.database_hits = self.misses = 0
+
+    def remember(self, key: str, created_at: datetime, results: list[dict]) -> None:
+        self.entries[key] = (created_at, results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def get_locations(self, results: list[dict]) -> list[Location]:
+        return [Location(**fields) for fields in results]
+
+
+geocoding_cache = GeocodingCache(
+    capacity=settings.GEOCODING_CACHE_CAPACITY,
+    max_rows=settings.GEOCODING_CACHE_MAX_ROWS,
+    ttl=timedelta(seconds=settings.GEOCODING_CACHE_TTL_SECONDS),
+)
@@ -0,0 +1,318 @@
+import threading
+from typing import Hashable, Iterable, Sequence
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .detour import detour_model
+from .models import Route, Shipment, Transport
+from .optimisation import PlanningOptimisationService
+
+FREE = -1
+
+
+class IncrementalAssignment:
+    # Square min-cost assignment kept together with its dual potentials u (rows) and v (columns), where
+    # cost[i, j] - u[i] - v[j] >= 0 everywhere and == 0 on assigned pairs. Rectangular problems are padded with
+    # zero-cost dummy rows and columns (key None), which are reused when keys are inserted.
+    # Inserting or removing one row or column only breaks one assigned pair, and a single shortest augmenting path
+    # on the reduced costs restores the optimum, instead of solving from scratch.
+    def __init__(self, row_keys: Sequence[Hashable], col_keys: Sequence[Hashable], cost_matrix: np.ndarray):
+        n, m = cost_matrix.shape
+        size = max(n, m)
+        self.cost = np.zeros((size, size))
+        self.cost[:n, :m] = cost_matrix
+        self.row_keys = list(row_keys) + [None] * (size - n)
+        self.col_keys = list(col_keys) + [None] * (size - m)
+
+        _, self.row_to_col = linear_sum_assignment(self.cost)
+        self.col_to_row = np.empty(size, dtype=np.intp)
+        self.col_to_row[self.row_to_col] = np.arange(size)
+        self.u, self.v = self.get_potentials()
+
+    def __len__(self) -> int:
+        return len(self.row_keys)
+
+    @property
+    def assignment(self) -> list[tuple[Hashable, Hashable, float]]:
+        return [
+            (self.row_keys[i], self.col_keys[j], self.cost[i, j])
+            for i, j in enumerate(self.row_to_col)
+            if self.row_keys[i] is not None and self.col_keys[j] is not None
+        ]
+
+    def get_potentials(self) -> tuple[np.ndarray, np.ndarray]:
+        # For an optimal assignment the column potentials are shortest distances over edges
+        # row_to_col[i] -> j weighted cost[i, j] - cost[i, row_to_col[i]], found by vectorised Bellman-Ford.
+        rows = np.arange(len(self))
+        assigned_cost = self.cost[rows, self.row_to_col]
+        v = np.zeros(len(self))
+        for _ in range(len(self)):
+            relaxed = np.minimum(v, ((v[self.row_to_col] - assigned_cost)[:, np.newaxis] + self.cost).min(axis=0))
+            if np.array_equal(relaxed, v):
+                break
+            v = relaxed
+        return assigned_cost - v[self.row_to_col], v
+
+    def insert_row(self, key: Hashable, costs: np.ndarray) -> None:
+        # costs of the new row against the current column keys, ignoring dummy columns
+        i = self.get_dummy_slot(self.row_keys)
+        self.row_keys[i] = key
+        self.cost[i] = self.get_aligned(costs, self.col_keys)
+        self.u[i] = (self.cost[i] - self.v).min()
+        self.reassign_row(i)
+
+    def insert_col(self, key: Hashable, costs: np.ndarray) -> None:
+        # costs of the new column against the current row keys, ignoring dummy rows
+        j = self.get_dummy_slot(self.col_keys)
+        self.col_keys[j] = key
+        self.cost[:, j] = self.get_aligned(costs, self.row_keys)
+        self.v[j] = (self.cost[:, j] - self.u).min()
+        self.reassign_row(self.col_to_row[j])
+
+    def remove_row(self, key: Hashable) -> None:
+        # Dummies may only ever pad one side, otherwise real rows would be assigned to free dummy columns.
+        # So the row is cut out together with a dummy column when there is one, else it becomes a dummy itself.
+        i = self.row_keys.index(key)
+        if None in self.col_keys:
+            dummy = self.row_to_col[i] if self.col_keys[self.row_to_col[i]] is None else self.col_keys.index(None)
+            self.cut(rows=[i], cols=[dummy])
+            return
+        self.row_keys[i] = None
+        self.cost[i] = 0
+        self.u[i] = (self.cost[i] - self.v).min()
+        self.reassign_row(i)
+
+    def remove_col(self, key: Hashable) -> None:
+        j = self.col_keys.index(key)
+        if None in self.row_keys:
+            dummy = self.col_to_row[j] if self.row_keys[self.col_to_row[j]] is None else self.row_keys.index(None)
+            self.cut(rows=[dummy], cols=[j])
+            return
+        self.col_keys[j] = None
+        self.cost[:, j] = 0
+        self.v[j] = (self.cost[:, j] - self.u).min()
+        self.reassign_row(self.col_to_row[j])
+
+    def drop_assigned(self, row_keys: set[Hashable], col_keys: set[Hashable]) -> None:
+        # Rows and columns leaving the problem together with their assigned partner are cut out in one go
+        rows = [
+            i
+            for i, key in enumerate(self.row_keys)
+            if key in row_keys and self.col_keys[self.row_to_col[i]] in col_keys
+        ]
+        self.cut(rows=rows, cols=self.row_to_col[rows])
+
+    def cut(self, rows: Sequence[int], cols: Sequence[int]) -> None:
+        # Deletes as many rows as columns. The rest keeps feasible potentials, so rows whose assigned column was
+        # deleted only need an augmenting path each to the columns left free.
+        if not len(rows):
+            return
+        keep_rows = np.setdiff1d(np.arange(len(self)), rows)
+        keep_cols = np.setdiff1d(np.arange(len(self)), cols)
+        row_position = np.full(len(self), FREE, dtype=np.intp)
+        row_position[keep_rows] = np.arange(len(keep_rows))
+        col_position = np.full(len(self), FREE, dtype=np.intp)
+        col_position[keep_cols] = np.arange(len(keep_cols))
+
+        self.cost = self.cost[np.ix_(keep_rows, keep_cols)]
+        self.row_keys = [self.row_keys[i] for i in keep_rows]
+        self.col_keys = [self.col_keys[j] for j in keep_cols]
+        self.u, self.v = self.u[keep_rows], self.v[keep_cols]
+        self.row_to_col = col_position[self.row_to_col[keep_rows]]
+        self.col_to_row = row_position[self.col_to_row[keep_cols]]
+
+        for i in np.flatnonzero(self.row_to_col == FREE):
+            self.augment(i)
+
+    def get_dummy_slot(self, keys: list[Hashable]) -> int:
+        if None not in keys:
+            self.grow()
+        return keys.index(None)
+
+    def get_dummy_mask(self, keys: list[Hashable]) -> np.ndarray:
+        return np.array([key is None for key in keys], dtype=bool)
+
+    def get_aligned(self, costs: np.ndarray, keys: list[Hashable]) -> np.ndarray:
+        # Spreads costs given for the non-dummy keys, in order, over all slots; dummy slots cost nothing
+        aligned = np.zeros(len(keys))
+        aligned[~self.get_dummy_mask(keys)] = costs
+        return aligned
+
+    def grow(self) -> None:
+        # Adds a dummy row and a dummy column, assigned to each other through one augmenting path
+        size = len(self) + 1
+        cost = np.zeros((size, size))
+        cost[:-1, :-1] = self.cost
+        self.cost = cost
+        self.row_keys.append(None)
+        self.col_keys.append(None)
+        self.v = np.append(self.v, (self.cost[:-1, -1] - self.u).min(initial=0))
+        self.u = np.append(self.u, (self.cost[-1] - self.v).min())
+        self.row_to_col = np.append(self.row_to_col, FREE)
+        self.col_to_row = np.append(self.col_to_row, FREE)
+        self.augment(size - 1)
+
+    def reassign_row(self, i: int) -> None:
+        j = self.row_to_col[i]
+        self.row_to_col[i] = FREE
+        self.col_to_row[j] = FREE
+        self.augment(i)
+
+    def augment(self, free_row: int) -> None:
+        # Dijkstra on reduced costs from free_row to the free column, then potentials are updated so reduced
+        # costs stay non-negative and the path is flipped into the assignment.
+        size = len(self)
+        shortest = np.full(size, np.inf)
+        path = np.full(size, FREE, dtype=np.intp)
+        scanned_cols = np.zeros(size, dtype=bool)
+        scanned_rows = []
+        i, min_value, sink = free_row, 0.0, FREE
+
+        while sink == FREE:
+            scanned_rows.append(i)
+            reduced = min_value + self.cost[i] - self.u[i] - self.v
+            improved = ~scanned_cols & (reduced < shortest)
+            shortest[improved] = reduced[improved]
+            path[improved] = i
+
+            remaining = np.flatnonzero(~scanned_cols)
+            j = remaining[np.argmin(shortest[remaining])]
+            min_value = shortest[j]
+            scanned_cols[j] = True
+            if self.col_to_row[j] == FREE:
+                sink = j
+            else:
+                i = self.col_to_row[j]
+
+        self.u[free_row] += min_value
+        for i in scanned_rows[1:]:
+            self.u[i] += min_value - shortest[self.row_to_col[i]]
+        self.v[scanned_cols] -= min_value - shortest[scanned_cols]
+
+        j = sink
+        while True:
+            i = path[j]
+            self.col_to_row[j] = i
+            self.row_to_col[i], j = j, self.row_to_col[i]
+            if i == free_row:
+                break
+
+
+class IncrementalPlanner:
+    # Keeps the last assignment of unplanned transports and shipments in the process. On the next optimisation
+    # it is synced with the current unplanned sets: added or removed entities are repaired one augmenting path
+    # each, and the problem is only solved from scratch when a large share of it changed, or when the costs did:
+    # routes added or removed between locations still in the matrix, or a refitted detour model. Routes fetched
+    # for the pairs just planned don't count, those leave the matrix with their transport and shipment.
+    # The cost matrix is dense and square, PlanningService only uses this below SPARSE_MIN_PAIRS.
+    REBUILD_FRACTION = 0.1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.assignment: IncrementalAssignment | None = None
+        self.max_empty_km: int | None = None
+        self.routes: set[tuple] = set()
+        self.detour_fitted_at = None
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.assignment = None
+
+    def optimal_resource_allocation(
+        self, transports: Sequence[Transport], shipments: Sequence[Shipment], max_empty_km: int
+    ) -> dict[Transport, Shipment]:
+        # Entities are keyed with their location, so a moved transport or shipment counts as removed and re-added
+        transports = {(transport, transport.location_id): transport for transport in transports}
+        shipments = {(shipment, shipment.location_id): shipment for shipment in shipments}
+
+        with self.lock:
+            detour_model.get_knots()
+            if (
+                self.assignment is None
+                or self.max_empty_km != max_empty_km
+                or self.detour_fitted_at != detour_model.fitted_at
+                or self.get_routes_changed(transports, shipments)
+            ):
+                self.rebuild(transports, shipments, max_empty_km)
+            else:
+                self.sync(transports, shipments)
+            self.routes = self.get_routes(
+                self.get_locations(self.assignment.row_keys), self.get_locations(self.assignment.col_keys)
+            )
+            self.detour_fitted_at = detour_model.fitted_at
+
+            return {
+                transport: shipment
+                for (transport, _), (shipment, _), cost in self.assignment.assignment
+                if cost <= max_empty_km
+            }
+
+    def get_routes_changed(self, transports: dict, shipments: dict) -> bool:
+        # Compares the routes between the locations that stay in the matrix with those it was last built with
+        start_ids = self.get_locations(key for key in self.assignment.row_keys if key in transports)
+        end_ids = self.get_locations(key for key in self.assignment.col_keys if key in shipments)
+        known_routes = {route for route in self.routes if route[0] in start_ids and route[1] in end_ids}
+        return self.get_routes(start_ids, end_ids) != known_routes
+
+    def get_routes(self, start_ids: set, end_ids: set) -> set[tuple]:
+        # (start, end, distance_km) of the routes the cost matrix prices, the smaller side filters in SQL
+        if not start_ids or not end_ids:
+            return set()
+        routes = Route.objects.filter(distance_km__isnull=False)
+        if len(start_ids) <= len(end_ids):
+            routes = routes.filter(location_start__in=start_ids)
+        else:
+            routes = routes.filter(location_end__in=end_ids)
+        return {
+            route
+            for route in routes.values_list("location_start", "location_end", "distance_km")
+            if route[0] in start_ids and route[1] in end_ids
+        }
+
+    def get_locations(self, keys: Iterable) -> set:
+        return {key[1] for key in keys if key is not None and key[1] is not None}
+
+    def rebuild(self, transports: dict, shipments: dict, max_empty_km: int) -> None:
+        cost_matrix = PlanningOptimisationService().get_cost_matrix(
+            transports=list(transports.values()), shipments=list(shipments.values()), max_empty_km=max_empty_km
+        )
+        self.assignment = IncrementalAssignment(list(transports), list(shipments), cost_matrix)
+        self.max_empty_km = max_empty_km
+
+    def sync(self, transports: dict, shipments: dict) -> None:
+        assignment = self.assignment
+        known_rows = {key for key in assignment.row_keys if key is not None}
+        known_cols = {key for key in assignment.col_keys if key is not None}
+        removed_rows, added_rows = known_rows - transports.keys(), transports.keys() - known_rows
+        removed_cols, added_cols = known_cols - shipments.keys(), shipments.keys() - known_cols
+
+        assignment.drop_assigned(removed_rows, removed_cols)
+        removed_rows &= set(assignment.row_keys)
+        removed_cols &= set(assignment.col_keys)
+
+        changes = len(removed_rows) + len(added_rows) + len(removed_cols) + len(added_cols)
+        if changes > self.REBUILD_FRACTION * max(len(transports), len(shipments), 1):
+            self.rebuild(transports, shipments, self.max_empty_km)
+            return
+
+        for key in removed_rows:
+            assignment.remove_row(key)
+        for key in removed_cols:
+            assignment.remove_col(key)
+        service = PlanningOptimisationService()
+        for key in added_rows:
+            cols = [shipments[col_key] for col_key in assignment.col_keys if col_key is not None]
+            costs = service.get_cost_matrix(
+                transports=[transports[key]], shipments=cols, max_empty_km=self.max_empty_km
+            )
+            assignment.insert_row(key, costs[0])
+        for key in added_cols:
+            rows = [transports[row_key] for row_key in assignment.row_keys if row_key is not None]
+            costs = service.get_cost_matrix(
+                transports=rows, shipments=[shipments[key]], max_empty_km=self.max_empty_km
+            )
+            assignment.insert_col(key, costs[:, 0])
+
+
+incremental_planner = IncrementalPlanner()
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import Job, Planning
+from .service import PlanningService
+from .types import JobKind, JobStatus, SolverStrategy
+from utils import print_red
+
+Progress = Callable[[float], None]
+
+
+class JobService:
+    # Jobs are stored in the database and run on a small in-process thread pool, so long optimisations and route
+    # backfills don't hold up the request that started them. Pages poll the job row for status and progress.
+    # A single worker runs jobs one after another, so two optimisations never plan the same transport twice.
+    MAX_WORKERS = 1
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="planning-job")
+
+    def enqueue(self, kind: JobKind, **payload) -> Job:
+        job = Job.objects.create(kind=kind.value, payload=payload)
+        transaction.on_commit(lambda: self.executor.submit(self.run_in_worker, job.id))
+        return job
+
+    def fail_interrupted(self, started_at: datetime) -> int:
+        # Jobs run in this process's executor, so unfinished jobs created before it started were lost with the
+        # previous process (a restart or an autoreload) and would otherwise be polled forever
+        unfinished = [JobStatus.PENDING.value, JobStatus.RUNNING.value]
+        return Job.objects.filter(status__in=unfinished, created_at__lt=started_at).update(
+            status=JobStatus.FAILED.value, error="Interrupted by a server restart", finished_at=timezone.now()
+        )
+
+    def get_job(self, job_id: Optional[str]) -> Optional[Job]:
+        return Job.objects.filter(id=job_id).first() if job_id else None
+
+    def is_finished(self, job: Job) -> bool:
+        return JobStatus(job.status).is_finished
+
+    def run_in_worker(self, job_id: str) -> None:
+        close_old_connections()
+        try:
+            self.run(job_id)
+        finally:
+            connection.close()
+
+    def run(self, job_id: str) -> None:
+        job = Job.objects.get(id=job_id)
+        self.update(job, status=JobStatus.RUNNING.value, started_at=timezone.now())
+        try:
+            result = self.get_handler(JobKind(job.kind))(
+                job.payload, lambda progress: self.update(job, progress=progress)
+            )
+        except Exception as e:
+            # Whatever went wrong has to end up on the job row, or the polling page would wait forever
+            print_red(f"Job {job.kind} {job.id} failed: {e!r}")
+            self.update(job, status=JobStatus.FAILED.value, error=repr(e), finished_at=timezone.now())
+        else:
+            self.update(job, status=JobStatus.SUCCEEDED.value, progress=1, result=result, finished_at=timezone.now())
+
+    def update(self, job: Job, **fields) -> None:
+        for field, value in fields.items():
+            setattr(job, field, value)
+        job.save(update_fields=list(fields))
+
+    def get_handler(self, kind: JobKind) -> Callable[[dict, Progress], Optional[dict]]:
+        match kind:
+            case JobKind.APPLY_OPTIMAL_PLANNING:
+                return self.apply_optimal_planning
+            case JobKind.FETCH_ROUTES:
+                return self.fetch_routes
+
+    def apply_optimal_planning(self, payload: dict, progress: Progress) -> dict:
+        strategy = SolverStrategy(payload.get("strategy") or SolverStrategy.EXACT.value)
+        result = PlanningService().apply_optimal_planning(
+            max_empty_km=payload.get("max_empty_km"),
+            incremental=payload.get("incremental", False),
+            strategy=strategy,
+            time_budget=payload.get("time_budget"),
+        )
+        progress(0.5)
+        self.fetch_routes(payload, lambda routes_progress: progress(0.5 + routes_progress / 2))
+        summary = {"strategy": strategy.value}
+        if result:
+            summary.update(
+                matched=len(result.row_indices),
+                objective=result.objective,
+                lower_bound=result.lower_bound,
+                gap=result.gap,
+            )
+        return summary
+
+    def fetch_routes(self, payload: dict, progress: Progress) -> None:
+        plannings = Planning.objects.filter(route__isnull=True).select_related(
+            "transport__location", "shipment__location"
+        )
+        PlanningService().request_routes(list(plannings), on_progress=progress)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from planning.gazetteer import GazetteerService
+
+
+class Command(BaseCommand):
+    help = "Seed locations from a cities.csv export or a tab-separated GeoNames dump"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--geonames", action="store_true", help="The file is a GeoNames dump, e.g. LV.txt")
+
+    def handle(self, *args, **options):
+        service = GazetteerService()
+        if options["geonames"]:
+            created = service.load_geonames(options["path"])
+        else:
+            created = service.load_cities(options["path"])
+        self.stdout.write(f"Created {created} locations")
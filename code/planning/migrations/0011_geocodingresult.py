@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:59
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("planning", "0010_job"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodingResult",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("query", models.CharField(max_length=300, unique=True)),
+                ("results", models.JSONField(default=list)),
+                ("created_at", models.DateTimeField()),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:04
+
+import json
+
+from django.db import migrations, models
+
+from planning import polyline_codec
+
+BATCH_SIZE = 500
+
+
+def pack_polylines(apps, schema_editor):
+    Route = apps.get_model("planning", "Route")
+    routes = Route.objects.filter(polyline_packed__isnull=True).exclude(polyline="").only("id", "polyline")
+    batch = []
+    for route in routes.iterator(chunk_size=BATCH_SIZE):
+        route.polyline_packed = polyline_codec.pack(json.loads(route.polyline))
+        route.polyline = ""
+        batch.append(route)
+        if len(batch) == BATCH_SIZE:
+            Route.objects.bulk_update(batch, ["polyline", "polyline_packed"])
+            batch = []
+    Route.objects.bulk_update(batch, ["polyline", "polyline_packed"])
+
+
+def unpack_polylines(apps, schema_editor):
+    Route = apps.get_model("planning", "Route")
+    routes = Route.objects.filter(polyline_packed__isnull=False).only("id", "polyline_packed")
+    batch = []
+    for route in routes.iterator(chunk_size=BATCH_SIZE):
+        route.polyline = json.dumps(polyline_codec.unpack(route.polyline_packed).tolist())
+        route.polyline_packed = None
+        batch.append(route)
+        if len(batch) == BATCH_SIZE:
+            Route.objects.bulk_update(batch, ["polyline", "polyline_packed"])
+            batch = []
+    Route.objects.bulk_update(batch, ["polyline", "polyline_packed"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("planning", "0011_geocodingresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="polyline_packed",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="route",
+            name="polyline",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(pack_polylines, unpack_polylines),
+    ]
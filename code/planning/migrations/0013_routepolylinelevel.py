@@ -0,0 +1,34 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:05
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("planning", "0012_route_polyline_packed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoutePolylineLevel",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("level", models.PositiveSmallIntegerField()),
+                ("polyline_packed", models.BinaryField()),
+                (
+                    "route",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="polyline_levels",
+                        to="planning.route",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="routepolylinelevel",
+            constraint=models.UniqueConstraint(fields=("route", "level"), name="unique_route_polyline_level"),
+        ),
+    ]
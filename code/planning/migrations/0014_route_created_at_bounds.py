@@ -0,0 +1,65 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:07
+
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+from planning import polyline_codec
+
+BATCH_SIZE = 500
+BOUNDS_FIELDS = ["south", "west", "north", "east"]
+
+
+def set_bounds(apps, schema_editor):
+    Route = apps.get_model("planning", "Route")
+    routes = Route.objects.only("id", "polyline", "polyline_packed")
+    batch = []
+    for route in routes.iterator(chunk_size=BATCH_SIZE):
+        if route.polyline_packed is not None:
+            coordinates = polyline_codec.unpack(route.polyline_packed)
+        else:
+            coordinates = np.asarray(json.loads(route.polyline or "[]"), dtype=np.float64).reshape(-1, 2)
+        if not len(coordinates):
+            continue
+        (route.south, route.west), (route.north, route.east) = coordinates.min(axis=0), coordinates.max(axis=0)
+        batch.append(route)
+        if len(batch) == BATCH_SIZE:
+            Route.objects.bulk_update(batch, BOUNDS_FIELDS)
+            batch = []
+    Route.objects.bulk_update(batch, BOUNDS_FIELDS)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("planning", "0013_routepolylinelevel"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="route",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="east",
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="north",
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="south",
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="route",
+            name="west",
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunPython(set_bounds, migrations.RunPython.noop),
+    ]
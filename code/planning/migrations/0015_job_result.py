@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("planning", "0014_route_created_at_bounds"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="job",
+            name="result",
+            field=models.JSONField(null=True),
+        ),
+    ]
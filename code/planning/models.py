@@ -1,7 +1,12 @@
 import json
 import uuid
 
+import numpy as np
 from django.db import models
+from django.utils.functional import cached_property
+
+from . import polyline_codec
+from .planning_cache import planning_cache
 
 
 class BaseModel(models.Model):
@@ -83,6 +88,7 @@ class Transport(BaseModel):
 
     def unassign_shipment(self, shipment: Shipment):
         Planning.objects.filter(shipment=shipment, transport=self).delete()
+        planning_cache.invalidate_on_commit()
 
     @property
     def planned_shipment(self):
@@ -93,12 +99,50 @@ class Transport(BaseModel):
 class Route(BaseModel):
     location_start = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="route_start", null=True)
     location_end = models.ForeignKey(Location, on_delete=models.CASCADE, related_name="route_end", null=True)
-    polyline = models.TextField()
+    # Legacy JSON geometry, new routes keep it empty and store polyline_packed (see polyline_codec)
+    polyline = models.TextField(blank=True, default="")
+    polyline_packed = models.BinaryField(null=True)
     distance_km = models.FloatField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, null=True)
+    # Bounding box of the geometry, for map viewport queries
+    south = models.FloatField(null=True)
+    west = models.FloatField(null=True)
+    north = models.FloatField(null=True)
+    east = models.FloatField(null=True)
+
+    @cached_property
+    def coordinates(self) -> np.ndarray:
+        if self.polyline_packed is not None:
+            return polyline_codec.unpack(self.polyline_packed)
+        if self.polyline:
+            return np.asarray(json.loads(self.polyline), dtype=np.float64).reshape(-1, 2)
+        return np.empty((0, 2))
 
     @property
     def polyline_array(self):
-        return json.loads(self.polyline)
+        return self.coordinates.tolist()
+
+    def set_coordinates(self, coordinates: np.ndarray) -> None:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.polyline = ""
+        self.polyline_packed = polyline_codec.pack(coordinates)
+        if len(coordinates):
+            (self.south, self.west), (self.north, self.east) = coordinates.min(axis=0), coordinates.max(axis=0)
+        self.__dict__.pop("coordinates", None)
+
+
+class RoutePolylineLevel(BaseModel):
+    # Simplified geometry of a route for one map zoom band (see simplification)
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name="polyline_levels")
+    level = models.PositiveSmallIntegerField()
+    polyline_packed = models.BinaryField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["route", "level"], name="unique_route_polyline_level")]
+
+    @cached_property
+    def coordinates(self) -> np.ndarray:
+        return polyline_codec.unpack(self.polyline_packed)
 
 
 class Planning(BaseModel):
@@ -108,3 +152,21 @@ class Planning(BaseModel):
 
     def __str__(self):
         return f"Transport: {self.transport.name} - Shipment: {self.shipment.name}"
+
+
+class Job(BaseModel):
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, default="pending")
+    progress = models.FloatField(default=0)
+    error = models.TextField(null=True)
+    result = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+
+class GeocodingResult(BaseModel):
+    query = models.CharField(max_length=300, unique=True)
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField()
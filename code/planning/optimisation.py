@@ -1,77 +1,362 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from functools import partial
+from typing import Callable, Optional, Sequence
+from uuid import UUID
+
 import numpy as np
-from django.db.models import QuerySet, Q
 from scipy.optimize import linear_sum_assignment
 
-from .models import Route, Shipment, Transport
+from . import assignment
+from .detour import detour_model
+from .distance import haversine_matrix
+from .distance_cache import distance_cache
+from .models import Location, Route, Shipment, Transport
+from .spatial_index import SpatialIndex
+from .types import SolverStrategy
+from django.conf import settings
+from django.db.models import QuerySet
 from utils import timer
-from typing import Dict
-from uuid import UUID
 
 import rust_extensions
 
-ExistingRouteDistances = Dict[tuple[UUID, UUID], int]
+# (start location id, end location id, distance km)
+ExistingRouteDistances = list[tuple[UUID, UUID, float]]
+# (pairs, n, m, infeasible cost), picklable so it can run in a worker process
+Solver = Callable[[assignment.Pairs, int, int, float], assignment.AssignmentResult]
 
 
 class PlanningOptimisationService:
     DEFAULT_MAX_EMPTY_KM = 3_000
+    INFEASIBLE_COST = 1_000_000
+    # Above this many transport x shipment pairs only pairs within max_empty_km are materialised
+    SPARSE_MIN_PAIRS = 250_000
+    # Components of the feasibility graph with this many pairs are worth a worker process
+    PARALLEL_MIN_PAIRS = 50_000
+    # Route lookups of candidate pairs bind at most this many location ids per query, below SQLite's limit
+    ROUTE_LOOKUP_MAX_PARAMS = 10_000
 
-    @timer()
     def optimal_resource_allocation(
-        self, transports: QuerySet[Transport], shipments: QuerySet[Shipment], max_empty_km: int = None
+        self,
+        transports: QuerySet[Transport],
+        shipments: QuerySet[Shipment],
+        max_empty_km: int = None,
+        sparse: bool = None,
+        strategy: SolverStrategy = SolverStrategy.EXACT,
+        deadline: float = None,
     ) -> dict[Transport, Shipment]:
+        allocation, _ = self.get_allocation(transports, shipments, max_empty_km, sparse, strategy, deadline)
+        return allocation
+
+    @timer()
+    def get_allocation(
+        self,
+        transports: QuerySet[Transport],
+        shipments: QuerySet[Shipment],
+        max_empty_km: int = None,
+        sparse: bool = None,
+        strategy: SolverStrategy = SolverStrategy.EXACT,
+        deadline: float = None,
+    ) -> tuple[dict[Transport, Shipment], assignment.AssignmentResult]:
+        # The allocation together with its objective and lower bound. The anytime strategy stops improving at the
+        # deadline (time.time()), OPTIMISATION_TIME_BUDGET_SECONDS from now by default.
+        if strategy == SolverStrategy.ANYTIME and deadline is None:
+            deadline = time.time() + settings.OPTIMISATION_TIME_BUDGET_SECONDS
         max_empty_km = max_empty_km or self.DEFAULT_MAX_EMPTY_KM
-        cost_matrix = self.get_cost_matrix(transports=transports, shipments=shipments, max_empty_km=max_empty_km)
-        row_indices, col_indices = self.get_linear_sum_assignment(cost_matrix)
+        transports = list(transports.select_related("location"))
+        shipments = list(shipments.select_related("location"))
+        if sparse is None:
+            sparse = len(transports) * len(shipments) >= self.SPARSE_MIN_PAIRS
+
+        if sparse:
+            rows, cols, distances = self.get_candidate_pairs(
+                transports=transports, shipments=shipments, max_empty_km=max_empty_km
+            )
+        else:
+            cost_matrix = self.get_cost_matrix(transports=transports, shipments=shipments, max_empty_km=max_empty_km)
+            rows, cols = np.nonzero(cost_matrix < self.INFEASIBLE_COST)
+            distances = cost_matrix[rows, cols]
+        result = self.get_decomposed_assignment(
+            (rows, cols, distances), n=len(transports), m=len(shipments), strategy=strategy, deadline=deadline
+        )
 
         allocation = {}
-        for i, j in zip(row_indices, col_indices):
-            if cost_matrix[i][j] > max_empty_km:
-                continue
+        for i, j in zip(result.row_indices, result.col_indices):
             allocation[transports[int(i)]] = shipments[int(j)]
 
-        return allocation
+        return allocation, result
 
     def get_linear_sum_assignment(self, cost_matrix) -> tuple[np.ndarray, np.ndarray]:
         # Use the Hungarian algorithm to find the optimal assignment.
         row_indices, col_indices = linear_sum_assignment(cost_matrix)
         return row_indices, col_indices
 
+    def get_solver(self, strategy: SolverStrategy) -> Solver:
+        match strategy:
+            case SolverStrategy.EXACT:
+                return partial(assignment.solve, sparse_min_pairs=self.SPARSE_MIN_PAIRS)
+            case SolverStrategy.GREEDY:
+                return assignment.solve_greedy
+
+    @timer()
+    def get_decomposed_assignment(
+        self,
+        pairs: assignment.Pairs,
+        n: int,
+        m: int,
+        strategy: SolverStrategy = SolverStrategy.EXACT,
+        deadline: float = None,
+    ) -> assignment.AssignmentResult:
+        # With a max_empty_km cut-off, distant regions can never be matched with each other. Every connected
+        # component of the feasibility graph is solved on its own, so solve time grows with the largest region
+        # instead of the whole fleet. Several large components are solved in parallel processes.
+        # The deadline (time.time()) is for the anytime strategy.
+        components = assignment.get_components(pairs, n, m)
+        solve_args = [
+            (local_pairs, len(rows), len(cols), self.INFEASIBLE_COST) for rows, cols, local_pairs in components
+        ]
+        large = [
+            i for i, (_, _, local_pairs) in enumerate(components) if len(local_pairs[0]) >= self.PARALLEL_MIN_PAIRS
+        ]
+        workers = min(settings.ASSIGNMENT_WORKERS, len(large))
+
+        if strategy == SolverStrategy.ANYTIME:
+            solutions = self.solve_anytime(solve_args, large, deadline)
+        elif workers > 1:
+            # Workers are spawned rather than forked, forking a server process with running threads is unsafe.
+            # Small components are solved here while they work.
+            solver = self.get_solver(strategy)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {i: executor.submit(solver, *solve_args[i]) for i in large}
+                solutions = {i: solver(*solve_args[i]) for i in range(len(components)) if i not in futures}
+                solutions.update({i: future.result() for i, future in futures.items()})
+        else:
+            solver = self.get_solver(strategy)
+            solutions = {i: solver(*args) for i, args in enumerate(solve_args)}
+
+        # Rows without any feasible pair stay unmatched whatever the solver
+        isolated_rows = n - sum(len(rows) for rows, _, _ in components)
+        return assignment.AssignmentResult.merge(
+            [solutions[i] for i in range(len(components))],
+            row_maps=[rows for rows, _, _ in components],
+            col_maps=[cols for _, cols, _ in components],
+            fixed_cost=self.INFEASIBLE_COST * isolated_rows,
+        )
+
+    def solve_anytime(
+        self, solve_args: list[tuple], large: list[int], deadline: float
+    ) -> dict[int, assignment.AssignmentResult]:
+        # Greedy first, so every component has an allocation however short the time. Then components are solved
+        # exactly, largest first, until the deadline: small ones here, large ones in worker processes that are
+        # stopped at the deadline, while local search improves their greedy allocation here. A large component whose
+        # exact solve doesn't finish in time keeps the local search result.
+        solutions = {i: assignment.solve_greedy(*args) for i, args in enumerate(solve_args)}
+        if time.time() >= deadline:
+            return solutions
+
+        exact = self.get_solver(SolverStrategy.EXACT)
+        by_size = sorted(solutions, key=lambda i: len(solve_args[i][0][0]), reverse=True)
+        large = [i for i in by_size if i in large]
+        pool = None
+        if large:
+            workers = min(settings.ASSIGNMENT_WORKERS, len(large))
+            pool = multiprocessing.get_context("spawn").Pool(workers)
+        try:
+            pending = {i: pool.apply_async(exact, solve_args[i]) for i in large}
+            for i in by_size:
+                if i not in pending and time.time() < deadline:
+                    solutions[i] = exact(*solve_args[i])
+            for i in large:
+                solutions[i] = assignment.improve_by_swaps(*solve_args[i], solutions[i], deadline)
+            for i in large:
+                with suppress(multiprocessing.TimeoutError):
+                    solutions[i] = pending[i].get(timeout=max(deadline - time.time(), 0))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return solutions
+
+    @timer()
+    def get_candidate_pairs(
+        self, transports: Sequence[Transport], shipments: Sequence[Shipment], max_empty_km: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Road distance is never shorter than great-circle distance, so pruning on the latter keeps every
+        # feasible pair. Returns transport indices, shipment indices and estimated road distances of the candidate
+        # pairs.
+        transport_location_ids, transport_inverse, transport_coordinates = self.get_unique_locations(
+            [transport.location for transport in transports]
+        )
+        shipment_location_ids, shipment_inverse, shipment_coordinates = self.get_unique_locations(
+            [shipment.location for shipment in shipments]
+        )
+
+        transport_valid = np.flatnonzero(~np.isnan(transport_coordinates[transport_inverse]).any(axis=1))
+        shipment_valid = np.flatnonzero(~np.isnan(shipment_coordinates[shipment_inverse]).any(axis=1))
+        transport_index = SpatialIndex(transport_valid, transport_coordinates[transport_inverse[transport_valid]])
+        shipment_index = SpatialIndex(shipment_valid, shipment_coordinates[shipment_inverse[shipment_valid]])
+
+        rows, cols, distances = transport_index.query_pairs(shipment_index, max_km=max_empty_km)
+        rows, cols = transport_valid[rows], shipment_valid[cols]
+        distances = np.rint(detour_model.apply(distances))
+
+        # Only the routes of candidate location pairs are fetched, by exact pair
+        width = len(shipment_location_ids)
+        pair_codes = transport_inverse[rows] * width + shipment_inverse[cols]
+        unique_codes = np.unique(pair_codes)
+        route_rows, route_cols, route_distances = self.get_existing_route_indices(
+            transport_location_ids, shipment_location_ids, pairs=(unique_codes // width, unique_codes % width)
+        )
+        if len(route_distances):
+            route_codes = route_rows * width + route_cols
+            order = np.argsort(route_codes)
+            route_codes, route_distances = route_codes[order], route_distances[order]
+
+            positions = np.minimum(np.searchsorted(route_codes, pair_codes), len(route_codes) - 1)
+            known = route_codes[positions] == pair_codes
+            distances[known] = route_distances[positions[known]]
+
+        feasible = distances < max_empty_km
+        return rows[feasible], cols[feasible], distances[feasible]
+
     @timer()
     def get_cost_matrix(
-        self, transports: QuerySet[Transport], shipments: QuerySet[Shipment], max_empty_km: int
+        self, transports: Sequence[Transport], shipments: Sequence[Shipment], max_empty_km: int
     ) -> np.ndarray:
-        existing_route_distances = self.get_existing_routes(transports, shipments)
-        transport_locations = transports.values_list("location__id", flat=True)
-        shipment_locations = shipments.values_list("location__id", flat=True)
+        # Distances are computed once per distinct location pair and then expanded to the full matrix,
+        # so fleets parked at the same depot don't multiply the work. Pairs without a known route are priced at
+        # the estimated road distance.
+        transport_location_ids, transport_inverse, transport_coordinates = self.get_unique_locations(
+            [transport.location for transport in transports]
+        )
+        shipment_location_ids, shipment_inverse, shipment_coordinates = self.get_unique_locations(
+            [shipment.location for shipment in shipments]
+        )
 
-        cost_matrix = np.zeros((len(transports), len(shipments)))
+        distances = self.get_great_circle_distances(
+            transport_location_ids, transport_coordinates, shipment_location_ids, shipment_coordinates
+        )
+        distances = np.rint(detour_model.apply(distances))
 
-        for i, transport_location in enumerate(transport_locations):
-            for j, shipment_location in enumerate(shipment_locations):
-                key = (transport_location, shipment_location)
-                if existing_route_distance := existing_route_distances.get(key):
-                    distance_km = existing_route_distance
-                else:
-                    distance_km = self.calculate_distance_rust(transports[i], shipments[j])
+        route_rows, route_cols, route_distances = self.get_existing_route_indices(
+            transport_location_ids, shipment_location_ids
+        )
+        distances[route_rows, route_cols] = route_distances
 
-                cost_matrix[i, j] = distance_km if distance_km < max_empty_km else 1_000_000
+        distances[np.isnan(distances) | (distances >= max_empty_km)] = self.INFEASIBLE_COST
+        return distances[np.ix_(transport_inverse, shipment_inverse)]
 
-        return cost_matrix
+    def get_great_circle_distances(
+        self,
+        transport_location_ids: Sequence[UUID],
+        transport_coordinates: np.ndarray,
+        shipment_location_ids: Sequence[UUID],
+        shipment_coordinates: np.ndarray,
+    ) -> np.ndarray:
+        distances = distance_cache.lookup(transport_location_ids, shipment_location_ids).astype(np.float64)
+
+        missing_rows = np.flatnonzero(np.isnan(distances).any(axis=1))
+        if len(missing_rows):
+            missing_distances = haversine_matrix(
+                transport_coordinates[missing_rows], shipment_coordinates, workers=settings.COST_MATRIX_WORKERS
+            )
+            distances[missing_rows] = np.rint(missing_distances)
+            distance_cache.store(
+                [transport_location_ids[i] for i in missing_rows], shipment_location_ids, distances[missing_rows]
+            )
+        return distances
+
+    def get_unique_locations(self, locations: Sequence[Location | None]) -> tuple[list, np.ndarray, np.ndarray]:
+        location_ids = []
+        location_index = {}
+        coordinates = []
+        inverse = np.empty(len(locations), dtype=np.intp)
+
+        for i, location in enumerate(locations):
+            location_id = location.id if location else None
+            if location_id not in location_index:
+                location_index[location_id] = len(location_ids)
+                location_ids.append(location_id)
+                coordinates.append(location.coordinates if location else (np.nan, np.nan))
+            inverse[i] = location_index[location_id]
+
+        return location_ids, inverse, np.array(coordinates, dtype=np.float64).reshape(-1, 2)
+
+    def get_existing_route_indices(
+        self,
+        transport_location_ids: Sequence[UUID],
+        shipment_location_ids: Sequence[UUID],
+        pairs: Optional[tuple[np.ndarray, np.ndarray]] = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Known route distances as (row, column, distance) arrays indexing into the given location id lists, ready
+        # to scatter into a matrix. Without pairs every row x column pair is looked up, otherwise only the given
+        # (row, column) index pairs are.
+        if pairs is None:
+            existing_routes = self.get_existing_routes(transport_location_ids, shipment_location_ids)
+        else:
+            existing_routes = self.get_existing_pair_routes(transport_location_ids, shipment_location_ids, *pairs)
+        if not existing_routes:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+        transport_index = {location_id: i for i, location_id in enumerate(transport_location_ids)}
+        shipment_index = {location_id: j for j, location_id in enumerate(shipment_location_ids)}
+        starts, ends, distances = zip(*existing_routes)
+        rows = np.fromiter(map(transport_index.__getitem__, starts), dtype=np.intp, count=len(starts))
+        cols = np.fromiter(map(shipment_index.__getitem__, ends), dtype=np.intp, count=len(ends))
+        return rows, cols, np.array(distances, dtype=np.float64)
 
     @timer()
     def get_existing_routes(
-        self, transports: QuerySet[Transport], shipments: QuerySet[Shipment]
+        self, transport_location_ids: Sequence[UUID], shipment_location_ids: Sequence[UUID]
     ) -> ExistingRouteDistances:
+        # Every start x end pair is wanted, as when filling a dense matrix
         existing_routes = Route.objects.filter(
-            Q(location_start__in=transports.values("location")) & Q(location_end__in=shipments.values("location"))
-        ).values("location_start", "location_end", "distance_km")
+            location_start__in=transport_location_ids,
+            location_end__in=shipment_location_ids,
+            distance_km__isnull=False,
+        ).values_list("location_start", "location_end", "distance_km")
+        return list(existing_routes)
+
+    @timer()
+    def get_existing_pair_routes(
+        self,
+        transport_location_ids: Sequence[UUID],
+        shipment_location_ids: Sequence[UUID],
+        rows: np.ndarray,
+        cols: np.ndarray,
+    ) -> ExistingRouteDistances:
+        # Routes of exactly the given (row, column) pairs, not of every start x end combination among them. Routes
+        # are fetched per chunk of distinct starts, narrowed to the chunk's ends when they fit the query, and then
+        # matched against the pairs, so the queries grow with the locations rather than with the pairs.
+        routes = Route.objects.filter(distance_km__isnull=False)
+        if not len(rows) or not routes.exists():
+            return []
 
-        routes_dict: ExistingRouteDistances = {}
-        for route in existing_routes:
-            key = (route["location_start"], route["location_end"])
-            routes_dict[key] = route["distance_km"]
+        width = len(shipment_location_ids)
+        chunk_size = self.ROUTE_LOOKUP_MAX_PARAMS // 2
+        start_rows = np.flatnonzero(np.bincount(rows, minlength=len(transport_location_ids)))
+        candidates = []
+        for offset in range(0, len(start_rows), chunk_size):
+            chunk_rows = start_rows[offset : offset + chunk_size]
+            in_chunk = np.zeros(len(transport_location_ids), dtype=bool)
+            in_chunk[chunk_rows] = True
+            chunk_cols = np.flatnonzero(np.bincount(cols[in_chunk[rows]], minlength=width))
+            chunk_routes = routes.filter(location_start__in=[transport_location_ids[i] for i in chunk_rows])
+            if len(chunk_cols) <= chunk_size:
+                chunk_routes = chunk_routes.filter(location_end__in=[shipment_location_ids[j] for j in chunk_cols])
+            candidates += chunk_routes.values_list("location_start", "location_end", "distance_km")
 
-        return routes_dict
+        transport_index = {location_id: i for i, location_id in enumerate(transport_location_ids)}
+        shipment_index = {location_id: j for j, location_id in enumerate(shipment_location_ids)}
+        candidates = [route for route in candidates if route[1] in shipment_index]
+        if not candidates:
+            return []
+        route_codes = np.array([transport_index[start] * width + shipment_index[end] for start, end, _ in candidates])
+        pair_codes = np.unique(rows * width + cols)
+        positions = np.minimum(np.searchsorted(pair_codes, route_codes), len(pair_codes) - 1)
+        wanted = pair_codes[positions] == route_codes
+        return [route for route, keep in zip(candidates, wanted) if keep]
 
     def calculate_distance_rust(self, transport: Transport, shipment: Shipment) -> int:
         distance_km = rust_extensions.calculate_distance(
@@ -0,0 +1,48 @@
+import uuid
+from typing import Callable, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+T = TypeVar("T")
+
+
+class PlanningCache:
+    # Cache entries derived from the planning state (the snapshot, rendered table fragments) are keyed by a version
+    # token. Every change to plannings, routes, transports, shipments or locations replaces the token, so stale
+    # entries are never read again and simply expire. The token is random rather than a counter, so an evicted
+    # version key can't bring back entries of an older state.
+    VERSION_KEY = "planning:version"
+
+    def __init__(self, timeout: int):
+        self.timeout = timeout
+
+    @property
+    def version(self) -> str:
+        version = cache.get(self.VERSION_KEY)
+        if version is None:
+            cache.add(self.VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.VERSION_KEY)
+        return version
+
+    def invalidate(self) -> None:
+        cache.set(self.VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+    def invalidate_on_commit(self) -> None:
+        # Invalidating before the commit would let a concurrent request cache the old state under the new version.
+        # Once per transaction however many rows it changed, a rollback discards the pending invalidation with it.
+        connection = transaction.get_connection()
+        if connection.in_atomic_block and any(entry[1] == self.invalidate for entry in connection.run_on_commit):
+            return
+        transaction.on_commit(self.invalidate)
+
+    def get_key(self, name: str, version: str = None) -> str:
+        return f"planning:{version or self.version}:{name}"
+
+    def get_or_set(self, name: str, default: Callable[[], T], version: str = None) -> T:
+        # Pass the version read before rendering, so everything rendered in one request shares one state
+        return cache.get_or_set(self.get_key(name, version), default, timeout=self.timeout)
+
+
+planning_cache = PlanningCache(timeout=settings.PLANNING_CACHE_TIMEOUT)
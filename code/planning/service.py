@@ -1,27 +1,54 @@
-from django.db.models import QuerySet, Sum
+import hashlib
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q, QuerySet
 from django.db import transaction
 from utils import timer
-from typing import Optional
+from typing import Callable, Iterable, Optional, Sequence
 
+from . import distance, polyline_codec, simplification
+from .assignment import AssignmentResult
 from .geo_service import GeoService
-from .models import Planning, Route, Shipment, Transport, Location
+from .incremental import incremental_planner
+from .models import Planning, Route, RoutePolylineLevel, Shipment, Transport, Location
 from .optimisation import PlanningOptimisationService
-from .types import RoutePolylineInput, EntityType, PlanningSet, PlanningRequest
+from .planning_cache import planning_cache
+from .spatial_index import location_index
+from .types import (
+    BoundingBox,
+    RoutePolylineInput,
+    RouteResponse,
+    EntityRecord,
+    EntityType,
+    MapExtent,
+    PlanningSet,
+    PlanningRequest,
+    SolverStrategy,
+)
 
 
 class PlanningService:
-    def get_planning_set(self) -> PlanningSet:
-        plannings = Planning.objects.all().prefetch_related("transport", "shipment")
-        self.assign_existing_routes(plannings=plannings.filter(route__isnull=True))
+    BULK_CREATE_BATCH_SIZE = 1_000
+    # Zoom the map opens at when there is something planned
+    DEFAULT_MAP_ZOOM = 6
 
-        routes = Route.objects.filter(id__in=plannings.values_list("route"))
-        planned_transports = Transport.objects.filter(id__in=plannings.values_list("transport"))
-        planned_shipment_ids = planned_transports.values_list("planning__shipment_id", flat=True)
+    def get_planning_set(self) -> PlanningSet:
+        # Loads the whole planning snapshot in a fixed number of queries, independent of fleet size.
+        # Every queryset is evaluated here, so templates and callers iterate cached rows.
+        plannings = Planning.objects.select_related("transport__location", "shipment__location", "route").defer(
+            "route__polyline", "route__polyline_packed"
+        )
+        self.assign_existing_routes(plannings=[planning for planning in plannings if planning.route_id is None])
 
-        unplanned_transports = Transport.objects.filter(planning__isnull=True)
-        unplanned_shipments = Shipment.objects.exclude(id__in=planned_shipment_ids)
+        routes = Route.objects.filter(planning__isnull=False).distinct().defer("polyline", "polyline_packed")
+        unplanned_transports = Transport.objects.filter(planning__isnull=True).select_related("location")
+        unplanned_shipments = Shipment.objects.filter(planning__isnull=True).select_related("location")
+        for queryset in (routes, unplanned_transports, unplanned_shipments):
+            len(queryset)
 
-        total_empty_km = round(routes.aggregate(total_empty_km=Sum("distance_km"))["total_empty_km"]) if routes else 0
+        total_empty_km = round(sum(route.distance_km or 0 for route in routes))
 
         return PlanningSet(
             plannings=plannings,
@@ -31,58 +58,124 @@ class PlanningService:
             total_empty_km=total_empty_km,
         )
 
-    def get_center_coordinate(self, planning_set: PlanningSet) -> Optional[list[float]]:
-        avg_coordinates = self.get_avg_coordinate(
-            lats=[
-                planning_set.plannings.values_list("transport__location__latitude", flat=True),
-                planning_set.plannings.values_list("shipment__location__latitude", flat=True),
-                planning_set.unplanned_transports.values_list("location__latitude", flat=True),
-                planning_set.unplanned_shipments.values_list("location__latitude", flat=True),
-            ],
-            lons=[
-                planning_set.plannings.values_list("transport__location__longitude", flat=True),
-                planning_set.plannings.values_list("shipment__location__longitude", flat=True),
-                planning_set.unplanned_transports.values_list("location__longitude", flat=True),
-                planning_set.unplanned_shipments.values_list("location__longitude", flat=True),
-            ],
-        )
-        return avg_coordinates
-
-    def get_avg_coordinate(self, lats: list[QuerySet], lons: list[QuerySet]) -> list[float]:
-        if len(lats) == 0:
-            return [0, 0]
-        avg_lat = self.sum_coordinate_qs(lats)
-        avg_lon = self.sum_coordinate_qs(lons)
-        return [avg_lat, avg_lon]
+    def get_cached_planning_set(self, version: str = None) -> PlanningSet:
+        # Served from the cache until the next change to the planning state, see PlanningCache
+        return planning_cache.get_or_set("planning_set", self.get_planning_set, version=version)
 
-    def sum_coordinate_qs(self, querysets: list[QuerySet]) -> float:
-        coords = [coord for qs in querysets for coord in qs]
-        return sum(coords) / len(coords)
+    def get_map_extent(self, planning_set: PlanningSet) -> Optional[MapExtent]:
+        # Computed from the snapshot's rows, every transport and shipment counts once. None when the map is empty.
+        entities = [planning.transport for planning in planning_set.plannings]
+        entities += [planning.shipment for planning in planning_set.plannings]
+        entities += [*planning_set.unplanned_transports, *planning_set.unplanned_shipments]
+        coordinates = np.array(
+            [entity.location.coordinates for entity in entities if entity.location], dtype=np.float64
+        ).reshape(-1, 2)
+        if not len(coordinates):
+            return None
+        west, east = distance.longitude_span(coordinates[:, 1])
+        south, north = coordinates[:, 0].min(), coordinates[:, 0].max()
+        return MapExtent(
+            center=distance.spherical_centroid(coordinates), bbox=(west, float(south), east, float(north))
+        )
 
-    def assign_existing_routes(self, plannings: QuerySet[Planning]) -> None:
+    def assign_existing_routes(self, plannings: Iterable[Planning]) -> None:
+        if isinstance(plannings, QuerySet):
+            plannings = plannings.select_related("transport", "shipment")
+        plannings = list(plannings)
+        if not plannings:
+            return
         existing_routes_dict = self.get_existing_routes_dict(plannings)
 
+        assigned = []
         for planning in plannings:
             existing_route = existing_routes_dict.get((planning.transport.location_id, planning.shipment.location_id))
             if existing_route:
                 planning.route = existing_route
+                assigned.append(planning)
 
-        Planning.objects.bulk_update(plannings, ["route"])
+        if assigned:
+            Planning.objects.bulk_update(assigned, ["route"])
+            planning_cache.invalidate_on_commit()
         return
 
-    def get_existing_routes_dict(self, plannings: QuerySet[Planning]) -> dict[tuple[int, int], Route]:
-        transport_ids = [planning.transport.location_id for planning in plannings]
-        shipment_ids = [planning.shipment.location_id for planning in plannings]
+    def get_existing_routes_dict(self, plannings: Iterable[Planning]) -> dict[tuple[int, int], Route]:
+        transport_ids = {planning.transport.location_id for planning in plannings}
+        shipment_ids = {planning.shipment.location_id for planning in plannings}
 
-        existing_routes = Route.objects.filter(
-            location_start__in=transport_ids, location_end__in=shipment_ids
-        ).select_related("location_start", "location_end")
+        existing_routes = Route.objects.filter(location_start__in=transport_ids, location_end__in=shipment_ids)
 
         existing_routes_dict = {(route.location_start_id, route.location_end_id): route for route in existing_routes}
         return existing_routes_dict
 
-    def get_planning_polylines(self, planning_set: PlanningSet) -> list[list[list[float]]]:
-        return [route.polyline_array for route in planning_set.routes]
+    def get_planned_routes(self, bbox: Optional[BoundingBox] = None) -> list[Route]:
+        routes = Route.objects.filter(planning__isnull=False).distinct().only("id", "distance_km", "created_at")
+        if bbox:
+            routes = routes.filter(self.get_bbox_filter(bbox))
+        return list(routes.order_by("id"))
+
+    def get_bbox_filter(self, bbox: BoundingBox) -> Q:
+        # Routes whose bounds overlap the box, the box may span the antimeridian or the whole world.
+        # Routes without bounds always match.
+        west, south, east, north = bbox
+        overlaps = Q(north__gte=south, south__lte=north)
+        if east - west < 360:
+            west, east = (west + 180) % 360 - 180, (east + 180) % 360 - 180
+            if west <= east:
+                overlaps &= Q(east__gte=west, west__lte=east)
+            else:
+                overlaps &= Q(east__gte=west) | Q(west__lte=east)
+        return overlaps | Q(south__isnull=True)
+
+    def get_routes_etag(self, routes: Sequence[Route], level: Optional[int]) -> str:
+        # Route geometry never changes after it is saved, so the route ids and level identify the response
+        content = f"{level}:" + ",".join(str(route.id) for route in routes)
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def get_routes_geojson(self, routes: Sequence[Route], level: Optional[int]) -> dict:
+        geometries = self.get_route_geometries([route.id for route in routes], level=level)
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "id": str(route.id),
+                    # GeoJSON positions are [longitude, latitude]
+                    "geometry": {"type": "LineString", "coordinates": geometries[route.id][:, ::-1].tolist()},
+                    "properties": {"distance_km": route.distance_km},
+                }
+                for route in routes
+            ],
+        }
+
+    def get_route_geometries(self, route_ids: Sequence, level: Optional[int]) -> dict:
+        if level is None:
+            routes = Route.objects.filter(id__in=route_ids).only("id", "polyline", "polyline_packed")
+            return {route.id: route.coordinates for route in routes}
+
+        levels = RoutePolylineLevel.objects.filter(route_id__in=route_ids, level=level)
+        geometries = {route_level.route_id: route_level.coordinates for route_level in levels}
+        # Routes saved before levels existed get theirs on first use
+        if missing := [route_id for route_id in route_ids if route_id not in geometries]:
+            routes = Route.objects.filter(id__in=missing).only("id", "polyline", "polyline_packed")
+            for route_level in self.create_route_levels(routes):
+                if route_level.level == level:
+                    geometries[route_level.route_id] = route_level.coordinates
+        return geometries
+
+    def create_route_levels(self, routes: Iterable[Route]) -> list[RoutePolylineLevel]:
+        route_levels = [
+            RoutePolylineLevel(
+                route=route,
+                level=level,
+                polyline_packed=polyline_codec.pack(simplification.simplify(route.coordinates, level)),
+            )
+            for route in routes
+            for level in range(len(simplification.LEVEL_MAX_ZOOMS))
+        ]
+        RoutePolylineLevel.objects.bulk_create(
+            route_levels, batch_size=self.BULK_CREATE_BATCH_SIZE, ignore_conflicts=True
+        )
+        return route_levels
 
     @timer()
     def apply_planning(self, planning_request: PlanningRequest):
@@ -93,10 +186,12 @@ class PlanningService:
 
     def cancel_planning(self, planning_id: str):
         Planning.objects.get(id=planning_id).delete()
+        planning_cache.invalidate_on_commit()
 
     def reset_planning(self):
         # TODO This should be filtered by identifier (user or session)
         Planning.objects.all().delete()
+        planning_cache.invalidate_on_commit()
 
     def get_route(self, transport: Transport, shipment: Shipment) -> Route:
         if existing_route := self.get_route_existing(transport, shipment):
@@ -109,12 +204,15 @@ class PlanningService:
             end_lon=shipment.location.longitude,
         )
         route = GeoService().get_route(route_input=route_input)
-        return Route.objects.create(
-            location_start=transport.location,
-            location_end=shipment.location,
-            polyline=route.polyline,
-            distance_km=route.distance_km,
-        )
+        new_route = self.build_route(start=transport.location, end=shipment.location, response=route)
+        new_route.save()
+        self.create_route_levels([new_route])
+        return new_route
+
+    def build_route(self, start: Location, end: Location, response: RouteResponse) -> Route:
+        route = Route(location_start=start, location_end=end, distance_km=response.distance_km)
+        route.set_coordinates(response.polyline)
+        return route
 
     def get_route_existing(self, transport: Transport, shipment: Shipment) -> Route | None:
         existing_routes = Route.objects.filter(location_start=transport.location, location_end=shipment.location)
@@ -123,19 +221,88 @@ class PlanningService:
         return None
 
     @timer()
-    def apply_optimal_planning(self, max_empty_km: int = None):
+    def request_routes(
+        self, plannings: Sequence[Planning], on_progress: Optional[Callable[[float], None]] = None
+    ) -> int:
+        # Routes for the distinct (start, end) location pairs are looked up in one query, the missing ones are
+        # fetched concurrently and everything is written back in bulk. Returns how many plannings got a route.
+        plannings = [p for p in plannings if p.transport.location_id and p.shipment.location_id]
+        routes = self.get_existing_routes_dict(plannings)
+
+        missing = {}
+        for planning in plannings:
+            key = (planning.transport.location_id, planning.shipment.location_id)
+            if key not in routes:
+                missing[key] = (planning.transport.location, planning.shipment.location)
+
+        route_inputs = [
+            RoutePolylineInput(
+                start_lat=start.latitude, start_lon=start.longitude, end_lat=end.latitude, end_lon=end.longitude
+            )
+            for start, end in missing.values()
+        ]
+        new_routes = [
+            self.build_route(start=start, end=end, response=response)
+            for (start, end), response in zip(missing.values(), GeoService().get_routes(route_inputs, on_progress))
+            if response
+        ]
+
+        assigned = []
+        with transaction.atomic():
+            Route.objects.bulk_create(new_routes)
+            self.create_route_levels(new_routes)
+            routes.update({(route.location_start_id, route.location_end_id): route for route in new_routes})
+            for planning in plannings:
+                if route := routes.get((planning.transport.location_id, planning.shipment.location_id)):
+                    planning.route = route
+                    assigned.append(planning)
+            Planning.objects.bulk_update(assigned, ["route"])
+        planning_cache.invalidate_on_commit()
+        return len(assigned)
+
+    @timer()
+    def apply_optimal_planning(
+        self,
+        max_empty_km: int = None,
+        incremental: bool = False,
+        strategy: SolverStrategy = SolverStrategy.EXACT,
+        time_budget: float = None,
+    ) -> Optional[AssignmentResult]:
+        # Returns the objective and lower bound of the assignment, the incremental planner is exact and keeps none.
+        # The anytime strategy applies the best allocation found within time_budget seconds of this call.
         max_empty_km = int(max_empty_km) if max_empty_km else None
+        deadline = None
+        if strategy == SolverStrategy.ANYTIME:
+            deadline = time.time() + float(time_budget or settings.OPTIMISATION_TIME_BUDGET_SECONDS)
         planning_set = self.get_planning_set()
-        optimal_planning = PlanningOptimisationService().optimal_resource_allocation(
-            max_empty_km=max_empty_km,
-            transports=planning_set.unplanned_transports,
-            shipments=planning_set.unplanned_shipments,
-        )
+        result = None
+        # The incremental planner keeps a dense square cost matrix, large problems go to the sparse solvers
+        if (
+            incremental
+            and strategy == SolverStrategy.EXACT
+            and planning_set.unplanned_transports.count() * planning_set.unplanned_shipments.count()
+            < PlanningOptimisationService.SPARSE_MIN_PAIRS
+        ):
+            optimal_planning = incremental_planner.optimal_resource_allocation(
+                max_empty_km=max_empty_km or PlanningOptimisationService.DEFAULT_MAX_EMPTY_KM,
+                transports=planning_set.unplanned_transports,
+                shipments=planning_set.unplanned_shipments,
+            )
+        else:
+            optimal_planning, result = PlanningOptimisationService().get_allocation(
+                max_empty_km=max_empty_km,
+                transports=planning_set.unplanned_transports,
+                shipments=planning_set.unplanned_shipments,
+                strategy=strategy,
+                deadline=deadline,
+            )
         plannings = []
         for transport, shipment in optimal_planning.items():
             plannings.append(Planning(transport=transport, shipment=shipment))
         with transaction.atomic():
             Planning.objects.bulk_create(plannings)
+        planning_cache.invalidate_on_commit()
+        return result
 
     def request_route(self, planning: Optional[Planning] = None, planning_id: Optional[str] = None) -> None:
         if not any([planning, planning_id]):
@@ -151,18 +318,69 @@ class PlanningService:
             case EntityType.TRANSPORT:
                 return Transport.objects.create(location=location, name=name)
 
+    def get_nearest_unplanned_shipments(self, transport: Transport, k: int = 5) -> list[Shipment]:
+        if not transport.location:
+            return []
+        latitude, longitude = map(float, transport.location.coordinates)
+
+        # Nearby locations may hold no unplanned shipment, so widen the search until k are found
+        candidates = k
+        while True:
+            neighbours = dict(location_index.nearest(latitude, longitude, k=candidates))
+            shipments = self.get_unplanned_shipments_at(location_ids=neighbours)
+            if len(shipments) >= k or len(neighbours) < candidates:
+                return sorted(shipments, key=lambda shipment: neighbours[shipment.location_id])[:k]
+            candidates *= 4
+
+    def get_unplanned_shipments_within(self, transport: Transport, radius_km: float) -> list[Shipment]:
+        if not transport.location:
+            return []
+        latitude, longitude = map(float, transport.location.coordinates)
+        neighbours = dict(location_index.within_radius(latitude, longitude, radius_km=radius_km))
+        shipments = self.get_unplanned_shipments_at(location_ids=neighbours)
+        return sorted(shipments, key=lambda shipment: neighbours[shipment.location_id])
+
+    def get_unplanned_shipments_at(self, location_ids) -> list[Shipment]:
+        shipments = Shipment.objects.filter(planning__isnull=True, location_id__in=location_ids)
+        return list(shipments.select_related("location"))
+
+    @timer()
+    def create_entities_bulk(self, records: Sequence[EntityRecord]) -> list[Shipment | Transport]:
+        # All location ids are checked in one query before anything is written, then both entity types are
+        # inserted in one transaction
+        location_ids = {str(record.location_id) for record in records}
+        existing_ids = {str(id) for id in Location.objects.filter(id__in=location_ids).values_list("id", flat=True)}
+        if unknown_ids := location_ids - existing_ids:
+            raise ValueError(f"Unknown locations: {', '.join(sorted(unknown_ids))}")
+
+        entity_models = {EntityType.SHIPMENT: Shipment, EntityType.TRANSPORT: Transport}
+        entities = {entity_type: [] for entity_type in entity_models}
+        created = []
+        for record in records:
+            entity_type = EntityType(record.entity_type)
+            entity = entity_models[entity_type](name=record.name, location_id=record.location_id)
+            entities[entity_type].append(entity)
+            created.append(entity)
+
+        with transaction.atomic():
+            for entity_type, model in entity_models.items():
+                model.objects.bulk_create(entities[entity_type], batch_size=self.BULK_CREATE_BATCH_SIZE)
+        planning_cache.invalidate_on_commit()
+        return created
+
     @timer()
     def create_entities(self):
         Shipment.objects.all().delete()
         Transport.objects.all().delete()
+        planning_cache.invalidate_on_commit()
 
         count = 120
-        lv_locations = Location.objects.filter(country_code="LV")
+        lv_location_ids = Location.objects.filter(country_code="LV").values_list("id", flat=True)[:count]
 
-        for i in range(count):
+        records = []
+        for i, location_id in enumerate(lv_location_ids):
             entity_type = EntityType.SHIPMENT if i % 2 == 0 else EntityType.TRANSPORT
-            self.create_entity(
-                entity_type=entity_type,
-                name=f"{entity_type.name} {i}",
-                location=lv_locations[i],
+            records.append(
+                EntityRecord(entity_type=entity_type, name=f"{entity_type.name} {i}", location_id=location_id)
             )
+        self.create_entities_bulk(records)
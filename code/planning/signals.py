@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .distance_cache import distance_cache
+from .models import Location, Planning, Route, Shipment, Transport
+from .planning_cache import planning_cache
+from .spatial_index import location_index
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance: Location, created: bool, **kwargs):
+    location_index.add(instance)
+    if not created:
+        distance_cache.discard(instance.id)
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance: Location, **kwargs):
+    location_index.remove(instance.id)
+    distance_cache.discard(instance.id)
+
+
+@receiver(post_save, sender=Planning)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Shipment)
+@receiver(post_save, sender=Transport)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def planning_changed(sender, **kwargs):
+    # Bulk writes send no signals, PlanningService invalidates after those itself. Deletes of the other models
+    # invalidate where they happen, a post_delete receiver would turn every queryset delete into a fetch and one
+    # signal per row.
+    planning_cache.invalidate_on_commit()
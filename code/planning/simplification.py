@@ -0,0 +1,54 @@
+import numpy as np
+
+# Level-of-detail polylines for the map. Level i is simplified with a tolerance of one screen pixel at
+# LEVEL_MAX_ZOOMS[i], so it looks the same as the full route up to that zoom. Closer zooms get the full route.
+LEVEL_MAX_ZOOMS = (5, 8, 11)
+TILE_SIZE_PX = 256
+
+
+def get_level(zoom: int) -> int | None:
+    for level, max_zoom in enumerate(LEVEL_MAX_ZOOMS):
+        if zoom <= max_zoom:
+            return level
+    return None
+
+
+def get_tolerance(level: int) -> float:
+    # Degrees of longitude covered by one pixel at the level's deepest zoom
+    return 360 / (TILE_SIZE_PX * 2 ** LEVEL_MAX_ZOOMS[level])
+
+
+def simplify(coordinates: np.ndarray, level: int) -> np.ndarray:
+    coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    return coordinates[douglas_peucker(coordinates, tolerance=get_tolerance(level))]
+
+
+def douglas_peucker(coordinates: np.ndarray, tolerance: float) -> np.ndarray:
+    # Mask of the [latitude, longitude] points to keep. Longitudes are scaled by the cosine of the mean latitude,
+    # so the tolerance is roughly the same distance in every direction. Iterative, so long routes can't hit the
+    # recursion limit; each segment's farthest point is found vectorised.
+    if len(coordinates) < 3:
+        return np.ones(len(coordinates), dtype=bool)
+    keep = np.zeros(len(coordinates), dtype=bool)
+    keep[[0, -1]] = True
+
+    scale = np.cos(np.radians(coordinates[:, 0].mean()))
+    points = np.column_stack([coordinates[:, 1] * scale, coordinates[:, 0]])
+    segments = [(0, len(points) - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+        direction = points[end] - points[start]
+        offsets = points[start + 1 : end] - points[start]
+        length = np.hypot(*direction)
+        if length:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            segments += [(start, middle), (middle, end)]
+    return keep
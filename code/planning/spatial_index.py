@@ -0,0 +1,114 @@
+import threading
+from typing import Any, Sequence
+from uuid import UUID
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from .distance import chord_to_km, haversine_matrix, km_to_chord, unit_vectors
+from .models import Location
+
+Neighbour = tuple[Any, float]
+
+
+class SpatialIndex:
+    # KD-tree over points on the unit sphere: chord length is monotonic in great-circle distance,
+    # so euclidean radius and k-NN queries on the tree are exact great-circle queries.
+    def __init__(self, ids: Sequence[Any], coordinates: np.ndarray):
+        self.ids = np.empty(len(ids), dtype=object)
+        self.ids[:] = list(ids)
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree(unit_vectors(self.coordinates))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> list[Neighbour]:
+        point = unit_vectors([latitude, longitude])[0]
+        indices = np.asarray(self.tree.query_ball_point(point, r=float(km_to_chord(radius_km))), dtype=np.intp)
+        return self.get_neighbours(latitude, longitude, indices)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> list[Neighbour]:
+        k = min(k, len(self))
+        if k == 0:
+            return []
+        _, indices = self.tree.query(unit_vectors([latitude, longitude])[0], k=k)
+        return self.get_neighbours(latitude, longitude, np.atleast_1d(indices))
+
+    def query_pairs(self, other: "SpatialIndex", max_km: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # All (self index, other index, km) pairs that are at most max_km apart
+        pairs = self.tree.sparse_distance_matrix(
+            other.tree, max_distance=float(km_to_chord(max_km)), output_type="ndarray"
+        )
+        return pairs["i"].astype(np.intp), pairs["j"].astype(np.intp), chord_to_km(pairs["v"])
+
+    def get_neighbours(self, latitude: float, longitude: float, indices: np.ndarray) -> list[Neighbour]:
+        distances = haversine_matrix([latitude, longitude], self.coordinates[indices])[0]
+        order = np.argsort(distances, kind="stable")
+        return [(self.ids[i], float(d)) for i, d in zip(indices[order], distances[order])]
+
+
+class LocationIndex:
+    # Process-wide index over all Location rows. Saves and deletes are buffered and searched by brute force
+    # until REBUILD_THRESHOLD changes pile up, then the tree is rebuilt on the next query.
+    REBUILD_THRESHOLD = 1_000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index: SpatialIndex | None = None
+        self.pending: dict[UUID, tuple[float, float]] = {}
+        self.removed: set[UUID] = set()
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.index = None
+            self.pending.clear()
+            self.removed.clear()
+
+    def add(self, location: Location) -> None:
+        with self.lock:
+            if self.index is None:
+                return
+            self.pending[location.id] = (float(location.latitude), float(location.longitude))
+            self.removed.add(location.id)
+            if len(self.pending) + len(self.removed) > self.REBUILD_THRESHOLD:
+                self.index = None
+
+    def remove(self, location_id: UUID) -> None:
+        with self.lock:
+            if self.index is None:
+                return
+            self.pending.pop(location_id, None)
+            self.removed.add(location_id)
+            if len(self.pending) + len(self.removed) > self.REBUILD_THRESHOLD:
+                self.index = None
+
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> list[Neighbour]:
+        index, pending, removed = self.get_snapshot()
+        neighbours = [n for n in index.within_radius(latitude, longitude, radius_km) if n[0] not in removed]
+        neighbours += pending.within_radius(latitude, longitude, radius_km)
+        return sorted(neighbours, key=lambda neighbour: neighbour[1])
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> list[Neighbour]:
+        index, pending, removed = self.get_snapshot()
+        neighbours = [n for n in index.nearest(latitude, longitude, k + len(removed)) if n[0] not in removed]
+        neighbours += pending.nearest(latitude, longitude, k)
+        return sorted(neighbours, key=lambda neighbour: neighbour[1])[:k]
+
+    def get_snapshot(self) -> tuple[SpatialIndex, SpatialIndex, frozenset[UUID]]:
+        with self.lock:
+            if self.index is None:
+                self.index = self.build()
+                self.pending.clear()
+                self.removed.clear()
+            pending = SpatialIndex(list(self.pending), list(self.pending.values()))
+            return self.index, pending, frozenset(self.removed)
+
+    def build(self) -> SpatialIndex:
+        rows = list(Location.objects.values_list("id", "latitude", "longitude"))
+        ids = [row[0] for row in rows]
+        coordinates = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 2)
+        return SpatialIndex(ids, coordinates)
+
+
+location_index = LocationIndex()
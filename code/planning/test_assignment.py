@@ -0,0 +1,129 @@
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from . import assignment
+
+INFEASIBLE_COST = 1_000_000
+
+
+class TestAssignment:
+    def test_get_components(self):
+        # Given rows 0-1 connected to columns 0-1, and row 3 connected to column 2 only
+        pairs = (np.array([3, 0, 1, 1]), np.array([2, 0, 0, 1]), np.array([5.0, 1.0, 2.0, 3.0]))
+
+        # When the feasibility graph is split
+        components = assignment.get_components(pairs, n=4, m=3)
+
+        # Then there are two components with their pairs in local indices, row 2 without pairs is left out
+        (rows_a, cols_a, pairs_a), (rows_b, cols_b, pairs_b) = sorted(components, key=lambda c: c[0][0])
+        assert rows_a.tolist() == [0, 1] and cols_a.tolist() == [0, 1]
+        assert sorted(zip(*[p.tolist() for p in pairs_a])) == [(0, 0, 1.0), (1, 0, 2.0), (1, 1, 3.0)]
+        assert rows_b.tolist() == [3] and cols_b.tolist() == [2]
+        assert [p.tolist() for p in pairs_b] == [[0], [0], [5.0]]
+
+    def test_get_components_empty(self):
+        assert assignment.get_components((np.empty(0, int), np.empty(0, int), np.empty(0)), n=2, m=2) == []
+
+    def test_solve_dense_and_sparse(self):
+        # Given a random cost matrix where far pairs are infeasible
+        rng = np.random.default_rng(1)
+        cost_matrix = rng.integers(1, 100, size=(12, 9)).astype(np.float64)
+        cost_matrix[cost_matrix > 60] = INFEASIBLE_COST
+        rows, cols = np.nonzero(cost_matrix < INFEASIBLE_COST)
+        pairs = (rows, cols, cost_matrix[rows, cols])
+
+        # When both solvers are used
+        dense = assignment.solve(pairs, 12, 9, INFEASIBLE_COST, sparse_min_pairs=1_000)
+        sparse = assignment.solve(pairs, 12, 9, INFEASIBLE_COST, sparse_min_pairs=1)
+
+        # Then they match as many pairs at the same cost as the Hungarian solver on the full matrix
+        row_indices, col_indices = linear_sum_assignment(cost_matrix)
+        expected = cost_matrix[row_indices, col_indices]
+        expected = expected[expected < INFEASIBLE_COST]
+        for result in (dense, sparse):
+            assert len(result.row_indices) == len(expected)
+            assert cost_matrix[result.row_indices, result.col_indices].sum() == expected.sum()
+            assert result.objective == result.lower_bound
+            assert result.gap == 0
+
+    def test_solve_sparse_empty(self):
+        empty = (np.empty(0, int), np.empty(0, int), np.empty(0))
+        for n, m in [(3, 2), (0, 2), (2, 0), (0, 0)]:
+            result = assignment.solve_sparse(empty, n, m, INFEASIBLE_COST)
+            assert len(result.row_indices) == len(result.col_indices) == 0
+            assert result.objective == result.lower_bound == INFEASIBLE_COST * n
+
+    def test_solve_greedy(self):
+        # Given random sparse problems, wider and taller than square
+        rng = np.random.default_rng(2)
+        for n, m in [(15, 10), (10, 15), (12, 12)]:
+            rows, cols = np.nonzero(rng.random((n, m)) < 0.3)
+            pairs = (rows, cols, rng.integers(0, 100, size=len(rows)).astype(np.float64))
+            exact = assignment.solve_sparse(pairs, n, m, INFEASIBLE_COST)
+
+            # When the fast path is used
+            greedy = assignment.solve_greedy(pairs, n, m, INFEASIBLE_COST)
+
+            # Then the assignment is valid and its bounds hold the optimum
+            assert len(set(greedy.col_indices)) == len(greedy.col_indices)
+            assert set(zip(greedy.row_indices, greedy.col_indices)) <= set(zip(rows, cols))
+            assert greedy.lower_bound <= exact.objective <= greedy.objective
+            assert 0 <= greedy.gap <= 1
+
+    def test_get_lower_bound_counts_unmatchable_rows(self):
+        # Given three rows that can only take column 0, and a row that may take any of three other columns
+        pairs = (np.array([0, 1, 2, 3, 3, 3]), np.array([0, 0, 0, 1, 2, 3]), np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0]))
+
+        # When the lower bound is computed
+        lower_bound = assignment.get_lower_bound(pairs, n=4, infeasible_cost=INFEASIBLE_COST)
+
+        # Then two rows are left unmatched by any assignment, the other two cost at least the two cheapest options
+        assert lower_bound == 2 * INFEASIBLE_COST + 1 + 2
+        assert lower_bound <= assignment.solve_sparse(pairs, 4, 4, INFEASIBLE_COST).objective
+
+    def test_solve_greedy_cheapest_first(self):
+        # Given row 0 whose cheapest column is also row 1's only option
+        pairs = (np.array([0, 0, 1]), np.array([0, 1, 0]), np.array([1.0, 2.0, 3.0]))
+
+        # When pairs are taken cheapest first
+        result = assignment.solve_greedy(pairs, n=2, m=2, infeasible_cost=INFEASIBLE_COST)
+
+        # Then row 1 is left unmatched and the gap shows it, the optimum would cost 5
+        assert list(zip(result.row_indices.tolist(), result.col_indices.tolist())) == [(0, 0)]
+        assert result.objective == 1 + INFEASIBLE_COST
+        assert result.lower_bound == 4
+        assert result.gap > 0.99
+
+    def test_merge(self):
+        # Given the results of two components
+        results = [
+            assignment.get_result(np.array([0]), np.array([0]), np.array([4.0]), 1, INFEASIBLE_COST, lower_bound=3),
+            assignment.get_result(np.array([1]), np.array([0]), np.array([2.0]), 2, INFEASIBLE_COST),
+        ]
+
+        # When they are merged with one row outside every component
+        result = assignment.AssignmentResult.merge(
+            results,
+            row_maps=[np.array([2]), np.array([0, 1])],
+            col_maps=[np.array([1]), np.array([0])],
+            fixed_cost=INFEASIBLE_COST,
+        )
+
+        # Then indices are global and costs add up
+        assert result.row_indices.tolist() == [2, 1] and result.col_indices.tolist() == [1, 0]
+        assert result.objective == 4 + 2 + 2 * INFEASIBLE_COST
+        assert result.lower_bound == 3 + 2 + 2 * INFEASIBLE_COST
+
+    def test_improve_by_swaps(self):
+        # Given an assignment of row 0 to column 0 that leaves row 1, which can only take column 0, unmatched
+        pairs = (np.array([0, 0, 1]), np.array([0, 1, 0]), np.array([1.0, 2.0, 3.0]))
+        greedy = assignment.solve_greedy(pairs, n=2, m=2, infeasible_cost=INFEASIBLE_COST)
+
+        # When it is improved locally
+        result = assignment.improve_by_swaps(pairs, 2, 2, INFEASIBLE_COST, greedy, deadline=time.time() + 10)
+
+        # Then row 0 moves over and both rows are matched
+        assert sorted(zip(result.row_indices.tolist(), result.col_indices.tolist())) == [(0, 1), (1, 0)]
+        assert result.objective == 5
@@ -24,3 +24,50 @@ class TestDataImportService:
         # Then it contains specific values in the DataFrame
         assert result_df.iloc[0]["Name"] == "Alice"
         assert result_df.iloc[1]["Age"] == 30
+
+    def test_join_columns(self, data_import_service):
+        # Given a parsed spreadsheet
+        df = data_import_service.parse_spreadsheet("City\tCountry\nTallinn\tEstonia\nRiga\t")
+
+        # When columns are joined per row
+        result = data_import_service.join_columns(df, ["City", "Country"], separator=", ")
+
+        # Then every row gets one text, and no columns give empty texts
+        assert result == ["Tallinn, Estonia", "Riga, "]
+        assert data_import_service.join_columns(df, [], separator=" ") == ["", ""]
+
+    def test_store_and_load_upload(self, data_import_service):
+        # Given a spreadsheet with a blank row, stored in chunks of two rows
+        data_import_service.CHUNK_SIZE = 2
+        content = "Name\tCity\nAlice\t Tallinn \n\t\nBob\tRiga\nCarol\tTartu"
+
+        # When it is stored and loaded back by token
+        upload = data_import_service.store_upload(content)
+        chunks = data_import_service.load_upload(upload.token)
+
+        # Then the cleaned rows come back without parsing the content again
+        assert upload.columns == ["Name", "City"]
+        assert upload.row_count == 3
+        assert upload.preview == [["Alice", "Tallinn"], ["Bob", "Riga"], ["Carol", "Tartu"]]
+        rows = data_import_service.map_columns(chunks, ["Name"], ["City", "Country"])
+        assert list(rows) == [("Alice", "Tallinn"), ("Bob", "Riga"), ("Carol", "Tartu")]
+
+    def test_map_page(self, data_import_service):
+        # Given five stored rows and pages of two rows
+        data_import_service.CHUNK_SIZE = 2
+        data_import_service.PAGE_SIZE = 2
+        upload = data_import_service.store_upload("Name\tCity\nA\t1\nB\t2\nC\t3\nD\t4\nE\t5")
+
+        # When the pages are mapped
+        def map_page(page):
+            chunks = data_import_service.load_upload(upload.token)
+            return data_import_service.map_page(chunks, ["Name"], ["City"], page)
+
+        # Then each page holds its own rows and only the last one has nothing after it
+        assert map_page(0) == ([("A", "1"), ("B", "2")], True)
+        assert map_page(1) == ([("C", "3"), ("D", "4")], True)
+        assert map_page(2) == ([("E", "5")], False)
+
+    def test_load_unknown_upload(self, data_import_service):
+        assert data_import_service.load_upload("unknown") is None
+        assert data_import_service.load_upload(None) is None
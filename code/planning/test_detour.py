@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from .detour import DetourModel, detour_model
+from .distance import haversine_pairs
+from .models import Location, Route, Shipment, Transport
+from .optimisation import PlanningOptimisationService
+
+
+class TestDetourModel:
+    def test_fit_knots(self):
+        # Given short trips with a larger detour than long ones, and too few samples in one band
+        model = DetourModel()
+        great_circle_km = np.concatenate([np.full(30, 10.0), np.full(30, 800.0), np.full(5, 300.0)])
+        factors = np.concatenate([np.full(30, 1.6), np.full(30, 1.2), np.full(5, 3.0)])
+
+        # When the knots are fitted
+        distances, fitted = model.fit_knots(great_circle_km, factors)
+
+        # Then each band with enough routes gives one knot
+        assert distances.tolist() == [10.0, 800.0]
+        assert np.allclose(fitted, [1.6, 1.2])
+
+    def test_fit_knots_never_shortens(self):
+        distances, factors = DetourModel().fit_knots(np.full(30, 100.0), np.full(30, 0.9))
+        assert factors.tolist() == [1.0]
+
+    def test_apply_without_data(self):
+        # Given too few stored routes to fit anything
+        model = DetourModel()
+        knots = model.fit_knots(np.full(3, 100.0), np.full(3, 1.5))
+        model.get_knots = lambda: knots
+
+        # When it is applied
+        # Then great-circle distances are unchanged
+        assert model.apply(np.array([100.0, 200.0])).tolist() == [100.0, 200.0]
+
+    def test_apply_interpolates(self):
+        # Given knots at 10 km and 800 km
+        model = DetourModel()
+        model.get_knots = lambda: (np.array([10.0, 800.0]), np.array([1.6, 1.2]))
+
+        # When distances are estimated
+        estimated = model.apply(np.array([[5.0, 405.0], [1_000.0, np.nan]]))
+
+        # Then factors are interpolated between knots and held beyond them
+        assert np.allclose(estimated[0], [8.0, 405.0 * 1.4])
+        assert np.isclose(estimated[1, 0], 1_200.0)
+        assert np.isnan(estimated[1, 1])
+
+
+@pytest.mark.django_db
+class TestDetourModelFit:
+    def test_fit_from_routes(self):
+        # Given stored routes that are all 30% longer than great-circle distance
+        rng = np.random.default_rng(7)
+        for _ in range(DetourModel.MIN_SAMPLES):
+            start = Location.objects.create(latitude=rng.uniform(45, 55), longitude=rng.uniform(0, 20))
+            end = Location.objects.create(latitude=rng.uniform(45, 55), longitude=rng.uniform(0, 20))
+            great_circle_km = haversine_pairs([start.coordinates], [end.coordinates])[0]
+            Route.objects.create(location_start=start, location_end=end, distance_km=1.3 * great_circle_km)
+
+        # When the cost matrix prices a pair without a route
+        transport = Transport(location=Location(latitude=50.0, longitude=10.0))
+        shipment = Shipment(location=Location(latitude=51.0, longitude=10.0))
+        cost_matrix = PlanningOptimisationService().get_cost_matrix([transport], [shipment], max_empty_km=1_000)
+
+        # Then the estimated road distance is used
+        assert np.allclose(detour_model.get_knots()[1], 1.3)
+        assert cost_matrix[0, 0] == round(1.3 * 111)
@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pytest
+
+from . import distance
+from .distance import (
+    EARTH_RADIUS_KM,
+    chord_to_km,
+    haversine_matrix,
+    haversine_matrix_numpy,
+    haversine_matrix_tiled,
+    haversine_pairs,
+    haversine_pairs_numpy,
+    km_to_chord,
+    longitude_span,
+    spherical_centroid,
+    unit_vectors,
+)
+
+
+class TestHaversineMatrix:
+    def test_haversine_matrix(self):
+        # Given origins and destinations
+        origins = np.array([[40.7128, -74.0060], [34.0522, -118.2437]])
+        destinations = np.array([[34.0522, -118.2437], [40.7128, -74.0060], [40.7128, -74.0060]])
+
+        # When haversine_matrix is called
+        distances = haversine_matrix(origins, destinations)
+
+        # Then the full matrix of great-circle distances is returned
+        assert distances.shape == (2, 3)
+        assert round(distances[0, 0]) == 3936
+        assert distances[0, 1] == distances[0, 2] == 0
+        assert np.allclose(distances[1, 1:], distances[0, 0])
+
+    def test_haversine_matrix_empty(self):
+        assert haversine_matrix(np.empty((0, 2)), np.array([[0.0, 0.0]])).shape == (0, 1)
+
+    def test_haversine_pairs(self):
+        # Given origins and destinations paired row by row
+        rng = np.random.default_rng(3)
+        origins, destinations = rng.uniform(-60, 60, size=(2, 50, 2))
+
+        # When haversine_pairs is called
+        # Then it is the diagonal of the full matrix
+        assert np.allclose(haversine_pairs(origins, destinations), np.diag(haversine_matrix(origins, destinations)))
+
+    @pytest.mark.skipif(
+        distance.native_distance_matrix is None and not os.getenv("REQUIRE_RUST_EXTENSIONS"),
+        reason="rust_extensions is not built",
+    )
+    def test_native_matches_numpy(self):
+        # CI builds the extension and sets REQUIRE_RUST_EXTENSIONS, so a broken build fails here instead of skipping
+        assert distance.native_distance_matrix is not None and distance.native_distance_pairs is not None
+
+        # Given coordinates in a non-contiguous array
+        rng = np.random.default_rng(5)
+        origins = rng.uniform(-60, 60, size=(40, 4))[:, ::2]
+        destinations = rng.uniform(-60, 60, size=(30, 2))
+
+        # When the native kernels are used
+        # Then they agree with the NumPy versions
+        assert np.allclose(haversine_matrix(origins, destinations), haversine_matrix_numpy(origins, destinations))
+        assert np.allclose(
+            haversine_pairs(origins[:30], destinations), haversine_pairs_numpy(origins[:30], destinations)
+        )
+        assert np.allclose(
+            distance.native_distance_matrix(origins.copy(), destinations, threads=2),
+            haversine_matrix_numpy(origins, destinations),
+        )
+
+
+class TestUnitVectors:
+    def test_chord_round_trip(self):
+        # Given two points 1000 km apart along the equator
+        points = unit_vectors(np.array([[0.0, 0.0], [0.0, np.degrees(1000 / EARTH_RADIUS_KM)]]))
+
+        # When the chord between them is converted back to km
+        chord = np.linalg.norm(points[0] - points[1])
+
+        # Then the great-circle distance is recovered
+        assert np.isclose(chord, km_to_chord(1000))
+        assert np.isclose(chord_to_km(chord), 1000)
+
+
+class TestSphericalCentroid:
+    def test_spherical_centroid_across_antimeridian(self):
+        # Given points on both sides of the antimeridian
+        coordinates = np.array([[10.0, 179.0], [-10.0, -179.0]])
+
+        # When their centroid is computed
+        latitude, longitude = spherical_centroid(coordinates)
+
+        # Then it lies on the antimeridian, not at the prime meridian like the plain mean
+        assert np.isclose(latitude, 0, atol=1e-9)
+        assert np.isclose(abs(longitude), 180)
+
+    def test_spherical_centroid_antipodes(self):
+        assert spherical_centroid(np.array([[0.0, 0.0], [0.0, 180.0]])) == (0.0, 90.0)
+
+
+class TestLongitudeSpan:
+    def test_longitude_span(self):
+        assert longitude_span(np.array([24.1, 4.9, -3.7])) == (-3.7, 24.1)
+
+    def test_longitude_span_across_antimeridian(self):
+        # Given longitudes around the antimeridian
+        # When the span is computed
+        # Then it wraps around with west > east instead of covering the whole world
+        assert longitude_span(np.array([170.0, -175.0, 178.0])) == (170.0, -175.0)
+
+    def test_longitude_span_single(self):
+        assert longitude_span(np.array([24.1])) == (24.1, 24.1)
+
+
+class TestHaversineMatrixTiled:
+    def test_haversine_matrix_tiled(self):
+        # Given more origins and destinations than fit one tile
+        rng = np.random.default_rng(11)
+        origins, destinations = rng.uniform(-60, 60, size=(70, 2)), rng.uniform(-60, 60, size=(45, 2))
+
+        # When the matrix is computed in tiles across threads into a preallocated array
+        out = np.full((70, 45), np.nan)
+        distances = haversine_matrix_tiled(origins, destinations, workers=4, tile_size=16, out=out)
+
+        # Then every tile is filled in place with the same distances
+        assert distances is out
+        assert np.allclose(out, haversine_matrix_numpy(origins, destinations))
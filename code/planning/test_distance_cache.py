@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from unittest.mock import patch
+from .distance_cache import DistanceCache
+from .models import Location, Shipment, Transport
+from .optimisation import PlanningOptimisationService
+
+
+class TestDistanceCache:
+    def test_lookup_and_store(self):
+        # Given a cache with one stored block of distances
+        cache = DistanceCache(capacity=8)
+        cache.store(["a", "b"], ["c", "d", "e"], np.array([[1, 2, 3], [4, 5, 6]]))
+
+        # When looking up a different arrangement of known and unknown pairs
+        distances = cache.lookup(["b", "x"], ["e", "c"])
+
+        # Then known pairs are returned and unknown ones are NaN
+        assert distances[0].tolist() == [6, 4]
+        assert np.isnan(distances[1]).all()
+
+    def test_evicts_least_recently_used(self):
+        # Given a full cache where "a" was used most recently
+        cache = DistanceCache(capacity=3)
+        cache.store(["a"], ["b", "c"], np.array([[1, 2]]))
+        cache.lookup(["a"], ["c"])
+
+        # When a new location is stored
+        cache.store(["a"], ["d"], np.array([[3]]))
+
+        # Then the least recently used location is evicted
+        assert "b" not in cache.ordinals
+        assert cache.lookup(["a"], ["b", "c", "d"])[0, 1:].tolist() == [2, 3]
+
+    def test_trims_blocks_larger_than_capacity(self):
+        # Given a block of six locations for a cache of four
+        cache = DistanceCache(capacity=4)
+
+        # When it is stored
+        cache.store(["a", "b", "c"], ["d", "e", "f"], np.arange(9).reshape(3, 3))
+
+        # Then the leading block that fits is cached, split evenly between starts and ends
+        assert set(cache.ordinals) == {"a", "b", "d", "e"}
+        assert cache.lookup(["a", "b"], ["d", "e"]).tolist() == [[0, 1], [3, 4]]
+
+    def test_discard(self):
+        cache = DistanceCache(capacity=4)
+        cache.store(["a"], ["b"], np.array([[1]]))
+        cache.discard("b")
+        assert np.isnan(cache.lookup(["a"], ["b"])).all()
+
+    def test_persistent(self, tmp_path):
+        path = str(tmp_path / "distances.dat")
+        cache = DistanceCache(capacity=4, path=path)
+        cache.store(["a"], ["b"], np.array([[7]]))
+        cache.close()
+        assert DistanceCache(capacity=4, path=path).lookup(["a"], ["b"]).tolist() == [[7]]
+
+    def test_persistent_batches_index_writes(self, tmp_path):
+        # Given a persistent cache with a written index and one store since
+        path = str(tmp_path / "distances.dat")
+        cache = DistanceCache(capacity=4, path=path)
+        cache.store(["a"], ["b"], np.array([[7]]))
+        cache.flush()
+        with patch("planning.distance_cache.json.dump") as dump:
+            cache.store(["a"], ["c"], np.array([[8]]))
+
+        # When the process stops without closing it, and the cache is opened again
+        cache.lock_file.close()
+        reopened = DistanceCache(capacity=4, path=path)
+
+        # Then the new location wasn't indexed yet, and its distances are cleared instead of leaking to others
+        dump.assert_not_called()
+        assert set(reopened.ordinals) == {"a", "b"}
+        assert reopened.lookup(["a"], ["b"]).tolist() == [[7]]
+        assert np.isnan(reopened.matrix[:, cache.ordinals["c"]]).all()
+
+    def test_persistent_single_process(self, tmp_path):
+        # Given a persistent cache in use
+        path = str(tmp_path / "distances.dat")
+        cache = DistanceCache(capacity=4, path=path)
+        cache.store(["a"], ["b"], np.array([[7]]))
+
+        # When another cache opens the same path, and again once the first is closed
+        other = DistanceCache(capacity=4, path=path)
+        cache.close()
+        after_close = DistanceCache(capacity=4, path=path)
+
+        # Then the other one gets an empty in-memory cache, and the files only pass on after closing
+        assert other.path is None and not other.ordinals
+        assert after_close.path == path
+        assert after_close.lookup(["a"], ["b"]).tolist() == [[7]]
+        cache.store(["a"], ["c"], np.array([[8]]))
+        assert np.isnan(after_close.lookup(["a"], ["c"])).all()
+
+
+@pytest.mark.django_db
+class TestCostMatrixDistanceCache:
+    def test_repeated_optimisation_skips_distance_computation(self):
+        # Given a cost matrix computed once
+        transports = [Transport(location=Location.objects.create(latitude=1, longitude=1))]
+        shipments = [Shipment(location=Location.objects.create(latitude=2, longitude=2))]
+        service = PlanningOptimisationService()
+        cost_matrix = service.get_cost_matrix(transports=transports, shipments=shipments, max_empty_km=3_000)
+
+        # When it is computed again for the same locations
+        with patch("planning.optimisation.haversine_matrix") as haversine_matrix:
+            cost_matrix_cached = service.get_cost_matrix(
+                transports=transports, shipments=shipments, max_empty_km=3_000
+            )
+
+        # Then distances come from the cache
+        haversine_matrix.assert_not_called()
+        assert np.array_equal(cost_matrix, cost_matrix_cached)
@@ -0,0 +1,42 @@
+import pytest
+from .gazetteer import GazetteerService
+from .geo_service import GeoService
+from .models import Location
+
+
+@pytest.mark.django_db
+class TestGazetteerService:
+    def test_load_cities_from_file(self):
+        # Given one city that is already saved
+        Location.objects.create(name="Madona", latitude=0, longitude=0)
+
+        # When the bundled cities are loaded twice
+        created = GeoService().load_cities_from_file()
+        created_again = GeoService().load_cities_from_file()
+
+        # Then every other city is created once, with parsed coordinates
+        assert created == Location.objects.count() - 1
+        assert created_again == 0
+        salaspils = Location.objects.get(name="Salaspils")
+        assert salaspils.coordinates == (56.86014, 24.36544)
+        assert salaspils.country_code == "LV"
+
+    def test_load_geonames(self, tmp_path):
+        # Given a GeoNames dump with a duplicate and an invalid row
+        rows = [
+            ["456172", "Riga", "Riga", "", "56.946", "24.10589", "P", "PPLC", "LV"],
+            ["456173", "Riga", "Riga", "", "56.9", "24.1", "P", "PPL", "LV"],
+            ["588409", "Tallinn", "Tallinn", "", "59.43696", "24.75353", "P", "PPLC", "EE"],
+            ["1", "Nowhere", "Nowhere", "", "not a number", "0", "P", "PPL", "EE"],
+        ]
+        path = tmp_path / "cities.txt"
+        path.write_text("\n".join("\t".join(row) for row in rows))
+
+        # When it is loaded in small chunks
+        service = GazetteerService()
+        service.CHUNK_SIZE = 2
+        created = service.load_geonames(str(path))
+
+        # Then each valid name is created once
+        assert created == 2
+        assert set(Location.objects.values_list("name", "country_code")) == {("Riga", "LV"), ("Tallinn", "EE")}
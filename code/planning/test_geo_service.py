@@ -1 +1,49 @@
+import googlemaps
+import pytest
+from unittest.mock import patch
+from .geo_service import GeoService
+from .models import Location
+from .types import RoutePolylineInput, RouteResponse
 
+
+class TestGeoService:
+    def test_get_routes(self):
+        # Given route inputs where one directions request fails
+        route_inputs = [RoutePolylineInput(start_lat=i, start_lon=i, end_lat=i + 1, end_lon=i + 1) for i in range(3)]
+
+        def get_route(route_input):
+            if route_input.start_lat == 1:
+                raise googlemaps.exceptions.ApiError("ZERO_RESULTS")
+            return RouteResponse(polyline=[], distance_km=route_input.start_lat)
+
+        # When the routes are fetched
+        with patch("planning.geo_service.GoogleMapsClient") as client:
+            client.return_value.get_route.side_effect = get_route
+            routes = GeoService().get_routes(route_inputs)
+
+        # Then the responses are returned in input order, with None for the failed one
+        assert [route.distance_km if route else None for route in routes] == [0, None, 2]
+
+    @pytest.mark.django_db
+    def test_search_many(self):
+        # Given a saved Tallinn and a provider that finds one location per search
+        tallinn = Location.objects.create(name="Tallinn", latitude=59.437, longitude=24.7536)
+
+        def search(search):
+            if search == "Riga":
+                return [Location(name="Riga", latitude="56.9496", longitude="24.1052")]
+            return [Location(name="Tallinn", latitude="59.437", longitude="24.7536")]
+
+        # When repeated searches are geocoded in one batch
+        with (
+            patch("planning.geo_service.OpenStreetMapGeocodingClient") as client,
+            patch.object(GeoService, "GEOCODING_CALLS_PER_SECOND", 1_000),
+        ):
+            client.return_value.search.side_effect = search
+            results = GeoService().search_many(["Tallinn", "Riga", "Tallinn", "Riga"])
+
+        # Then each distinct search is sent once, saved Locations are reused and new ones are created once
+        assert client.return_value.search.call_count == 2
+        assert results["Tallinn"] == [tallinn]
+        assert results["Riga"][0].name == "Riga"
+        assert Location.objects.count() == 2
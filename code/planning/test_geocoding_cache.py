@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.utils import timezone
+
+from .geo_service import GeoService
+from .geocoding_cache import GeocodingCache
+from .models import GeocodingResult, Location
+
+
+@pytest.fixture
+def tallinn():
+    return Location(name="Tallinn", country_code="EE", latitude=59.437, longitude=24.7536)
+
+
+@pytest.mark.django_db
+class TestGeocodingCache:
+    def test_equivalent_queries_hit(self, tallinn):
+        # Given a cached search
+        cache = GeocodingCache(capacity=8, max_rows=8, ttl=timedelta(days=1))
+        cache.set("Tallinn, Estonia", [tallinn])
+
+        # When an equivalent query is looked up
+        locations = cache.get("  tallinn   ESTONIA ")
+
+        # Then the cached locations are returned from memory
+        assert [location.name for location in locations] == ["Tallinn"]
+        assert cache.stats["memory_hits"] == 1
+
+    def test_falls_back_to_database(self, tallinn):
+        # Given a search cached by another process
+        GeocodingCache(capacity=8, max_rows=8, ttl=timedelta(days=1)).set("Tallinn", [tallinn])
+        cache = GeocodingCache(capacity=8, max_rows=8, ttl=timedelta(days=1))
+
+        # When it is looked up twice
+        cache.get("Tallinn")
+        cache.get("Tallinn")
+
+        # Then the first lookup reads the table and the second one memory
+        assert cache.stats == {"memory_hits": 1, "database_hits": 1, "misses": 0, "entries": 1}
+
+    def test_expired_entries_miss(self, tallinn):
+        cache = GeocodingCache(capacity=8, max_rows=8, ttl=timedelta(days=1))
+        cache.set("Tallinn", [tallinn])
+        GeocodingResult.objects.update(created_at=timezone.now() - timedelta(days=2))
+        cache.entries.clear()
+
+        assert cache.get("Tallinn") is None
+        assert cache.stats["misses"] == 1
+
+    def test_evicts_by_size(self, tallinn):
+        # Given a cache that keeps two entries in memory and two rows
+        cache = GeocodingCache(capacity=2, max_rows=2, ttl=timedelta(days=1))
+        for query in ["a", "b", "c"]:
+            cache.set(query, [tallinn])
+
+        # When the table is pruned
+        cache.prune()
+
+        # Then only the most recent entries are kept
+        assert list(cache.entries) == ["b", "c"]
+        assert set(GeocodingResult.objects.values_list("query", flat=True)) == {"b", "c"}
+
+
+@pytest.mark.django_db
+class TestGeoServiceSearch:
+    def test_search_is_cached(self, tallinn):
+        # Given a geocoding client that finds Tallinn
+        with patch("planning.geo_service.OpenStreetMapGeocodingClient") as client:
+            client.return_value.search.return_value = [tallinn]
+
+            # When the same place is searched twice
+            first = GeoService().search("Tallinn")
+            second = GeoService().search("tallinn")
+
+        # Then the provider is called once and both searches resolve to the same Location
+        assert client.return_value.search.call_count == 1
+        assert first == second
+        assert Location.objects.count() == 1
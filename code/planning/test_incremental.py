@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+
+from planning.incremental import IncrementalAssignment, IncrementalPlanner
+from planning.models import Location, Route, Shipment, Transport
+
+
+def get_optimal_cost(cost_matrix: np.ndarray) -> float:
+    rows, cols = linear_sum_assignment(cost_matrix)
+    return cost_matrix[rows, cols].sum()
+
+
+def get_assigned_cost(assignment: IncrementalAssignment) -> float:
+    return sum(cost for _, _, cost in assignment.assignment)
+
+
+class TestIncrementalAssignment:
+    def test_initial_solve(self):
+        # Given a rectangular cost matrix
+        cost_matrix = np.array([[4, 1, 3], [2, 0, 5]])
+
+        # When the assignment is built
+        assignment = IncrementalAssignment(["t0", "t1"], ["s0", "s1", "s2"], cost_matrix)
+
+        # Then it is optimal and the potentials are feasible and tight on assigned pairs
+        assert sorted(assignment.assignment) == [("t0", "s1", 1), ("t1", "s0", 2)]
+        reduced = assignment.cost - assignment.u[:, np.newaxis] - assignment.v[np.newaxis, :]
+        assert reduced.min() >= 0
+        assert np.allclose(reduced[np.arange(len(assignment)), assignment.row_to_col], 0)
+
+    def test_insert_and_remove_stay_optimal(self):
+        # Given a random assignment problem
+        rng = np.random.default_rng(0)
+        full_cost = rng.integers(0, 100, size=(30, 30)).astype(float)
+        rows, cols = list(range(10)), list(range(12))
+        assignment = IncrementalAssignment(rows, cols, full_cost[np.ix_(rows, cols)])
+
+        for step in range(60):
+            # When transports and shipments are added and removed one by one
+            match step % 4:
+                case 0:
+                    row = next(i for i in range(30) if i not in rows)
+                    assignment.insert_row(row, full_cost[row, [j for j in assignment.col_keys if j is not None]])
+                    rows.append(row)
+                case 1:
+                    col = next(j for j in range(30) if j not in cols)
+                    assignment.insert_col(col, full_cost[[i for i in assignment.row_keys if i is not None], col])
+                    cols.append(col)
+                case 2:
+                    row = rows.pop(int(rng.integers(len(rows))))
+                    assignment.remove_row(row)
+                case 3:
+                    col = cols.pop(int(rng.integers(len(cols))))
+                    assignment.remove_col(col)
+
+            # Then the repaired assignment costs as much as a fresh solve
+            assert get_assigned_cost(assignment) == get_optimal_cost(full_cost[np.ix_(rows, cols)])
+
+    def test_drop_assigned(self):
+        # Given an optimal assignment
+        cost_matrix = np.array([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+        assignment = IncrementalAssignment(["t0", "t1", "t2"], ["s0", "s1", "s2"], cost_matrix)
+
+        # When an assigned pair leaves the problem together
+        assignment.drop_assigned({"t0"}, {"s1"})
+
+        # Then it is cut out and the rest stays assigned
+        assert len(assignment) == 2
+        assert sorted(assignment.assignment) == [("t1", "s0", 2), ("t2", "s2", 2)]
+
+
+@pytest.mark.django_db
+class TestIncrementalPlanner:
+    def test_sync_matches_full_solve(self):
+        # Given transports and shipments spread along a line, planned once
+        locations = [Location.objects.create(latitude=0, longitude=i) for i in range(12)]
+        transports = [Transport.objects.create(name=f"t{i}", location=locations[i]) for i in range(10)]
+        shipments = [Shipment.objects.create(name=f"s{i}", location=locations[i + 1]) for i in range(10)]
+        planner = IncrementalPlanner()
+        planner.REBUILD_FRACTION = 0.5
+        planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+
+        # When one shipment is removed and another is added
+        shipments = shipments[1:] + [Shipment.objects.create(name="s10", location=locations[0])]
+        assignment = planner.assignment
+        allocation = planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+
+        # Then the assignment is repaired in place and matches a fresh solve
+        fresh_planner = IncrementalPlanner()
+        fresh_planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+        assert planner.assignment is assignment
+        assert len(allocation) == 10
+        assert get_assigned_cost(assignment) == get_assigned_cost(fresh_planner.assignment)
+
+    def test_new_route_rebuilds(self):
+        # Given a transport and a shipment planned once
+        transport_location = Location.objects.create(latitude=0, longitude=0)
+        shipment_location = Location.objects.create(latitude=0, longitude=1)
+        transports = [Transport.objects.create(name="t0", location=transport_location)]
+        shipments = [Shipment.objects.create(name="s0", location=shipment_location)]
+        planner = IncrementalPlanner()
+        planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+        assignment = planner.assignment
+
+        # When a route between them is fetched
+        Route.objects.create(location_start=transport_location, location_end=shipment_location, distance_km=500)
+        planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+
+        # Then the assignment is rebuilt with the route distance
+        assert planner.assignment is not assignment
+        assert get_assigned_cost(planner.assignment) == 500
+
+    def test_routes_of_planned_pairs_keep_the_assignment(self):
+        # Given an optimisation whose planned pairs then got their routes fetched, as the optimisation job does
+        locations = [Location.objects.create(latitude=0, longitude=i / 10) for i in range(43)]
+        transports = [Transport.objects.create(name=f"t{i}", location=locations[i]) for i in range(36)]
+        shipments = [Shipment.objects.create(name=f"s{i}", location=locations[36 + i]) for i in range(6)]
+        planner = IncrementalPlanner()
+        allocation = planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+        for transport, shipment in allocation.items():
+            Route.objects.create(location_start=transport.location, location_end=shipment.location, distance_km=1)
+        assignment = planner.assignment
+
+        # When the planned entities leave the unplanned sets and a shipment is added
+        transports = [transport for transport in transports if transport not in allocation]
+        shipments = [Shipment.objects.create(name="s6", location=locations[42])]
+        allocation = planner.optimal_resource_allocation(transports, shipments, max_empty_km=3000)
+
+        # Then the assignment is repaired instead of rebuilt
+        assert planner.assignment is assignment
+        assert len(allocation) == 1
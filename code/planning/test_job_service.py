@@ -0,0 +1,70 @@
+import pytest
+from unittest.mock import patch
+from django.utils import timezone
+from .job_service import JobService
+from .models import Job, Planning
+from .types import JobKind, JobStatus, RouteResponse, SolverStrategy
+
+
+@pytest.mark.django_db
+class TestJobService:
+    def test_enqueue(self):
+        job = JobService().enqueue(JobKind.APPLY_OPTIMAL_PLANNING, max_empty_km=100)
+        assert job.status == JobStatus.PENDING.value
+        assert Job.objects.get(id=job.id).payload == {"max_empty_km": 100}
+
+    def test_run_apply_optimal_planning(self, transport, shipment):
+        # Given an enqueued optimisation job
+        job = JobService().enqueue(JobKind.APPLY_OPTIMAL_PLANNING)
+        route_response = RouteResponse(polyline=[[50.0, 30.0]], distance_km=0)
+
+        # When the job runs
+        with patch("planning.geo_service.GoogleMapsClient") as client:
+            client.return_value.get_route.return_value = route_response
+            JobService().run(job.id)
+
+        # Then the planning is applied, its route fetched and the job marked as finished
+        job.refresh_from_db()
+        assert job.status == JobStatus.SUCCEEDED.value
+        assert job.progress == 1
+        assert JobService().is_finished(job)
+        assert Planning.objects.get(transport=transport, shipment=shipment).route is not None
+
+    def test_run_apply_optimal_planning_result(self, transport, shipment):
+        # Given an enqueued greedy optimisation
+        job = JobService().enqueue(JobKind.APPLY_OPTIMAL_PLANNING, strategy=SolverStrategy.GREEDY.value)
+
+        # When the job runs
+        with patch("planning.service.PlanningService.request_routes"):
+            JobService().run(job.id)
+
+        # Then the job keeps the quality of the assignment
+        job.refresh_from_db()
+        assert job.result == {"strategy": "greedy", "matched": 1, "objective": 0, "lower_bound": 0, "gap": 0}
+
+    def test_run_failed(self):
+        job = JobService().enqueue(JobKind.FETCH_ROUTES)
+        with patch("planning.service.PlanningService.request_routes", side_effect=RuntimeError("boom")):
+            JobService().run(job.id)
+
+        job.refresh_from_db()
+        assert job.status == JobStatus.FAILED.value
+        assert "boom" in job.error
+        assert job.finished_at is not None
+
+    def test_fail_interrupted(self):
+        # Given jobs left unfinished by a previous process, and one enqueued since this one started
+        pending = Job.objects.create(kind=JobKind.FETCH_ROUTES.value)
+        running = Job.objects.create(kind=JobKind.FETCH_ROUTES.value, status=JobStatus.RUNNING.value)
+        started_at = timezone.now()
+        current = Job.objects.create(kind=JobKind.FETCH_ROUTES.value)
+
+        # When they are recovered
+        assert JobService().fail_interrupted(started_at) == 2
+
+        # Then only the old ones are failed, with a reason
+        for job in (pending, running):
+            job.refresh_from_db()
+            assert job.status == JobStatus.FAILED.value and "restart" in job.error
+        current.refresh_from_db()
+        assert current.status == JobStatus.PENDING.value
@@ -47,6 +47,17 @@ class TestRoute:
         route = Route(polyline=json.dumps([[1.0, 2.0], [3.0, 4.0]]))
         assert route.polyline_array == [[1.0, 2.0], [3.0, 4.0]]
 
+    def test_coordinates_packed(self):
+        route = Route()
+        route.set_coordinates([[56.946, 24.10589], [56.95, 24.2]])
+        route.save()
+        route = Route.objects.get(id=route.id)
+        assert route.polyline == ""
+        assert route.polyline_array == [[56.946, 24.10589], [56.95, 24.2]]
+
+    def test_coordinates_empty(self):
+        assert Route().coordinates.shape == (0, 2)
+
 
 @pytest.mark.django_db
 class TestPlanning:
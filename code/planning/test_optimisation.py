@@ -1,7 +1,11 @@
+import time
+
 import pytest
 import numpy as np
+from planning import assignment
 from planning.optimisation import PlanningOptimisationService
-from planning.models import Shipment, Transport, Location
+from planning.models import Shipment, Transport, Location, Route
+from planning.types import SolverStrategy
 
 
 @pytest.mark.django_db
@@ -54,3 +58,203 @@ class TestPlanningOptimisationService:
         assert allocation[transport_0] == shipment_0
         assert allocation[transport_1] == shipment_1
         assert allocation[transport_2] == shipment_2
+
+    def test_get_cost_matrix(self, location_new_york, location_los_angeles):
+        # Given transports and shipments, with one known road route
+        location_new_york.save()
+        location_los_angeles.save()
+        transports = [
+            Transport.objects.create(name="transport_ny", location=location_new_york),
+            Transport.objects.create(name="transport_la", location=location_los_angeles),
+        ]
+        shipments = [
+            Shipment.objects.create(name="shipment_la", location=location_los_angeles),
+            Shipment.objects.create(name="shipment_ny_0", location=location_new_york),
+            Shipment.objects.create(name="shipment_ny_1", location=location_new_york),
+        ]
+        Route.objects.create(
+            location_start=location_los_angeles, location_end=location_new_york, polyline="[]", distance_km=4500
+        )
+
+        # When get_cost_matrix is called
+        cost_matrix = PlanningOptimisationService().get_cost_matrix(
+            transports=transports, shipments=shipments, max_empty_km=10_000
+        )
+
+        # Then great-circle distances are used, overlaid with the known route distance
+        assert cost_matrix.shape == (2, 3)
+        assert cost_matrix[0, 0] == 3936
+        assert cost_matrix[0, 1] == cost_matrix[0, 2] == 0
+        assert cost_matrix[1, 1] == cost_matrix[1, 2] == 4500
+        assert cost_matrix[1, 0] == 0
+
+    def test_get_cost_matrix_infeasible(self, location_new_york, location_los_angeles):
+        # Given a transport and shipment further apart than max_empty_km
+        transports = [Transport(name="transport_ny", location=location_new_york)]
+        shipments = [Shipment(name="shipment_la", location=location_los_angeles)]
+
+        # When get_cost_matrix is called
+        cost_matrix = PlanningOptimisationService().get_cost_matrix(
+            transports=transports, shipments=shipments, max_empty_km=1_000
+        )
+
+        # Then the pair is marked as infeasible
+        assert cost_matrix[0, 0] == PlanningOptimisationService.INFEASIBLE_COST
+
+    def test_optimal_resource_allocation_sparse(self):
+        # Given transports and shipments spread across Europe, with some pairs beyond max_empty_km
+        rng = np.random.default_rng(42)
+        for i in range(25):
+            location = Location.objects.create(latitude=rng.uniform(40, 60), longitude=rng.uniform(-5, 25))
+            Transport.objects.create(name=f"transport_{i}", location=location)
+        for i in range(20):
+            location = Location.objects.create(latitude=rng.uniform(40, 60), longitude=rng.uniform(-5, 25))
+            Shipment.objects.create(name=f"shipment_{i}", location=location)
+
+        # When the sparse and the dense engines are used
+        service = PlanningOptimisationService()
+        kwargs = dict(transports=Transport.objects.all(), shipments=Shipment.objects.all(), max_empty_km=400)
+        allocation_dense = service.optimal_resource_allocation(**kwargs, sparse=False)
+        allocation_sparse = service.optimal_resource_allocation(**kwargs, sparse=True)
+
+        # Then both find allocations of the same size and total distance
+        transports, shipments = list(Transport.objects.all()), list(Shipment.objects.all())
+        cost_matrix = service.get_cost_matrix(transports=transports, shipments=shipments, max_empty_km=400)
+
+        def total_km(allocation):
+            return sum(cost_matrix[transports.index(t), shipments.index(s)] for t, s in allocation.items())
+
+        assert 0 < len(allocation_sparse) == len(allocation_dense)
+        assert total_km(allocation_sparse) == total_km(allocation_dense)
+        assert all(cost_matrix[transports.index(t), shipments.index(s)] <= 400 for t, s in allocation_sparse.items())
+
+    def test_get_existing_pair_routes(self):
+        # Given routes between two starts and two ends
+        starts = [Location.objects.create(latitude=50.0, longitude=i) for i in range(2)]
+        ends = [Location.objects.create(latitude=51.0, longitude=i) for i in range(2)]
+        for i, start in enumerate(starts):
+            for j, end in enumerate(ends):
+                Route.objects.create(location_start=start, location_end=end, polyline="[]", distance_km=10 * i + j)
+
+        # When only the diagonal pairs are looked up, one start per query
+        service = PlanningOptimisationService()
+        service.ROUTE_LOOKUP_MAX_PARAMS = 2
+        rows, cols, distances = service.get_existing_route_indices(
+            [start.id for start in starts], [end.id for end in ends], pairs=(np.array([1, 0]), np.array([1, 0]))
+        )
+
+        # Then only their routes are returned, not the cross product
+        assert sorted(zip(rows.tolist(), cols.tolist(), distances.tolist())) == [(0, 0, 0.0), (1, 1, 11.0)]
+
+    def test_get_existing_pair_routes_without_routes(self, django_assert_num_queries):
+        # Given many candidate pairs and no routes at all
+        locations = [Location.objects.create(latitude=50.0, longitude=i) for i in range(3)]
+        rows, cols = np.repeat(np.arange(3), 3), np.tile(np.arange(3), 3)
+
+        # When their routes are looked up
+        # Then a single query finds there is nothing to look up
+        with django_assert_num_queries(1):
+            routes = PlanningOptimisationService().get_existing_pair_routes(
+                [location.id for location in locations], [location.id for location in locations], rows, cols
+            )
+        assert routes == []
+
+    def test_get_existing_pair_routes_many_ends(self):
+        # Given a start with a route to an end outside the lookup, and more ends than fit one query
+        start = Location.objects.create(latitude=50.0, longitude=0)
+        ends = [Location.objects.create(latitude=51.0, longitude=i) for i in range(4)]
+        Route.objects.create(location_start=start, location_end=ends[1], distance_km=5)
+        Route.objects.create(location_start=start, location_end=ends[3], distance_km=7)
+        outside = Location.objects.create(latitude=52.0, longitude=0)
+        Route.objects.create(location_start=start, location_end=outside, distance_km=9)
+
+        # When three of its pairs are looked up without an end filter
+        service = PlanningOptimisationService()
+        service.ROUTE_LOOKUP_MAX_PARAMS = 4
+        rows, cols, distances = service.get_existing_route_indices(
+            [start.id], [end.id for end in ends], pairs=(np.zeros(3, dtype=np.intp), np.array([0, 1, 2]))
+        )
+
+        # Then only the route of a wanted pair is kept
+        assert list(zip(rows.tolist(), cols.tolist(), distances.tolist())) == [(0, 1, 5.0)]
+
+    def test_optimal_resource_allocation_regions_in_parallel(self, settings):
+        # Given two fleets in regions further apart than max_empty_km
+        for region, longitude in enumerate([0.0, 40.0]):
+            for i in range(3):
+                location = Location.objects.create(latitude=50.0 + i / 10, longitude=longitude)
+                Transport.objects.create(name=f"transport_{region}_{i}", location=location)
+                Shipment.objects.create(name=f"shipment_{region}_{i}", location=location)
+
+        # When each region is solved in its own worker process
+        settings.ASSIGNMENT_WORKERS = 2
+        service = PlanningOptimisationService()
+        service.PARALLEL_MIN_PAIRS = 1
+        allocation = service.optimal_resource_allocation(
+            transports=Transport.objects.all(), shipments=Shipment.objects.all(), max_empty_km=500, sparse=True
+        )
+
+        # Then the merged allocation pairs everyone within their region at zero empty km
+        assert {transport.name: shipment.name for transport, shipment in allocation.items()} == {
+            f"transport_{region}_{i}": f"shipment_{region}_{i}" for region in range(2) for i in range(3)
+        }
+
+    def test_optimal_resource_allocation_anytime_past_deadline(self):
+        # Given two fleets in regions further apart than max_empty_km
+        for region, longitude in enumerate([0.0, 40.0]):
+            for i in range(3):
+                location = Location.objects.create(latitude=50.0 + i / 10, longitude=longitude)
+                Transport.objects.create(name=f"transport_{region}_{i}", location=location)
+                Shipment.objects.create(name=f"shipment_{region}_{i}", location=location)
+
+        # When the time is already up
+        allocation = PlanningOptimisationService().optimal_resource_allocation(
+            transports=Transport.objects.all(),
+            shipments=Shipment.objects.all(),
+            max_empty_km=500,
+            strategy=SolverStrategy.ANYTIME,
+            deadline=time.time(),
+        )
+
+        # Then every region still gets the greedy allocation, which here is the optimum
+        assert {transport.name: shipment.name for transport, shipment in allocation.items()} == {
+            f"transport_{region}_{i}": f"shipment_{region}_{i}" for region in range(2) for i in range(3)
+        }
+
+    @pytest.fixture
+    def random_pairs(self):
+        rng = np.random.default_rng(3)
+        rows, cols = np.nonzero(rng.random((40, 30)) < 0.2)
+        return rows, cols, rng.integers(0, 100, size=len(rows)).astype(np.float64)
+
+    def test_anytime_solves_exactly_with_time_left(self, random_pairs, settings):
+        # Given a problem large enough for a worker process
+        settings.ASSIGNMENT_WORKERS = 1
+        service = PlanningOptimisationService()
+        service.PARALLEL_MIN_PAIRS = 1
+
+        # When there is plenty of time
+        result = service.get_decomposed_assignment(
+            random_pairs, 40, 30, strategy=SolverStrategy.ANYTIME, deadline=time.time() + 60
+        )
+
+        # Then the worker's exact solution is used
+        exact = assignment.solve_sparse(random_pairs, 40, 30, service.INFEASIBLE_COST)
+        assert result.objective == result.lower_bound == exact.objective
+
+    def test_anytime_keeps_local_search_when_exact_is_late(self, random_pairs, settings):
+        # Given a problem for a worker process that can't even start before the deadline
+        settings.ASSIGNMENT_WORKERS = 1
+        service = PlanningOptimisationService()
+        service.PARALLEL_MIN_PAIRS = 1
+
+        # When the deadline is close
+        started = time.time()
+        result = service.get_decomposed_assignment(
+            random_pairs, 40, 30, strategy=SolverStrategy.ANYTIME, deadline=started + 0.01
+        )
+
+        # Then the greedy allocation improved by local search is returned without waiting for the worker
+        greedy = assignment.solve_greedy(random_pairs, 40, 30, service.INFEASIBLE_COST)
+        assert result.objective <= greedy.objective
+        assert time.time() - started < 5
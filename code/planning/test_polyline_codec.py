@@ -0,0 +1,33 @@
+import numpy as np
+import polyline
+
+from . import polyline_codec
+
+
+class TestPolylineCodec:
+    def test_pack_and_unpack(self):
+        # Given coordinates with more precision than stored
+        coordinates = np.array([[56.946001, 24.105891], [56.95, 24.2], [-33.8688, 151.2093]])
+
+        # When they are packed and unpacked
+        packed = polyline_codec.pack(coordinates)
+        unpacked = polyline_codec.unpack(packed)
+
+        # Then every point takes 8 bytes and is kept to 1e-5 degrees
+        assert len(packed) == 8 * len(coordinates)
+        assert np.allclose(unpacked, coordinates, atol=1e-5)
+
+    def test_pack_empty(self):
+        assert polyline_codec.unpack(polyline_codec.pack([])).shape == (0, 2)
+
+    def test_decode_google(self):
+        # Given a polyline encoded by Google's algorithm
+        coordinates = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453), (56.94601, 24.10589)]
+        encoded = polyline.encode(coordinates)
+
+        # When it is decoded
+        decoded = polyline_codec.decode_google(encoded)
+
+        # Then it matches the reference decoder
+        assert np.allclose(decoded, polyline.decode(encoded))
+        assert polyline_codec.decode_google("").shape == (0, 2)
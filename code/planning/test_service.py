@@ -1,8 +1,13 @@
+import uuid
+
+import numpy as np
 import pytest
 from unittest.mock import patch
+from . import simplification
 from .service import PlanningService
-from .models import Planning, Route, Transport, Shipment
-from .types import EntityType, PlanningRequest, RouteResponse
+from .models import Location, Planning, Route, RoutePolylineLevel, Transport, Shipment
+from .optimisation import PlanningOptimisationService
+from .types import EntityRecord, EntityType, PlanningRequest, RouteResponse, SolverStrategy
 
 
 @pytest.mark.django_db
@@ -40,14 +45,23 @@ class TestPlanningService:
         planning.refresh_from_db()
         assert planning.route == route
 
-    def test_get_planning_polylines(self, planning, route):
-        polylines = PlanningService().get_planning_polylines(planning_set=PlanningService().get_planning_set())
-        assert polylines == []
-
+    def test_get_routes_geojson_level_of_detail(self, planning):
+        # Given a planned route with many points on a straight line
+        route = Route()
+        route.set_coordinates(np.column_stack([np.linspace(50, 51, 100), np.full(100, 30)]))
+        route.save()
         planning.route = route
         planning.save()
-        polylines = PlanningService().get_planning_polylines(planning_set=PlanningService().get_planning_set())
-        assert polylines == [route.polyline_array]
+        routes = PlanningService().get_planned_routes()
+
+        # When the geometry is requested for a far and a close zoom
+        far = PlanningService().get_routes_geojson(routes, level=simplification.get_level(3))
+        close = PlanningService().get_routes_geojson(routes, level=simplification.get_level(15))
+
+        # Then the far one is simplified and stored, the close one has every point
+        assert far["features"][0]["geometry"]["coordinates"] == [[30.0, 50.0], [30.0, 51.0]]
+        assert len(close["features"][0]["geometry"]["coordinates"]) == 100
+        assert RoutePolylineLevel.objects.filter(route=route).count() == 3
 
     def test_cancel_planning(self, planning):
         PlanningService().cancel_planning(planning_id=planning.id)
@@ -66,7 +80,7 @@ class TestPlanningService:
         assert PlanningService().get_route_existing(transport, shipment) == route
 
     def test_get_route(self, transport, shipment, route):
-        route_response = RouteResponse(polyline=route.polyline, distance_km=route.distance_km)
+        route_response = RouteResponse(polyline=route.coordinates, distance_km=route.distance_km)
         with patch("planning.geo_service.GeoService.get_route", return_value=route_response):
             route_new = PlanningService().get_route(transport, shipment)
         assert isinstance(route_new, Route)
@@ -80,6 +94,21 @@ class TestPlanningService:
         assert Planning.objects.filter(transport=transport, shipment=shipment).exists()
         assert transport.planned_shipment == shipment
 
+    def test_get_map_extent(self, planning):
+        # Given a planning and an unplanned shipment elsewhere
+        location = Location.objects.create(latitude=60.0, longitude=20.0)
+        Shipment.objects.create(name="Unplanned", location=location)
+
+        # When the map extent is computed from the snapshot
+        extent = PlanningService().get_map_extent(PlanningService().get_planning_set())
+
+        # Then it bounds every location, the centroid lies inside
+        assert extent.bbox == (20.0, 50.0, 30.0, 60.0)
+        assert 50 < extent.center[0] < 60 and 20 < extent.center[1] < 30
+
+    def test_get_map_extent_empty(self):
+        assert PlanningService().get_map_extent(PlanningService().get_planning_set()) is None
+
     def test_apply_optimal_planning(self, shipment, transport):
         PlanningService().apply_optimal_planning()
         plannings = Planning.objects.filter(shipment=shipment, transport=transport)
@@ -87,6 +116,35 @@ class TestPlanningService:
         assert plannings.first().transport == transport
         assert plannings.first().shipment == shipment
 
+    def test_apply_optimal_planning_large_skips_incremental(self, shipment, transport, monkeypatch):
+        # Given a problem at the size where the sparse solvers take over
+        monkeypatch.setattr(PlanningOptimisationService, "SPARSE_MIN_PAIRS", 1)
+
+        # When it is optimised incrementally
+        with patch("planning.service.incremental_planner") as planner:
+            PlanningService().apply_optimal_planning(incremental=True)
+
+        # Then the dense incremental planner is not used
+        planner.optimal_resource_allocation.assert_not_called()
+        assert Planning.objects.get(shipment=shipment).transport == transport
+
+    @pytest.mark.parametrize("strategy", list(SolverStrategy))
+    def test_apply_optimal_planning_strategy(self, strategy, shipment, transport):
+        result = PlanningService().apply_optimal_planning(strategy=strategy)
+        assert Planning.objects.get(shipment=shipment).transport == transport
+        assert result.objective == 0 and result.gap == 0
+
+    def test_reset_planning_fast_delete(self, location, django_assert_num_queries):
+        # Given many plannings
+        for i in range(20):
+            transport = Transport.objects.create(name=f"t{i}", location=location)
+            Planning.objects.create(transport=transport, shipment=Shipment.objects.create(name=f"s{i}"))
+
+        # When they are reset, then it is one DELETE without fetching the rows
+        with django_assert_num_queries(1):
+            PlanningService().reset_planning()
+        assert not Planning.objects.exists()
+
     def test_create_entity(self, location):
         created = PlanningService().create_entity(entity_type=EntityType.TRANSPORT, name="", location=location)
         assert isinstance(created, Transport)
@@ -94,6 +152,38 @@ class TestPlanningService:
         created = PlanningService().create_entity(entity_type=EntityType.SHIPMENT, name="", location=location)
         assert isinstance(created, Shipment)
 
+    def test_create_entities_bulk(self, location, django_assert_num_queries):
+        # Given records of both entity types
+        records = [
+            EntityRecord(entity_type=EntityType.SHIPMENT, name=f"Shipment {i}", location_id=str(location.id))
+            for i in range(3)
+        ] + [EntityRecord(entity_type=EntityType.TRANSPORT, name="Transport", location_id=location.id)]
+
+        # When they are created in bulk
+        with django_assert_num_queries(5):
+            created = PlanningService().create_entities_bulk(records)
+
+        # Then locations are validated once and each entity type is inserted once, in one transaction
+        assert [entity.name for entity in created] == ["Shipment 0", "Shipment 1", "Shipment 2", "Transport"]
+        assert Shipment.objects.filter(location=location).count() == 3
+        assert Transport.objects.filter(location=location).count() == 1
+
+    def test_create_entities_bulk_unknown_location(self, location):
+        records = [
+            EntityRecord(entity_type=EntityType.SHIPMENT, name="Known", location_id=location.id),
+            EntityRecord(entity_type=EntityType.SHIPMENT, name="Unknown", location_id=uuid.uuid4()),
+        ]
+        with pytest.raises(ValueError):
+            PlanningService().create_entities_bulk(records)
+        assert not Shipment.objects.exists()
+
+    def test_create_entities(self):
+        for i in range(4):
+            Location.objects.create(latitude=56 + i, longitude=24, country_code="LV")
+        PlanningService().create_entities()
+        assert Shipment.objects.count() == 2
+        assert Transport.objects.count() == 2
+
     def test_request_route(self, planning, route):
         assert planning.route is None
 
@@ -101,3 +191,39 @@ class TestPlanningService:
             PlanningService().request_route(planning_id=planning.id)
             planning.refresh_from_db()
             assert planning.route == route
+
+    def test_get_nearest_unplanned_shipments(self, transport, planning):
+        # Given unplanned shipments at increasing distance, and a planned one at the transport location
+        locations = [Location.objects.create(latitude=50.0 + i, longitude=30.0) for i in range(1, 4)]
+        shipments = [Shipment.objects.create(name=f"Shipment {i}", location=loc) for i, loc in enumerate(locations)]
+
+        # When the nearest unplanned shipments are requested
+        nearest = PlanningService().get_nearest_unplanned_shipments(transport, k=2)
+
+        # Then the closest unplanned ones are returned, closest first
+        assert nearest == shipments[:2]
+        assert PlanningService().get_unplanned_shipments_within(transport, radius_km=250) == shipments[:2]
+
+    def test_request_routes(self, transport, shipment):
+        # Given three plannings that share two distinct (start, end) location pairs
+        other_location = Location.objects.create(latitude=51.0, longitude=31.0)
+        other_shipment = Shipment.objects.create(name="Other shipment", location=other_location)
+        plannings = [
+            Planning.objects.create(transport=transport, shipment=shipment),
+            Planning.objects.create(transport=transport, shipment=other_shipment),
+            Planning.objects.create(
+                transport=Transport.objects.create(location=transport.location), shipment=shipment
+            ),
+        ]
+        route_response = RouteResponse(polyline=[[50.0, 30.0], [51.0, 31.0]], distance_km=140)
+
+        # When routes are requested for all of them
+        with patch("planning.geo_service.GoogleMapsClient") as client:
+            client.return_value.get_route.return_value = route_response
+            routes_fetched = PlanningService().request_routes(plannings)
+
+        # Then each distinct pair is fetched once and every planning gets a route
+        assert client.return_value.get_route.call_count == 2
+        assert routes_fetched == 3
+        assert Route.objects.count() == 2
+        assert Planning.objects.filter(route__isnull=True).exists() is False
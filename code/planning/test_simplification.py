@@ -0,0 +1,37 @@
+import numpy as np
+
+from . import simplification
+
+
+class TestSimplification:
+    def test_douglas_peucker(self):
+        # Given a line with a small wiggle and one sharp corner
+        coordinates = np.array([[0, 0], [0.00001, 1], [0, 2], [1, 3], [0, 4]])
+
+        # When it is simplified
+        keep = simplification.douglas_peucker(coordinates, tolerance=0.001)
+
+        # Then the wiggle is dropped, the ends and the corner are kept
+        assert keep.tolist() == [True, False, True, True, True]
+
+    def test_douglas_peucker_short(self):
+        assert simplification.douglas_peucker(np.empty((0, 2)), tolerance=1).tolist() == []
+        assert simplification.douglas_peucker(np.array([[0, 0], [1, 1]]), tolerance=1).tolist() == [True, True]
+
+    def test_get_level(self):
+        assert simplification.get_level(3) == 0
+        assert simplification.get_level(6) == 1
+        assert simplification.get_level(11) == 2
+        assert simplification.get_level(12) is None
+
+    def test_coarser_levels_keep_fewer_points(self):
+        # Given a noisy route of a thousand points
+        rng = np.random.default_rng(0)
+        coordinates = np.column_stack([np.linspace(50, 55, 1000), np.linspace(20, 30, 1000)])
+        coordinates += rng.normal(scale=0.001, size=coordinates.shape)
+
+        # When it is simplified for each level
+        sizes = [len(simplification.simplify(coordinates, level)) for level in range(3)]
+
+        # Then coarser levels keep fewer points
+        assert sizes[0] <= sizes[1] < sizes[2] < len(coordinates)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from .models import Location
+from .spatial_index import SpatialIndex, location_index
+
+
+class TestSpatialIndex:
+    @pytest.fixture
+    def spatial_index(self):
+        coordinates = np.array([[56.9496, 24.1052], [54.6872, 25.2797], [59.4370, 24.7536], [52.5200, 13.4050]])
+        return SpatialIndex(["riga", "vilnius", "tallinn", "berlin"], coordinates)
+
+    def test_within_radius(self, spatial_index):
+        # When searching within 300 km of Riga
+        neighbours = spatial_index.within_radius(56.9496, 24.1052, radius_km=300)
+
+        # Then Riga, Vilnius and Tallinn are returned closest first
+        assert [location_id for location_id, _ in neighbours] == ["riga", "vilnius", "tallinn"]
+        assert neighbours[0][1] == 0
+
+    def test_nearest(self, spatial_index):
+        neighbours = spatial_index.nearest(52.0, 13.0, k=2)
+        assert [location_id for location_id, _ in neighbours] == ["berlin", "vilnius"]
+
+    def test_nearest_more_than_size(self, spatial_index):
+        assert len(spatial_index.nearest(0, 0, k=10)) == 4
+
+    def test_query_pairs(self, spatial_index):
+        other = SpatialIndex(["berlin"], np.array([[52.5200, 13.4050]]))
+        rows, cols, distances = spatial_index.query_pairs(other, max_km=900)
+        assert sorted(rows.tolist()) == [0, 1, 3]
+        assert np.isclose(distances[rows == 3], 0).all()
+
+
+@pytest.mark.django_db
+class TestLocationIndex:
+    def test_kept_up_to_date(self):
+        # Given an index built over existing locations
+        riga = Location.objects.create(name="Riga", latitude=56.9496, longitude=24.1052)
+        assert location_index.nearest(57, 24, k=1)[0][0] == riga.id
+
+        # When a location is added, moved and deleted
+        tallinn = Location.objects.create(name="Tallinn", latitude=59.4370, longitude=24.7536)
+        assert location_index.nearest(59, 24, k=1)[0][0] == tallinn.id
+
+        riga.latitude, riga.longitude = 52.5200, 13.4050
+        riga.save()
+        assert [n[0] for n in location_index.within_radius(57, 24, radius_km=200)] == []
+
+        tallinn.delete()
+
+        # Then queries see the changes without a rebuild
+        assert [n[0] for n in location_index.nearest(59, 24, k=5)] == [riga.id]
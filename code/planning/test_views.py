@@ -1,6 +1,11 @@
+import uuid
 import pytest
 from unittest.mock import patch
-from .models import Planning
+from django.db import transaction
+from django.urls import reverse
+from .planning_cache import planning_cache
+from .data_import import DataImportService
+from .models import Job, Location, Planning, Route, Shipment, Transport
 from .views import (
     LandingView,
     PlanningView,
@@ -9,9 +14,11 @@ from .views import (
     CancelPlanningView,
     LocationSearchView,
     LocationSearchResultSelectView,
+    NearestShipmentsView,
+    JobStatusView,
 )
 from .forms import CreateEntityForm, LocationSearchForm
-from .types import PlanningRequest
+from .types import JobKind, JobStatus, PlanningRequest
 from utils import make_request_get, make_request_post
 import json
 
@@ -86,3 +93,306 @@ class TestLocationSearchResultSelectView:
         response = make_request_post(view=LocationSearchResultSelectView, data={"data": form_data, "result": data})
         assert response.status_code == 200
         assert location_search_result_data.name in response.content.decode("utf-8")
+
+
+@pytest.mark.django_db
+class TestNearestShipmentsView:
+    def test_get(self, transport, shipment):
+        response = make_request_get(NearestShipmentsView, {"transport_id": transport.id})
+        assert response.status_code == 200
+        assert shipment.name in response.content.decode("utf-8")
+
+    def test_get_radius(self, transport, shipment):
+        response = make_request_get(NearestShipmentsView, {"transport_id": transport.id, "radius_km": "0"})
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize(
+        "params",
+        [{}, {"transport_id": "unknown"}, {"transport_id": uuid.uuid4()}, {"k": "many"}, {"k": -1}]
+        + [{"radius_km": "far"}, {"radius_km": -5}, {"radius_km": "nan"}, {"radius_km": "inf"}],
+    )
+    def test_get_invalid(self, transport, params):
+        params = {"transport_id": transport.id, **params} if params else params
+        response = make_request_get(NearestShipmentsView, params)
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestResourcesView:
+    def create_fleet(self, size: int):
+        for i in range(size):
+            location = Location.objects.create(latitude=50.0 + i / 100, longitude=30.0)
+            route = Route.objects.create(
+                location_start=location, location_end=location, polyline="[[50.0, 30.0]]", distance_km=i
+            )
+            transport = Transport.objects.create(name=f"Transport {i}", location=location)
+            shipment = Shipment.objects.create(name=f"Shipment {i}", location=location)
+            Planning.objects.create(transport=transport, shipment=shipment, route=route)
+            Transport.objects.create(name=f"Unplanned transport {i}", location=location)
+            Shipment.objects.create(name=f"Unplanned shipment {i}", location=location)
+
+    @pytest.mark.parametrize("fleet_size", [1, 25])
+    def test_get_constant_query_count(self, client, django_assert_num_queries, fleet_size):
+        # Given a fleet with planned and unplanned transports and shipments
+        self.create_fleet(fleet_size)
+
+        # When the resources page is rendered
+        # Then the query count does not depend on the fleet size
+        with django_assert_num_queries(4):
+            response = client.get(reverse("resources"))
+        assert response.status_code == 200
+        assert f"Unplanned shipment {fleet_size - 1}" in response.content.decode("utf-8")
+
+    def test_get_failed_job(self, client):
+        # Given the job the page was polling failed
+        job = Job.objects.create(kind=JobKind.FETCH_ROUTES.value, status=JobStatus.FAILED.value, error="Quota")
+        session = client.session
+        session["job_id"] = str(job.id)
+        session.save()
+
+        # When the page is rendered
+        content = client.get(reverse("resources")).content.decode("utf-8")
+
+        # Then the error is shown once
+        assert "Fetching routes failed: Quota" in content
+        assert "Quota" not in client.get(reverse("resources")).content.decode("utf-8")
+
+    def test_get_map_extent(self, client, planning):
+        # Given nothing but one planning at a single location
+        # When the resources page is rendered
+        content = client.get(reverse("resources")).content.decode("utf-8")
+
+        # Then the map fits that location
+        assert "bbox: [30.0, 50.0, 30.0, 50.0]" in content
+
+    def test_get_from_cache(self, client, django_assert_num_queries):
+        # Given a rendered resources page
+        self.create_fleet(3)
+        client.get(reverse("resources"))
+
+        # When it is requested again without changes
+        # Then the snapshot and fragments come from the cache without touching the database
+        with django_assert_num_queries(0):
+            response = client.get(reverse("resources"))
+        assert "Unplanned shipment 2" in response.content.decode("utf-8")
+
+    @pytest.mark.django_db(transaction=True)
+    def test_get_invalidated_on_change(self, client, planning):
+        # Given a cached resources page
+        client.get(reverse("resources"))
+
+        # When a planning is cancelled and a transport is renamed
+        client.post(reverse("cancel_planning"), data={"planning_id": planning.id})
+        transport = Transport.objects.get(id=planning.transport_id)
+        transport.name = "Renamed transport"
+        transport.save()
+
+        # Then the next render shows the change
+        content = client.get(reverse("resources")).content.decode("utf-8")
+        assert "No plannings" in content
+        assert "Renamed transport" in content
+
+    @pytest.mark.django_db(transaction=True)
+    def test_get_invalidated_after_commit(self, client, location):
+        # Given a cached resources page
+        version = planning_cache.version
+        client.get(reverse("resources"))
+
+        # When several rows change in one transaction
+        with patch.object(planning_cache, "invalidate", wraps=planning_cache.invalidate) as invalidate:
+            with transaction.atomic():
+                for i in range(3):
+                    Transport.objects.create(name=f"Transport {i}", location=location)
+
+                # Then nothing is invalidated before the commit
+                assert planning_cache.version == version
+
+        # And once after it
+        invalidate.assert_called_once()
+        assert planning_cache.version != version
+
+
+@pytest.mark.django_db
+class TestRoutesGeoJSONView:
+    @pytest.fixture
+    def routes(self, transport, shipment):
+        routes = []
+        for coordinates in [[[56.9, 24.1], [57.0, 24.3]], [[59.4, 24.7], [59.5, 24.8]]]:
+            route = Route()
+            route.set_coordinates(coordinates)
+            route.save()
+            Planning.objects.create(transport=transport, shipment=shipment, route=route)
+            routes.append(route)
+        return routes
+
+    def test_get(self, client, routes):
+        response = client.get(reverse("routes_geojson"), {"zoom": 15})
+        assert response.status_code == 200
+        features = response.json()["features"]
+        assert {feature["id"] for feature in features} == {str(route.id) for route in routes}
+        assert [[24.1, 56.9], [24.3, 57.0]] in [feature["geometry"]["coordinates"] for feature in features]
+
+    def test_get_bbox(self, client, routes):
+        # Given a viewport around Riga only
+        response = client.get(reverse("routes_geojson"), {"zoom": 15, "bbox": "23.5,56.5,25,57.5"})
+        assert [feature["id"] for feature in response.json()["features"]] == [str(routes[0].id)]
+
+    def test_get_fractional_zoom(self, client, routes):
+        response = client.get(reverse("routes_geojson"), {"zoom": "6.5"})
+        assert response.status_code == 200
+        assert len(response.json()["features"]) == 2
+
+    @pytest.mark.parametrize("params", [{"zoom": "far"}, {"zoom": "inf"}, {"bbox": "1,2,3"}, {"bbox": "a,b,c,d"}])
+    def test_get_invalid(self, client, params):
+        response = client.get(reverse("routes_geojson"), params)
+        assert response.status_code == 400
+
+    def test_get_not_modified(self, client, routes):
+        # Given a response the browser has cached
+        response = client.get(reverse("routes_geojson"), {"zoom": 6})
+        assert "Last-Modified" in response
+
+        # When it is revalidated, and again after the planned routes changed
+        revalidated = client.get(reverse("routes_geojson"), {"zoom": 6}, HTTP_IF_NONE_MATCH=response["ETag"])
+        routes[0].delete()
+        changed = client.get(reverse("routes_geojson"), {"zoom": 6}, HTTP_IF_NONE_MATCH=response["ETag"])
+
+        # Then only the unchanged one is not modified
+        assert revalidated.status_code == 304
+        assert changed.status_code == 200
+
+
+@pytest.mark.django_db
+class TestApplyOptimisedPlanningView:
+    def test_post(self, client):
+        response = client.post(reverse("apply_optimised_planning"), data={"max_empty_km": 500})
+        assert response.status_code == 302
+
+        job = Job.objects.get()
+        assert job.kind == JobKind.APPLY_OPTIMAL_PLANNING.value
+        assert client.session["job_id"] == str(job.id)
+
+    def test_post_strategy(self, client):
+        client.post(reverse("apply_optimised_planning"), data={"max_empty_km": 500, "strategy": "greedy"})
+
+        # The fast paths skip the incremental planner, the choice is kept for the form
+        job = Job.objects.get()
+        assert job.payload == {"max_empty_km": 500, "strategy": "greedy", "time_budget": None, "incremental": False}
+        assert client.session["strategy"] == "greedy"
+
+    def test_post_time_budget(self, client):
+        client.post(reverse("apply_optimised_planning"), data={"strategy": "anytime", "time_budget": 5})
+        assert Job.objects.get().payload["time_budget"] == 5
+        assert client.session["time_budget"] == 5
+
+    @pytest.mark.parametrize("data", [{"strategy": "unknown"}, {"strategy": "auction"}, {"max_empty_km": "far"}])
+    def test_post_invalid(self, client, data):
+        response = client.post(reverse("apply_optimised_planning"), data=data)
+        assert response.status_code == 400
+        assert not Job.objects.exists()
+
+
+@pytest.mark.django_db
+class TestJobStatusView:
+    def test_get(self):
+        job = Job.objects.create(kind=JobKind.FETCH_ROUTES.value, progress=0.5)
+        response = make_request_get(JobStatusView, {"job_id": job.id})
+        assert response.status_code == 200
+        assert "width: 50%" in response.content.decode("utf-8")
+
+    def test_get_finished(self):
+        job = Job.objects.create(kind=JobKind.FETCH_ROUTES.value, status=JobStatus.SUCCEEDED.value)
+        response = make_request_get(JobStatusView, {"job_id": job.id})
+        assert reverse("resources") in response.content.decode("utf-8")
+
+    def test_get_missing(self):
+        response = make_request_get(JobStatusView, {"job_id": uuid.uuid4()})
+        assert response.status_code == 200
+        assert reverse("resources") in response.content.decode("utf-8")
+
+
+class TestGeocodingCacheStatsView:
+    def test_get(self, client):
+        response = client.get(reverse("geocoding_cache_stats"))
+        assert response.status_code == 200
+        assert response.json() == {"memory_hits": 0, "database_hits": 0, "misses": 0, "entries": 0}
+
+
+@pytest.mark.django_db
+class TestDataImportViews:
+    def test_parse_and_apply(self, client, location):
+        # Given a pasted spreadsheet that was parsed into an upload
+        content = "Name\tCity\nAlice\tTallinn\nBob\tTallinn"
+        response = client.post(reverse("data_import_parse"), data={"spreadsheet_content": content})
+        token = response.context["upload"].token
+
+        # When the column mapping is applied with the upload token
+        data = {"upload_token": token, "Name_choice": "name", "City_choice": "location"}
+        with patch("planning.views.GeoService") as geo_service:
+            geo_service.return_value.search_many.return_value = {"Tallinn": [location]}
+            response = client.post(reverse("data_import_apply"), data={"data": json.dumps(data)})
+
+        # Then the cached rows are mapped and geocoded
+        geo_service.return_value.search_many.assert_called_once_with(["Tallinn", "Tallinn"])
+        assert [result.name for result in response.context["results"]] == ["Alice", "Bob"]
+        assert "next_data" not in response.context
+
+    def test_apply_next_page(self, client, location, monkeypatch):
+        # Given an upload with more rows than fit on a page
+        monkeypatch.setattr(DataImportService, "PAGE_SIZE", 1)
+        content = "Name\tCity\nAlice\tTallinn\nBob\tTallinn"
+        token = (
+            client.post(reverse("data_import_parse"), data={"spreadsheet_content": content}).context["upload"].token
+        )
+        data = {"upload_token": token, "Name_choice": "name", "City_choice": "location"}
+
+        # When the first page and then the page it links to are applied
+        with patch("planning.views.GeoService") as geo_service:
+            geo_service.return_value.search_many.return_value = {"Tallinn": [location]}
+            response = client.post(reverse("data_import_apply"), data={"data": json.dumps(data)})
+            next_data = response.context["next_data"]
+            next_response = client.post(reverse("data_import_apply"), data={"data": next_data})
+
+        # Then only one row is geocoded and rendered per page
+        assert [result.name for result in response.context["results"]] == ["Alice"]
+        assert [result.name for result in next_response.context["results"]] == ["Bob"]
+        assert "next_data" not in next_response.context
+
+    def test_apply_expired_upload(self, client):
+        data = {"upload_token": "expired", "Name_choice": "name", "spreadsheet_content": "Name\nAlice"}
+        response = client.post(reverse("data_import_apply"), data={"data": json.dumps(data)})
+        assert response.status_code == 400
+
+    def test_create_entities(self, client, location):
+        records = [{"name": "Alice", "location": str(location.id)}, {"name": "Bob", "location": str(location.id)}]
+        response = client.post(reverse("data_import_create_entities"), data={"records": json.dumps(records)})
+        assert response.status_code == 200
+        assert set(Shipment.objects.values_list("name", flat=True)) == {"Alice", "Bob"}
+
+    def test_create_entities_without_location(self, client, location):
+        # Given a row that had no geocoding options, so no location was posted for it
+        records = [{"name": "Alice", "location": str(location.id)}, {"name": "Bob"}]
+
+        # When the records are created
+        response = client.post(reverse("data_import_create_entities"), data={"records": json.dumps(records)})
+
+        # Then the other rows are created and the skipped one is reported
+        assert response.status_code == 200
+        assert list(Shipment.objects.values_list("name", flat=True)) == ["Alice"]
+        assert "skipped 1 without a location" in response.content.decode("utf-8")
+
+    @pytest.mark.parametrize("data", [{"name": "Alice"}, {"name": "Alice", "location": "not-a-location"}])
+    def test_create_entity_without_location(self, client, data):
+        response = client.post(reverse("data_import_create_entity"), data=data)
+        assert response.status_code == 400
+        assert not Shipment.objects.exists()
+
+    @pytest.mark.parametrize("data", [{}, {"records": "not json"}, {"records": "{}"}])
+    def test_create_entities_malformed(self, client, data):
+        response = client.post(reverse("data_import_create_entities"), data=data)
+        assert response.status_code == 400
+
+    def test_create_entities_unknown_location(self, client):
+        records = [{"name": "Alice", "location": "not-a-location"}]
+        response = client.post(reverse("data_import_create_entities"), data={"records": json.dumps(records)})
+        assert response.status_code == 400
@@ -5,6 +5,9 @@ from enum import Enum
 from django.db.models import QuerySet
 from .models import Planning, Route, Shipment, Transport, Location
 
+# west, south, east, north degrees, like GeoJSON and Leaflet's toBBoxString
+BoundingBox = tuple[float, float, float, float]
+
 
 @dataclass
 class PlanningSet:
@@ -15,6 +18,13 @@ class PlanningSet:
     total_empty_km: float
 
 
+@dataclass
+class MapExtent:
+    # Spherical centroid as (latitude, longitude) and the bounds of everything on the map
+    center: tuple[float, float]
+    bbox: BoundingBox
+
+
 @dataclass
 class DataclassJSONMixin:
     def get_as_dict(self, json_vals=False) -> dict[str, Any]:
@@ -53,6 +63,28 @@ class EntityType(DjangoChoicesEnum):
     SHIPMENT = "shipment"
 
 
+class JobKind(DjangoChoicesEnum):
+    APPLY_OPTIMAL_PLANNING = "apply_optimal_planning"
+    FETCH_ROUTES = "fetch_routes"
+
+
+class SolverStrategy(DjangoChoicesEnum):
+    EXACT = "exact"
+    GREEDY = "greedy"
+    ANYTIME = "anytime"
+
+
+class JobStatus(DjangoChoicesEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+    @property
+    def is_finished(self) -> bool:
+        return self in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+
+
 @dataclass
 class PlanningRequest(DataclassJSONMixin):
     transport_id: str
@@ -82,6 +114,21 @@ class RouteResponse:
     distance_km: float
 
 
+@dataclass
+class EntityRecord:
+    entity_type: EntityType
+    name: str
+    location_id: str
+
+
+@dataclass
+class SpreadsheetUpload:
+    token: str
+    columns: list[str]
+    preview: list[list[str]]
+    row_count: int
+
+
 @dataclass
 class DataImportParsingOptions:
     location: str
@@ -1,16 +1,33 @@
 import json
+import math
 
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import HttpResponse, redirect, render, reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 from django.views.generic import FormView, TemplateView, View
 from django_view_decorator import view
 from utils import timer
 
+from . import simplification
 from .data_import import DataImportService
 from .forms import CreateEntityForm, DeleteEntityForm, LocationSearchForm, OptimisePlanningForm, DataImportForm
 from .geo_service import GeoService
+from .geocoding_cache import geocoding_cache
+from .job_service import JobService
 from .models import Location, Shipment, Transport
+from .planning_cache import planning_cache
 from .service import PlanningService
-from .types import EntityType, DataImportParsingOptions, PlanningRequest
+from .types import (
+    EntityRecord,
+    EntityType,
+    DataImportParsingOptions,
+    JobKind,
+    JobStatus,
+    PlanningRequest,
+    SolverStrategy,
+)
 
 
 @view(paths="", name="landing")
@@ -39,47 +56,70 @@ class ResourcesView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         max_empty_km = self.request.session.get("max_empty_km")
-        planning_set = PlanningService().get_planning_set()
-
-        plannings_without_routes = planning_set.plannings.filter(route__isnull=True)
-        plannings_without_routes_exist = plannings_without_routes.exists()
-        print("plannings_without_routes_exist", plannings_without_routes_exist)
-
-        if self.request.session.get("routes_to_be_requested"):
-            print("routes_to_be_requested", self.request.session.get("routes_to_be_requested"))
-            if not plannings_without_routes_exist:
-                del self.request.session["routes_to_be_requested"]
-            else:
-                all_routes_fetched = self.fetch_remaining_routes(plannings_without_routes)
-                if all_routes_fetched:
-                    del self.request.session["routes_to_be_requested"]
-                else:
-                    context["routes_to_be_requested"] = True
-
-        elif plannings_without_routes_exist:
-            context["routes_to_be_requested"] = True
-            self.request.session["routes_to_be_requested"] = True
-
+        # Snapshot and fragments are cached per planning version, read once so they all match
+        planning_version = planning_cache.version
+        planning_set = PlanningService().get_cached_planning_set(version=planning_version)
+
+        plannings_without_routes = [planning for planning in planning_set.plannings if planning.route_id is None]
+
+        # Optimisation and route backfill run as background jobs, the page polls the job until it is finished
+        job = JobService().get_job(self.request.session.get("job_id"))
+        if job and JobService().is_finished(job):
+            del self.request.session["job_id"]
+            if job.kind == JobKind.APPLY_OPTIMAL_PLANNING.value and job.result:
+                self.request.session["optimisation_result"] = job.result
+            if job.status == JobStatus.FAILED.value:
+                context["failed_job"] = job
+        elif not job and plannings_without_routes:
+            job = JobService().enqueue(JobKind.FETCH_ROUTES)
+            self.request.session["job_id"] = str(job.id)
+
+        context["job"] = job if job and not JobService().is_finished(job) else None
         context["planning_set"] = planning_set
-        context["planning_polylines"] = PlanningService().get_planning_polylines(planning_set)
-        context["center_coordinate"] = PlanningService().get_center_coordinate(planning_set)
-        context["optimise_planning_form"] = OptimisePlanningForm(initial={"max_empty_km": max_empty_km})
+        context["map_extent"] = planning_cache.get_or_set(
+            "map_extent", lambda: PlanningService().get_map_extent(planning_set), version=planning_version
+        )
+        context["planning_version"] = planning_version
+        context["planning_cache_timeout"] = planning_cache.timeout
+        context["optimise_planning_form"] = OptimisePlanningForm(
+            initial={
+                "max_empty_km": max_empty_km,
+                "strategy": self.request.session.get("strategy"),
+                "time_budget": self.request.session.get("time_budget"),
+            }
+        )
+        context["optimisation_result"] = self.request.session.get("optimisation_result")
         return context
 
-    @timer()
-    def fetch_remaining_routes(self, plannings_without_routes):
-        count_routes_to_request = len(plannings_without_routes)
-        max_routes_to_be_requested = 10
-        routes_fetched = 0
-
-        for i in range(count_routes_to_request):
-            if i < max_routes_to_be_requested:
-                PlanningService().request_route(planning=plannings_without_routes[i])
-                routes_fetched += 1
 
-        print(f"Routes fetched: {routes_fetched}/{count_routes_to_request}")
-        all_fetched = routes_fetched == count_routes_to_request
-        return all_fetched
+@view(paths="routes_geojson", name="routes_geojson")
+class RoutesGeoJSONView(View):
+    # Planned route geometry for the map, fetched separately from the page so the browser can revalidate it
+    # with If-None-Match / If-Modified-Since instead of downloading it with every render
+    def get(self, request, *args, **kwargs):
+        try:
+            # Map zoom levels are fractional while zooming
+            zoom = round(float(self.request.GET.get("zoom", PlanningService.DEFAULT_MAP_ZOOM)))
+            bbox = tuple(map(float, self.request.GET["bbox"].split(","))) if self.request.GET.get("bbox") else None
+        except (ValueError, OverflowError):
+            return HttpResponseBadRequest("Invalid zoom or bbox")
+        if bbox is not None and len(bbox) != 4:
+            return HttpResponseBadRequest("The bbox needs west,south,east,north")
+        level = simplification.get_level(zoom)
+
+        routes = PlanningService().get_planned_routes(bbox=bbox)
+        etag = quote_etag(PlanningService().get_routes_etag(routes, level))
+        created_ats = [route.created_at for route in routes if route.created_at]
+        last_modified = max(created_ats).timestamp() if created_ats else None
+        if response := get_conditional_response(self.request, etag=etag, last_modified=last_modified):
+            return response
+
+        response = JsonResponse(PlanningService().get_routes_geojson(routes, level))
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+        return response
 
 
 @view(paths="apply_planning", name="apply_planning")
@@ -117,6 +157,12 @@ class LocationSearchView(FormView):
         return render(self.request, "location_search_results.html", {"search_results": search_results})
 
 
+@view(paths="geocoding_cache_stats", name="geocoding_cache_stats")
+class GeocodingCacheStatsView(View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(geocoding_cache.stats)
+
+
 @view(paths="location_search_result_select", name="location_search_result_select")
 class LocationSearchResultSelectView(View):
     def post(self, request, *args, **kwargs):
@@ -158,6 +204,7 @@ class DeleteEntityView(FormView):
                 Shipment.objects.filter(id=form.cleaned_data["id"]).delete()
             case EntityType.TRANSPORT:
                 Transport.objects.filter(id=form.cleaned_data["id"]).delete()
+        planning_cache.invalidate_on_commit()
 
         return redirect("resources")
 
@@ -166,13 +213,36 @@ class DeleteEntityView(FormView):
 class ApplyOptimisedPlanningView(View):
     @timer()
     def post(self, request, *args, **kwargs):
-        max_empty_km = self.request.POST.get("max_empty_km")
+        form = OptimisePlanningForm(self.request.POST)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+        max_empty_km = form.cleaned_data["max_empty_km"]
+        strategy = SolverStrategy(form.cleaned_data["strategy"] or SolverStrategy.EXACT.value)
+        time_budget = form.cleaned_data["time_budget"]
         self.request.session["max_empty_km"] = max_empty_km
-        self.request.session["apply_optimised_planning"] = True
-        PlanningService().apply_optimal_planning(max_empty_km=max_empty_km)
+        self.request.session["strategy"] = strategy.value
+        self.request.session["time_budget"] = time_budget
+        # The incremental planner keeps an exact assignment between runs, the fast paths always start over
+        job = JobService().enqueue(
+            JobKind.APPLY_OPTIMAL_PLANNING,
+            max_empty_km=max_empty_km,
+            strategy=strategy.value,
+            time_budget=time_budget,
+            incremental=strategy == SolverStrategy.EXACT,
+        )
+        self.request.session["job_id"] = str(job.id)
         return redirect("resources")
 
 
+@view(paths="job_status", name="job_status")
+class JobStatusView(View):
+    def get(self, request, *args, **kwargs):
+        job = JobService().get_job(self.request.GET.get("job_id"))
+        # A job that no longer exists is done as far as the polling page is concerned
+        context = {"job": job, "is_finished": job is None or JobService().is_finished(job)}
+        return render(self.request, "job_status.html", context)
+
+
 @view(paths="request_route", name="request_route")
 class RequestRouteView(View):
     @timer()
@@ -182,6 +252,29 @@ class RequestRouteView(View):
         return redirect("resources")
 
 
+@view(paths="nearest_shipments", name="nearest_shipments")
+class NearestShipmentsView(View):
+    def get(self, request, *args, **kwargs):
+        try:
+            transport = Transport.objects.select_related("location").get(id=self.request.GET["transport_id"])
+        except (KeyError, ValidationError, Transport.DoesNotExist):
+            return HttpResponseBadRequest("Unknown transport")
+        try:
+            radius_km = float(self.request.GET["radius_km"]) if self.request.GET.get("radius_km") else None
+            k = int(self.request.GET.get("k", 5))
+        except ValueError:
+            radius_km, k = math.nan, -1
+        if k < 0 or (radius_km is not None and not 0 <= radius_km < math.inf):
+            return HttpResponseBadRequest("radius_km and k must be non-negative numbers")
+
+        if radius_km is not None:
+            shipments = PlanningService().get_unplanned_shipments_within(transport, radius_km=radius_km)
+        else:
+            shipments = PlanningService().get_nearest_unplanned_shipments(transport, k=k)
+        context = {"title": f"Nearest shipments to {transport.name}", "items": shipments, "item_type": "shipment"}
+        return render(self.request, "planning_sub_table.html", context)
+
+
 @view(paths="data_import", name="data_import")
 class DataImportView(FormView):
     template_name = "data_import.html"
@@ -191,16 +284,22 @@ class DataImportView(FormView):
 @view(paths="data_import_parse", name="data_import_parse")
 class DataImportParseView(View):
     def post(self, request, *args, **kwargs):
-        spreadsheet_content = self.request.POST["spreadsheet_content"]
-        dataframe = DataImportService().parse_spreadsheet(spreadsheet_content)
-        return render(self.request, "data_import_parse.html", {"df": dataframe})
+        upload = DataImportService().store_upload(self.request.POST["spreadsheet_content"])
+        return render(self.request, "data_import_parse.html", {"upload": upload})
 
 
 @view(paths="data_import_apply", name="data_import_apply")
 class DataImportApplyView(View):
     def post(self, request, *args, **kwargs):
         data = json.loads(self.request.POST["data"])
-        dataframe = DataImportService().parse_spreadsheet(data["spreadsheet_content"])
+        data_import_service = DataImportService()
+        chunks = data_import_service.load_upload(data.get("upload_token"))
+        if chunks is None:
+            return HttpResponseBadRequest("The upload has expired, paste the spreadsheet again")
+        try:
+            page = max(int(data.get("page", 0)), 0)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid page")
 
         # TODO Refactor this to use Enums
         LOCATION = "location"
@@ -215,21 +314,56 @@ class DataImportApplyView(View):
             elif value == NAME:
                 name_columns.append(key.split("_")[0])
 
-        results = []
-        # iterate over rows, and create location_text and name_text, based on the columns selected
-        for index, row in dataframe.iterrows():
-            name_text = " ".join(str(row[column]) for column in name_columns)
-            location_text = ", ".join(str(row[column]) for column in location_columns)
-            geo_search = GeoService().search(location_text)
-            results.append(DataImportParsingOptions(location=location_text, name=name_text, options=geo_search))
+        rows, has_more = data_import_service.map_page(chunks, name_columns, location_columns, page)
+        geo_searches = GeoService().search_many([location_text for _, location_text in rows])
+        results = [
+            DataImportParsingOptions(location=location_text, name=name_text, options=geo_searches[location_text])
+            for name_text, location_text in rows
+        ]
 
-        return render(self.request, "data_import_parsed_items.html", {"results": results})
+        context = {"results": results, "page": page}
+        if has_more:
+            context["next_data"] = json.dumps({**data, "page": page + 1})
+        return render(self.request, "data_import_parsed_items.html", context)
 
 
 @view(paths="data_import_create_entity", name="data_import_create_entity")
 class DataImportCreateEntityView(View):
     def post(self, request, *args, **kwargs):
-        Shipment.objects.create(
-            location=Location.objects.get(id=self.request.POST["location"]), name=self.request.POST["name"]
-        )
+        try:
+            location = Location.objects.get(id=self.request.POST["location"])
+        except (KeyError, ValidationError, Location.DoesNotExist):
+            return HttpResponseBadRequest("No location selected")
+        Shipment.objects.create(location=location, name=self.request.POST.get("name", ""))
         return render(self.request, "data_import_entity_saved.html")
+
+
+@view(paths="data_import_create_entities", name="data_import_create_entities")
+class DataImportCreateEntitiesView(View):
+    def post(self, request, *args, **kwargs):
+        try:
+            items = json.loads(self.request.POST["records"])
+        except (KeyError, json.JSONDecodeError):
+            return HttpResponseBadRequest("Malformed records")
+        if not isinstance(items, list):
+            return HttpResponseBadRequest("Malformed records")
+
+        # Rows without geocoding options have no location, they are skipped instead of failing the whole batch
+        records = [
+            EntityRecord(
+                entity_type=item.get("entity_type", EntityType.SHIPMENT.value),
+                name=item.get("name", ""),
+                location_id=item["location"],
+            )
+            for item in items
+            if isinstance(item, dict) and item.get("location")
+        ]
+        try:
+            created = PlanningService().create_entities_bulk(records)
+        except (ValueError, ValidationError) as e:
+            return HttpResponseBadRequest(str(e))
+
+        message = f"Created {len(created)}"
+        if skipped := len(items) - len(records):
+            message += f", skipped {skipped} without a location"
+        return render(self.request, "data_import_entity_saved.html", {"message": message})
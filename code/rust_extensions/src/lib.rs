@@ -1,20 +1,142 @@
+use numpy::ndarray::{Array2, ArrayView2};
+use numpy::{IntoPyArray, PyArray1, PyArray2, PyReadonlyArray2};
+use pyo3::exceptions::{PyRuntimeError, PyValueError};
 use pyo3::prelude::*;
+use rayon::prelude::*;
 
-#[pyfunction]
-fn calculate_distance(lat1: f64, lon1: f64, lat2: f64, lon2: f64) -> f64 {
-    // Haversine formula implementation for distance calculation
-    const R: f64 = 6371.0; // Earth radius in kilometers
+const EARTH_RADIUS_KM: f64 = 6371.0;
+
+fn haversine(lat1: f64, lon1: f64, lat2: f64, lon2: f64) -> f64 {
+    // Haversine formula implementation for distance calculation, in degrees
     let d_lat = (lat2 - lat1).to_radians();
     let d_lon = (lon2 - lon1).to_radians();
     let a = (d_lat / 2.0).sin() * (d_lat / 2.0).sin()
         + lat1.to_radians().cos() * lat2.to_radians().cos() * (d_lon / 2.0).sin() * (d_lon / 2.0).sin();
     let c = 2.0 * a.sqrt().atan2((1.0 - a).sqrt());
-    R * c
+    EARTH_RADIUS_KM * c
+}
+
+// A coordinate converted once, so the inner loops only do the trigonometry that depends on both points
+#[derive(Clone, Copy)]
+struct Point {
+    lat: f64,
+    lon: f64,
+    cos_lat: f64,
+}
+
+impl Point {
+    fn new(latitude: f64, longitude: f64) -> Self {
+        let lat = latitude.to_radians();
+        Point { lat, lon: longitude.to_radians(), cos_lat: lat.cos() }
+    }
+
+    fn distance_to(&self, other: &Point) -> f64 {
+        let sin_d_lat = ((other.lat - self.lat) / 2.0).sin();
+        let sin_d_lon = ((other.lon - self.lon) / 2.0).sin();
+        let a = sin_d_lat * sin_d_lat + self.cos_lat * other.cos_lat * sin_d_lon * sin_d_lon;
+        2.0 * EARTH_RADIUS_KM * a.sqrt().atan2((1.0 - a).sqrt())
+    }
+}
+
+fn to_points(coordinates: ArrayView2<f64>) -> PyResult<Vec<Point>> {
+    if coordinates.ncols() != 2 {
+        return Err(PyValueError::new_err("coordinates must have shape (n, 2) of [latitude, longitude]"));
+    }
+    Ok(coordinates.outer_iter().map(|row| Point::new(row[0], row[1])).collect())
+}
+
+fn run_in_pool<T: Send>(threads: Option<usize>, work: impl FnOnce() -> T + Send) -> PyResult<T> {
+    // Rayon's global pool uses every core, a thread count runs the work in a pool of that size instead
+    match threads {
+        None => Ok(work()),
+        Some(threads) => rayon::ThreadPoolBuilder::new()
+            .num_threads(threads)
+            .build()
+            .map(|pool| pool.install(work))
+            .map_err(|e| PyRuntimeError::new_err(e.to_string())),
+    }
+}
+
+#[pyfunction]
+fn calculate_distance(lat1: f64, lon1: f64, lat2: f64, lon2: f64) -> f64 {
+    haversine(lat1, lon1, lat2, lon2)
+}
+
+/// Great-circle km from every origin to every destination as an (N, M) float64 array, in one call.
+/// origins (N, 2) and destinations (M, 2) are float64 arrays of [latitude, longitude] degrees.
+/// Rows are computed in parallel with the GIL released.
+#[pyfunction]
+#[pyo3(signature = (origins, destinations, threads=None))]
+fn distance_matrix<'py>(
+    py: Python<'py>,
+    origins: PyReadonlyArray2<'py, f64>,
+    destinations: PyReadonlyArray2<'py, f64>,
+    threads: Option<usize>,
+) -> PyResult<&'py PyArray2<f64>> {
+    let origins = to_points(origins.as_array())?;
+    let destinations = to_points(destinations.as_array())?;
+    let (n, m) = (origins.len(), destinations.len());
+
+    let distances = py.allow_threads(|| {
+        run_in_pool(threads, || {
+            let mut distances = vec![0.0; n * m];
+            if m > 0 {
+                distances.par_chunks_mut(m).zip(origins.par_iter()).for_each(|(row, origin)| {
+                    for (distance, destination) in row.iter_mut().zip(destinations.iter()) {
+                        *distance = origin.distance_to(destination);
+                    }
+                });
+            }
+            distances
+        })
+    })?;
+
+    let distances = Array2::from_shape_vec((n, m), distances).map_err(|e| PyValueError::new_err(e.to_string()))?;
+    Ok(distances.into_pyarray(py))
+}
+
+/// Great-circle km from each origin to the destination in the same row, as an (N,) float64 array.
+#[pyfunction]
+#[pyo3(signature = (origins, destinations, threads=None))]
+fn distance_pairs<'py>(
+    py: Python<'py>,
+    origins: PyReadonlyArray2<'py, f64>,
+    destinations: PyReadonlyArray2<'py, f64>,
+    threads: Option<usize>,
+) -> PyResult<&'py PyArray1<f64>> {
+    let origins = to_points(origins.as_array())?;
+    let destinations = to_points(destinations.as_array())?;
+    if origins.len() != destinations.len() {
+        return Err(PyValueError::new_err("origins and destinations must have the same length"));
+    }
+
+    let distances: Vec<f64> = py.allow_threads(|| {
+        run_in_pool(threads, || {
+            origins.par_iter().zip(destinations.par_iter()).map(|(a, b)| a.distance_to(b)).collect()
+        })
+    })?;
+    Ok(distances.into_pyarray(py))
 }
 
 /// A Python module implemented in Rust.
 #[pymodule]
 fn rust_extensions(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(calculate_distance, m)?)?;
+    m.add_function(wrap_pyfunction!(distance_matrix, m)?)?;
+    m.add_function(wrap_pyfunction!(distance_pairs, m)?)?;
     Ok(())
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn point_distance_matches_haversine() {
+        let (new_york, los_angeles) = (Point::new(40.7128, -74.0060), Point::new(34.0522, -118.2437));
+        let distance = new_york.distance_to(&los_angeles);
+        assert_eq!(distance.round(), 3936.0);
+        assert!((distance - haversine(40.7128, -74.0060, 34.0522, -118.2437)).abs() < 1e-9);
+        assert_eq!(new_york.distance_to(&new_york), 0.0);
+    }
+}
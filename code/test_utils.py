@@ -1,5 +1,5 @@
 import time
-from utils import timer
+from utils import RateLimiter, timer
 
 
 class TestTimerDecorator:
@@ -15,3 +15,14 @@ class TestTimerDecorator:
         printed_output = captured.out.strip()
 
         assert "elapsed:" in printed_output
+
+
+class TestRateLimiter:
+    def test_wait(self):
+        rate_limiter = RateLimiter(calls_per_second=20)
+
+        start_time = time.monotonic()
+        for _ in range(3):
+            rate_limiter.wait()
+
+        assert time.monotonic() - start_time >= 0.1
@@ -1,4 +1,5 @@
 import functools
+import threading
 import time
 from django_view_decorator.apps import ViewRegistry
 from django.test import RequestFactory
@@ -46,9 +47,9 @@ def get_view_path(view):
                 return k2
 
 
-def make_request_get(view):
+def make_request_get(view, data: dict = None):
     url = get_view_path(view)
-    request = RequestFactory().get(url)
+    request = RequestFactory().get(url, data=data)
     return view(request)
 
 
@@ -61,3 +62,18 @@ def make_request_post(view, data: dict):
 def is_pytest() -> bool:
     result = "PYTEST_CURRENT_TEST" in os.environ
     return result
+
+
+class RateLimiter:
+    # Spaces calls at least 1 / calls_per_second apart, shared by all threads that call wait()
+    def __init__(self, calls_per_second: float):
+        self.interval = 1 / calls_per_second
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            call_at = max(self.next_call, now)
+            self.next_call = call_at + self.interval
+        time.sleep(call_at - now)